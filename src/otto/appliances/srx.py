@@ -5,7 +5,9 @@ import os
 import re
 import logging
 from time import sleep
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, namedtuple
+
+from otto.lib.contextmanagers import expertmode
 
 instance = os.environ.get('instance') or ''
 logger = logging.getLogger('otto' + instance + '.appliances')
@@ -13,11 +15,119 @@ logger.addHandler(logging.NullHandler())
 
 from otto.connections.cec import Cec
 from otto.connections.ssh_pexpect import Ssh
-from otto.lib.otypes import ReturnCode, ApplianceError, ApplianceUsage, AoEAddress, Namespace, Drive
-from otto.utils import aoetostr, now, timefmt, since
+from otto.lib.otypes import ReturnCode, ApplianceError, ApplianceUsage, AoEAddress, Namespace, Drive, LunTopology
+from otto.utils import aoetostr, now, timefmt, since, split_marked
 from otto.lib.pexpect import TIMEOUT, EOF
 
 
+class Snapshot(namedtuple('Snapshot', ['time', 'luns', 'drives', 'spares', 'when', 'cmlist', 'fcstat', 'mask'])):
+    """
+    The state of an SRX at one point in time as returned by Srx.snapshot.
+    Each field holds what the Srx property of the same name returns ('drives'
+    is the drive state table of the 'drives' command).  A field the release
+    has no command for, cmlist on SRX 7, is None.  Because the field
+    names match, a snapshot can stand in for the Srx in lookups like::
+
+        snap.list.get(lun)
+        snap.when.get(lun)
+
+    Use diff to compare it with an earlier snapshot.
+    """
+    __slots__ = ()
+
+    @property
+    def list(self):
+        return self.luns
+
+    @property
+    def roles(self):
+        """
+        Returns a dictionary of the role of each drive: a lun element
+        ('lun.raid.position'), 'spare', 'cache' or '' when unused.
+        """
+        roles = dict((drive, '') for drive in self.drives)
+        for drive, location in self.luns.index['location'].iteritems():
+            roles[drive] = '.'.join(location)
+        for drive in self.spares:
+            roles[drive] = 'spare'
+        for drive in self.fcstat:
+            if drive.count('.'):
+                roles[drive] = 'cache'
+        return roles
+
+    def diff(self, previous):
+        """
+        Returns a dictionary of what changed since the previous snapshot.
+        Each key holds a dictionary of {name: (old, new)}; a value that is not
+        present in one of the snapshots is None.  Only keys with changes are
+        present::
+
+            {'lun_state': {'1': ('initing', 'normal')},
+             'raid_state': {'1.0': ('degraded', 'recovering')},
+             'element_state': {'1.0.2': ('failed', 'replacing')},
+             'roles': {'43.5': ('spare', '1.0.2')},
+             'mask': {'1': ([], ['00100401']])}}
+
+        SRX 6 keeps the state of a lun in its raids and SRX 7 in the lun and
+        its elements, so lun_state and raid_state each only change on one of
+        them.
+        """
+        changes = dict()
+        fields = {'lun_state': lambda l: l.get('state'),
+                  'lun_status': lambda l: l.get('status', l.get('online'))}
+        for name, get in fields.iteritems():
+            c = _changes(dict((k, get(v)) for k, v in previous.luns.iteritems()),
+                         dict((k, get(v)) for k, v in self.luns.iteritems()))
+            if c:
+                changes[name] = c
+        for name, states in (('raid_state', _raid_states), ('element_state', _element_states)):
+            c = _changes(states(previous.luns), states(self.luns))
+            if c:
+                changes[name] = c
+        for name in ('drives', 'roles', 'spares', 'when', 'cmlist', 'fcstat', 'mask'):
+            c = _changes(getattr(previous, name), getattr(self, name))
+            if c:
+                changes[name] = c
+        return changes
+
+
+def _raid_states(luns):
+    """
+    Returns {'lun.raid': state} for every raid that has a state (SRX 6).
+    """
+    d = dict()
+    for num, lun in luns.iteritems():
+        for rnum, raid in enumerate(lun.get('raids', list())):
+            if raid.get('state') is not None:
+                d['%s.%s' % (num, raid.get('number', rnum))] = raid['state']
+    return d
+
+
+def _element_states(luns):
+    """
+    Returns {'lun.raid.position': state} for every lun element.
+    """
+    d = dict()
+    for num, lun in luns.iteritems():
+        for rnum, raid in enumerate(lun.get('raids', list())):
+            for comp in raid.get('components', list()):
+                d['%s.%s.%s' % (num, raid.get('number', rnum), comp['position'])] = comp.get('stat')
+    return d
+
+
+def _changes(old, new):
+    """
+    Returns {key: (old value, new value)} for every key whose value differs.
+    """
+    old = old or dict()
+    new = new or dict()
+    c = dict()
+    for k in set(old).union(new):
+        if old.get(k) != new.get(k):
+            c[k] = (old.get(k), new.get(k))
+    return c
+
+
 class Srx(Cec):
     """
     A class for interacting with the SRX using CEC.
@@ -32,9 +142,27 @@ class Srx(Cec):
         >> print sr.s1.model
         'WD WD6001BKHG-02D22'
 
-    """
+    Setting *batch_inventory* makes Srx.drives collect the per-slot inventory
+    with a single expert mode loop rather than two commands per populated slot.
 
-    def __init__(self, shelf, iface, password=None, prompt=None, use_slots=None, version=None):
+    """
+    #: if True Srx.drives uses Srx.batched_drives on SRX 7 and above.
+    batch_inventory = False
+    _drives_marker = '@@drives'
+    #: seconds a Drive (sr.sNum) keeps its 'drives -j' snapshot, None for the Drive default of none.
+    drive_ttl = None
+    expert_prompt = 'SRX EXPERTMODE#'
+    #: number of nested expert sessions currently open, see Srx.expert_session.
+    expert_depth = 0
+    _run_many_marker = '@@run-many'
+    #: commands that change drive state; running one invalidates the affected Drive snapshots.
+    _drive_mutators = {'setsize', 'fail', 'faildrive', 'unfail', 'replace', 'replacedrive', 'resetdrive',
+                       'spare', 'mkspare', 'rmspare', 'eject', 'ejectlun', 'make', 'mklun', 'jbod', 'mkjbod',
+                       'remove', 'rmlun', 'restore', 'restorelun', 'fcconfig', 'fcadd', 'rmfcache', 'fcremove',
+                       'smartenable', 'smartdisable'}
+
+    def __init__(self, shelf, iface, password=None, prompt=None, use_slots=None, version=None,
+                 batch_inventory=False):
         self.luncomp = re.compile(
             r"^\s*?(?P<size>\d+\.\d+)\s+(?P<element>\d+\.\d+\.\d+)\s+(?P<drive>\d+\.\d+|update|missing)\s+(?P<state>([a-z]+,?)+)(\s+)?(?P<percent>\d+\.\d+%)?")
         self.lunhdr = re.compile(
@@ -50,6 +178,7 @@ class Srx(Cec):
         super(Srx, self).__init__(shelf, iface, password, prompt)
 
         self.use_slots = use_slots  #: a list of slots to restrict operations to.
+        self.batch_inventory = batch_inventory
 
         #: This is set to either 6|7 for backwards compatibile operations
         #: By default we auto negotioate this upon connection.
@@ -85,20 +214,59 @@ class Srx(Cec):
         self.slots = self._enumerate_slots()
 
         for slot in range(int(self.slots)):
-            setattr(self, 's%s' % slot, Drive(self.shelf, slot, self.expert_run))
-
-    def expert_run(self, cmd, expectation=True):
-        if self.version < 7:  # there was no expertmode before 7
-            ret = self.run_and_check(cmd, expectation)
-        else:
-            tprompt = self.prompt
-            self.prompt = 'SRX EXPERTMODE#'
-            self.run('/expertmode')
-            ret = self.run_and_check(cmd, expectation)
-            self.prompt = tprompt
-            self.run('exit')
+            setattr(self, 's%s' % slot, Drive(self.shelf, slot, self.expert_run, ttl=self.drive_ttl))
+
+    def expert_run(self, cmd, expectation=True, timeout=10):
+        """
+        Run a command in EXPERTMODE and check the result.  If an expert_session
+        is active the command runs in it, otherwise expertmode is entered and
+        left around the command.
+        """
+        if self.version < 7 or self.expert_depth:  # there was no expertmode before 7
+            return self.run_and_check(cmd, expectation, timeout=timeout)
+        with expertmode(self):
+            ret = self.run_and_check(cmd, expectation, timeout=timeout)
         return ret
 
+    def expert_session(self):
+        """
+        Returns a context manager that keeps the shelf in EXPERTMODE so that
+        expert_run and run_many calls in its scope skip the '/expertmode' and
+        'exit' prompt cycles::
+
+            with sr.expert_session():
+                for lun in sr.luns:
+                    maps[lun] = sr.diskmap(lun)
+
+        """
+        return expertmode(self)
+
+    def run_many(self, cmds, expectation=True, timeout=10):
+        """
+        Pipeline a list of expert commands in a single command line and return
+        a list of ReturnCodes, one per command, in order.  Each command's
+        output is delimited by an echoed marker.
+
+        Version support: 7
+        """
+        if self.version < 7:
+            return [self.run_and_check(cmd, expectation, timeout=timeout) for cmd in cmds]
+        line = '; '.join(['echo %s %d; %s' % (self._run_many_marker, i, cmd) for i, cmd in enumerate(cmds)])
+        ret = self.expert_run(line, expectation=False, timeout=timeout * max(len(cmds), 1))
+        for cmd in cmds:
+            self._invalidate_drives(cmd)
+        outputs = split_marked(ret.message, self._run_many_marker, self.lineterm)
+        results = list()
+        for i, cmd in enumerate(cmds):
+            result = ReturnCode(True, '\r\n'.join(outputs.get(str(i), list())).strip())
+            if self._failed(result.message):
+                result.status = False
+                if expectation:
+                    logger.error("%s: %s" % (cmd, result.message))
+                    raise ApplianceError("'%s' failed: %s" % (cmd, result.message))
+            results.append(result)
+        return results
+
     @property
     def ipaddress(self):
         """
@@ -158,19 +326,10 @@ class Srx(Cec):
                 result.message = self.run('y')
         else:
             result.message = self.run(cmd, timeout=timeout)
+        self._invalidate_drives(cmd)
         logger.debug("rx:" + result.message)
-        errors = ['error:',
-                  'usage:',
-                  'directory entry not found',
-                  'unrecoverable failure',
-                  'unknown command',
-                  'Update failed',
-                  'No update files found']
-
-        for x in errors:
-            if result.message.count(x):
-                result.status = False
-                break
+        if self._failed(result.message):
+            result.status = False
 
         # result.message = result.message.strip().replace('\r\r\n', '\r\n')
 
@@ -182,6 +341,24 @@ class Srx(Cec):
             raise ApplianceError("'%s' failed: %s" % (cmd, result.message))
         return result
 
+    @staticmethod
+    def _failed(message):
+        """
+        Does the output of a command contain an appliance error?
+        """
+        errors = ['error:',
+                  'usage:',
+                  'directory entry not found',
+                  'unrecoverable failure',
+                  'unknown command',
+                  'Update failed',
+                  'No update files found']
+
+        for x in errors:
+            if message.count(x):
+                return True
+        return False
+
     @property
     def release(self):
         """
@@ -326,7 +503,7 @@ class Srx(Cec):
         for l in c:
             l = l.strip()
             if not len(l):
-                return dict()
+                return LunTopology()
             m = l.split()[0]  # the first token on the line
             dots = m.count(".")
             if not dots:
@@ -392,21 +569,13 @@ class Srx(Cec):
             luns.append(wlun)
         # here I'm punting on rewriting the function to build dicts.
         # this extra conversion will slow otto down a tiny bit
-        ldict = dict()
+        ldict = LunTopology()
         for l in luns:
             num = l.get('lun')
             ldict[num] = l
 
         if self.use_slots:  # do not use slots/show LUNs that are not ours
-            use = set(self.use_slots)
-            for lun in ldict.keys():
-                for raid in ldict[lun]['raids']:
-                    for comp in raid['components']:
-                        if comp['device'].find('.') != -1:
-                            slot = comp['device'].split('.')[1]
-                            if slot not in use:
-                                if ldict.get(lun):
-                                    ldict.pop(lun)
+            ldict = ldict.restrict(self.use_slots)
         return ldict
 
     @property
@@ -457,20 +626,18 @@ class Srx(Cec):
             logger.info("redirected to use 'luns' for 6")
             return self.list
 
-        d = dict()
         r = self.run_and_check('luns -a')
         if not r:
-            return d
+            return LunTopology()
+        return self._parse_luns(r.message)
 
+    def _parse_luns(self, message):
+        """
+        Parse the output of 'luns -a' into the dictionary returned by Srx.luns.
+        """
+        d = dict()
         lun = None
-        # groups correspond to LUN, LABEL, STATUS, TYPE, SIZE, STATE
-        if not hasattr(self, 'lunhdr'):
-            pass
-            # groups correspond to SIZE, ELEMENT, DRIVE, STATE
-        if not hasattr(self, 'luncomp'):
-            pass
-
-        lines = r.message.splitlines()
+        lines = message.splitlines()
         for line in lines:
             line = line.strip()
 
@@ -512,17 +679,10 @@ class Srx(Cec):
                 comp['stat'] = comp['state']
             else:
                 logger.error("lun '%s' parsing fail: '%s'" % (lun, line))
-                # do not use slots/show LUNs that are not ours
+        d = LunTopology(d)
+        # do not use slots/show LUNs that are not ours
         if self.use_slots:
-            use = set(self.use_slots)
-            for lun in d.keys():
-                for raid in d[lun]['raids']:
-                    for comp in raid['components']:
-                        if comp['drive'].find('.') != -1:
-                            slot = comp['drive'].split('.')[1]
-                            if slot not in use:
-                                if d.get(lun):
-                                    d.pop(lun)
+            d = d.restrict(self.use_slots)
         return d
 
     def online(self, lun, expectation=True):
@@ -581,7 +741,11 @@ class Srx(Cec):
         r = self.run_and_check(cmd)
         if not r:
             return d
-        lines = re.split(self.lineterm, r.message)
+        return self._parse_spares(r.message)
+
+    def _parse_spares(self, message):
+        d = dict()
+        lines = re.split(self.lineterm, message)
         for line in lines:
             if not line or line.startswith('DRIVE'):
                 continue
@@ -1018,13 +1182,17 @@ class Srx(Cec):
         The fcstat command displays the drive and it's size
         for each drive whose role is 'cache'.
         """
-        d = dict()
         f = self.expert_run('fcstat')
+        if not f:
+            return dict()
+        return self._parse_fcstat(str(f))
 
+    def _parse_fcstat(self, message):
+        d = dict()
         if self.version >= 7:
-            if f:  # Looks to me like fcstat on ver 7 is passing wrong data
+            if message:  # Looks to me like fcstat on ver 7 is passing wrong data
                 regex = re.compile('(\d+\.\d+)\s+(\d+\.\d+)')
-                for line in re.split(self.lineterm, str(f)):
+                for line in re.split(self.lineterm, message):
                     if not line or line.startswith('DRIVE'):
                         continue
                     m = re.search(regex, line)
@@ -1033,8 +1201,8 @@ class Srx(Cec):
                     drive = m.group(1)
                     d[drive] = {'drive': drive, 'size': m.group(2)}
         else:
-            if f:
-                for line in str(f).split('\n'):
+            if message:
+                for line in message.split('\n'):
                     regExp = re.search('(\d+):\s+(disabled|enabled)', line)
                     if regExp:
                         d[regExp.group(1)] = regExp.group(2)
@@ -1667,15 +1835,64 @@ class Srx(Cec):
              'type': 'sata',
              'version': None}
 
+        If batch_inventory is set (SRX 7 and above) the per-slot 'drives -a' and
+        'drives -c' output is collected with a single expert mode loop instead of
+        two console round trips per populated slot.  See Srx.batched_drives.
+
         """
+        if self.batch_inventory and self.version >= 7:
+            return self.batched_drives
+
         diskd = OrderedDict()
+        for d in self._populated_drives():
+            r = self.run_and_check('drives -a %s' % d)
+            self._parse_drives_a(d, re.split(self.lineterm, r.message.strip()), diskd)
+            ret = self.run_and_check("drives -c %s" % d)
+            self._parse_drives_c(d, ret.message.splitlines(), diskd)
+        self._set_disks(diskd)
+        return diskd
+
+    @property
+    def batched_drives(self):
+        """
+        Returns the same ordered dict as Srx.drives, but gathers the inventory of
+        every populated slot with one 'drives' command and one expert mode loop::
+
+            for(d in 43.0 43.1 ...){echo @@drives a $d; drives -a $d; echo @@drives c $d; drives -c $d}
+
+        The output of each command is delimited by the echoed markers and parsed
+        exactly as the per-slot commands would be.  A slot whose 'drives -a'
+        output is missing is logged and left out.
+
+        Version support: 7
+        """
+        if self.version < 7:
+            raise ApplianceUsage("batched drive inventory requires expert mode (SRX-7.x)")
+        diskd = OrderedDict()
+        dlist = self._populated_drives()
+        if dlist:
+            loop = "for(d in %s){echo %s a $d; drives -a $d; echo %s c $d; drives -c $d}" % \
+                   (' '.join(dlist), self._drives_marker, self._drives_marker)
+            r = self.expert_run(loop, timeout=10 + 2 * len(dlist))
+            sections = split_marked(r.message.strip(), self._drives_marker, self.lineterm)
+            for d in dlist:
+                drives_a = sections.get('a ' + d)
+                if not drives_a:
+                    logger.error("parsing fail: no 'drives -a %s' output in the batched inventory" % d)
+                    continue
+                self._parse_drives_a(d, drives_a, diskd)
+                self._parse_drives_c(d, sections.get('c ' + d, list()), diskd)
+        self._set_disks(diskd)
+        return diskd
+
+    def _populated_drives(self):
+        """
+        Returns a list of the non-missing drives in 'shelf.slot' format
+        filtered by use_slots.
+        """
         dlist = list()
         d = self.run_and_check('drives')
-        ds = re.split(self.lineterm, d.message.strip())
-        for line in ds:
-            if line.startswith('DRIVE'):
-                continue
-            did, dstate = line.split()[:2]
+        for did, dstate in self._parse_drive_states(d.message).iteritems():
             if dstate != 'missing':
                 if self.use_slots:
                     slot = did.split('.')[1]
@@ -1683,54 +1900,68 @@ class Srx(Cec):
                         dlist.append(did)
                 else:
                     dlist.append(did)
+        return dlist
 
-        for d in dlist:
-            r = self.run_and_check('drives -a %s' % d)
-            rs = re.split(self.lineterm, r.message.strip())
-            if not self.driveahdr:
-                self.driveahdr = \
-                    re.compile(r"^(?P<drive>\d+.\d+)\s+"
-                               r"(?P<size>\*?\d+\.\d+)\s+"
-                               r"(?P<role>[0-9+\.0-9+\.0-9+|cache|spare]*?)\s+"
-                               r"(?P<model>[a-zA-Z0-9\s\])\s+"
-                               r"(?P<firmware>[a-zA-Z0-9\.\-]+)\s+"
-                               r"(?P<mode>(sata|sas)\s+\d+.\d+Gb/s)")
+    def _parse_drive_states(self, message):
+        """
+        Parse the output of 'drives' into an ordered dict of state by drive.
+        """
+        states = OrderedDict()
+        for line in re.split(self.lineterm, message.strip()):
+            if not line or line.startswith('DRIVE'):
+                continue
+            flds = line.split()
+            states[flds[0]] = flds[1]
+        return states
 
-            foundheader = False
-            for l in rs:
-                if l.startswith('DRIVE'):
-                    continue
-                disk = d.split('.')[1]
-                if not foundheader:
-                    summary = re.search(self.driveahdr, l)
-                    try:
-                        diskd[disk] = summary.groupdict()
-                    except AttributeError:
-                        raise ApplianceError("regex:\n%s\ndid not match:\n %s" % (self.driveahdr.pattern, l))
-                    foundheader = True
-                    continue
+    def _parse_drives_a(self, d, rs, diskd):
+        """
+        Parse the lines of 'drives -a shelf.slot' into diskd[slot].
+        """
+        if not self.driveahdr:
+            self.driveahdr = \
+                re.compile(r"^(?P<drive>\d+.\d+)\s+"
+                           r"(?P<size>\*?\d+\.\d+)\s+"
+                           r"(?P<role>[0-9+\.0-9+\.0-9+|cache|spare]*?)\s+"
+                           r"(?P<model>[a-zA-Z0-9\s\])\s+"
+                           r"(?P<firmware>[a-zA-Z0-9\.\-]+)\s+"
+                           r"(?P<mode>(sata|sas)\s+\d+.\d+Gb/s)")
+
+        disk = d.split('.')[1]
+        foundheader = False
+        for l in rs:
+            if l.startswith('DRIVE'):
+                continue
+            if not foundheader:
+                summary = re.search(self.driveahdr, l)
                 try:
-                    k, v = l.strip().split(':')
-                except ValueError:
-                    raise ApplianceError("expecting a key:value output, got this: %s" % l.strip())
-                v = v.replace("'", "")
-                diskd[d.split('.')[1]][k] = v.strip()
-                if self.use_slots and d not in self.use_slots:
-                    continue
+                    diskd[disk] = summary.groupdict()
+                except AttributeError:
+                    raise ApplianceError("regex:\n%s\ndid not match:\n %s" % (self.driveahdr.pattern, l))
+                foundheader = True
+                continue
+            try:
+                k, v = l.strip().split(':')
+            except ValueError:
+                raise ApplianceError("expecting a key:value output, got this: %s" % l.strip())
+            v = v.replace("'", "")
+            diskd[disk][k] = v.strip()
 
-            ret = self.run_and_check("drives -c %s" % d)
-            cline = ret.message.splitlines()
-            cline = cline[1].split()
-            if len(cline) > 1:
-                version = cline[1]
-                config = ' '.join(cline[2:])
-                diskd[disk]['version'] = version
-                diskd[disk]['config'] = config
-            else:
-                diskd[disk]['version'] = None
-                diskd[disk]['config'] = None
-        self._set_disks(diskd)
-        return diskd
+    @staticmethod
+    def _parse_drives_c(d, cline, diskd):
+        """
+        Parse the lines of 'drives -c shelf.slot' into diskd[slot].
+        """
+        disk = d.split('.')[1]
+        cline = cline[1].split() if len(cline) > 1 else list()
+        if len(cline) > 1:
+            version = cline[1]
+            config = ' '.join(cline[2:])
+            diskd[disk]['version'] = version
+            diskd[disk]['config'] = config
+        else:
+            diskd[disk]['version'] = None
+            diskd[disk]['config'] = None
 
     @property
     def temp(self):
@@ -2053,14 +2284,17 @@ class Srx(Cec):
             'time':'3:43:15'}
 
         """
+        r = self.run_and_check('when')
+        return self._parse_when(r.message)
+
+    def _parse_when(self, message):
         columns = ['lun', 'percent', 'rate', 'time']
         d = dict()
-        r = self.run_and_check('when')
 
-        if not len(r.message):
+        if not len(message):
             return d
 
-        for line in r.message.splitlines():
+        for line in message.splitlines():
             if self.version >= 7:
                 if not line or line.startswith('LUN'):  # header
                     continue
@@ -2157,13 +2391,15 @@ class Srx(Cec):
         Returns a dictionary with a list of macs per LUN.
 
         """
-        d = dict()
         r = self.run_and_check('mask')
 
         if not r:
-            return d
+            return dict()
+        return self._parse_mask(r.message)
 
-        masks = re.split(self.lineterm, r.message)
+    def _parse_mask(self, message):
+        d = dict()
+        masks = re.split(self.lineterm, message)
         for line in masks:
             if not line or line.startswith('LUN'):
                 continue
@@ -2947,6 +3183,65 @@ class Srx(Cec):
         else:
             raise ApplianceUsage("The 'service' command doesn't exist for SRX 6.x and lower.")
 
+    def _invalidate_drives(self, cmd):
+        """
+        Drop the Drive snapshots of the slots a command may have changed.
+        Arguments that can not be mapped to a slot, eg. lun or lun.raid.element,
+        invalidate every drive in the shelf.
+        """
+        flds = cmd.split()
+        if not flds or not getattr(self, 'slots', None):
+            return
+        verb = flds[0].lstrip('/')
+        if verb == 'echo':
+            slots = re.findall(r"/raiddev/(\d+)/ctl", cmd)
+            if not slots:
+                return
+        elif verb not in self._drive_mutators:
+            return
+        else:
+            slots = list()
+            for arg in flds[1:]:
+                if arg.startswith('-'):
+                    continue
+                m = re.match(r"^(\d+)\.(\d+)(-(\d+))?$", arg)
+                if not m or m.group(1) != str(self.shelf):
+                    slots = range(int(self.slots))
+                    break
+                last = m.group(4) or m.group(2)
+                slots.extend(range(int(m.group(2)), int(last) + 1))
+        for slot in slots:
+            drive = getattr(self, 's%s' % slot, None)
+            if isinstance(drive, Drive):
+                drive.invalidate()
+
+    def snapshot(self):
+        """
+        Returns a Snapshot of the luns, drive states, spares, when, cmlist,
+        fcstat and mask output.  On SRX 7 everything is collected with a single
+        run_many command line; SRX 6 runs each command in turn.  cmlist is None
+        on SRX 7, which has no cmlist command.
+        """
+        if self.version >= 7:
+            cmds = ['luns -a', 'drives', 'spares', 'when', 'fcstat', 'mask']
+            luns, drives, spares, when, fcstat, mask = [r.message for r in self.run_many(cmds)]
+            return Snapshot(time=now(),
+                            luns=self._parse_luns(luns),
+                            drives=self._parse_drive_states(drives),
+                            spares=self._parse_spares(spares),
+                            when=self._parse_when(when),
+                            cmlist=None,
+                            fcstat=self._parse_fcstat(fcstat),
+                            mask=self._parse_mask(mask))
+        return Snapshot(time=now(),
+                        luns=self.list,
+                        drives=self._parse_drive_states(self.run_and_check('drives').message),
+                        spares=self.spares,
+                        when=self.when,
+                        cmlist=self.cmlist or dict(),
+                        fcstat=self.fcstat(),
+                        mask=self.mask)
+
     def _set_disks(self, diskd):
         self.cache['disks'] = diskd
         for slot, data in diskd.iteritems():
@@ -3073,7 +3368,7 @@ class SrxSsh(Ssh, Srx):
         self.slots = self._enumerate_slots()
 
         for slot in range(int(self.slots)):
-            setattr(self, 's%s' % slot, Drive(self.shelf, slot, self.expert_run))
+            setattr(self, 's%s' % slot, Drive(self.shelf, slot, self.expert_run, ttl=self.drive_ttl))
 
         return ret
 
@@ -29,7 +29,8 @@ import time
 
 from otto.connections.ssh_pexpect import Ssh
 from otto.lib.otypes import ApplianceError, ApplianceUsage, ReturnCode, AoEAddress
-from otto.utils import aoetostr, strtoaoe, mkcmdstr
+from otto.utils import aoetostr, strtoaoe, mkcmdstr, split_marked
+from otto.lib.contextmanagers import expertmode
 
 instance = os.environ.get('instance') or ''
 logger = logging.getLogger('otto' + instance + '.appliances')
@@ -48,6 +49,10 @@ class Vsx(Ssh):
         force           (Boolean) if True the method walks through the acceptance dialog
 
     """
+    expert_prompt = 'VSX EXPERTMODE# '
+    #: number of nested expert sessions currently open, see Vsx.expert_session.
+    expert_depth = 0
+    _run_many_marker = '@@run-many'
 
     def __init__(self, user, host, password, prompt=None):
         self.user = user
@@ -108,12 +113,33 @@ class Vsx(Ssh):
         return result
 
     def expert_run(self, cmd):
-        tprompt = self.prompt
-        self.prompt = 'VSX EXPERTMODE# '
-        self.run('/expertmode')
-        self.run(cmd)
-        self.prompt = tprompt
-        self.run('exit')
+        """
+        Run a command in EXPERTMODE and return its output.  If an expert_session
+        is active the command runs in it, otherwise expertmode is entered and
+        left around the command.
+        """
+        if self.expert_depth:
+            return self.run(cmd)
+        with expertmode(self):
+            ret = self.run(cmd)
+        return ret
+
+    def expert_session(self):
+        """
+        Returns a context manager that keeps the vsx in EXPERTMODE so that
+        expert_run and run_many calls in its scope skip the '/expertmode'
+        and 'exit' prompt cycles.
+        """
+        return expertmode(self)
+
+    def run_many(self, cmds):
+        """
+        Pipeline a list of expert commands in a single command line and
+        return a list of their outputs, in order.
+        """
+        line = '; '.join(['echo %s %d; %s' % (self._run_many_marker, i, cmd) for i, cmd in enumerate(cmds)])
+        outputs = split_marked(self.expert_run(line), self._run_many_marker)
+        return ['\r\n'.join(outputs.get(str(i), list())).strip() for i in range(len(cmds))]
 
     @property
     def release(self):
@@ -4,22 +4,46 @@
 import os
 import re
 import logging
+from collections import deque, namedtuple
 from time import sleep
 from exceptions import KeyError
 
+from otto.connections.framed import Framed
 from otto.lib.pexpect import spawn, EOF, TIMEOUT, ExceptionPexpect
 from otto.lib.otypes import ReturnCode, ConnectionError
+from otto.utils import now
 
 instance = os.environ.get('instance') or ''
 logger = logging.getLogger('otto' + instance + '.connections')
 logger.addHandler(logging.NullHandler())
 
+#: An asynchronous appliance message. 'pattern' is the entry of Cec.amsgs that
+#: matched and 'args' the groups it captured.
+AsyncEvent = namedtuple('AsyncEvent', ['time', 'shelf', 'message', 'pattern', 'args'])
 
-class Cec(spawn, object):
+
+class Cec(spawn, Framed):
     """
     Connect via cec.  This spawns a process running the
     installed cec client to interact with an appliance.
+
+    Asynchronous appliance messages (see amsgs) found in the console output
+    are removed from command results.  Those that arrive outside a command's
+    output, before its echo or after it finished, are recorded as AsyncEvents
+    in self.events; inside it they may be old text the command printed.
+    Callbacks can subscribe to them and wait_for_event blocks until one
+    arrives::
+
+        sr.subscribe(lambda ev: logger.info(ev.message), r"recovery complete")
+        sr.wait_for_event(r"building parity complete: 1\.", timeout=3600)
+
+    With framed set run() uses run_framed for commands that need no
+    answers, see otto.connections.framed.
     """
+    #: number of AsyncEvents kept in self.events
+    event_history = 1000
+    status_var = '$status'
+    success = ('',)
 
     def __init__(self, shelf, iface, password=None, prompt=None):
         self.version = None
@@ -52,6 +76,10 @@ class Cec(spawn, object):
             " (disk [0-9]+\.[0-9]+ device [0-9]+\.[0-9]+\.[0-9]+)",
             "[0-9]{,2}\:[0-9]{,2}\s\[rdodin[0-9]\.[0-9]\].*",
         ]
+        self.events = deque(maxlen=self.event_history)
+        self.subscribers = list()
+        self._amsg_key = None
+        self._amsg_re = None
 
     def connect(self, timeout=10, expectation=True):
         """
@@ -137,12 +165,15 @@ class Cec(spawn, object):
         logger.debug("%s\n\twait %d force %d ans %s timeout %d" % (cmd, wait, force, ans, timeout))
         if self.closed:
             raise ConnectionError("Not connected to shelf %s" % self.shelf)
+        if self.framed and wait and not force:
+            return self.run_framed(cmd, timeout).message
         self.sendline(cmd)
 
         if not wait:
             return self.before.strip()  # async messages could appear in here
         try:
             self.expect_exact(cmd, timeout)
+            self._unframed_output(self.before)
         except TIMEOUT:
             r = self.__checkasync(self.before, cmd)
             if not r:
@@ -201,27 +232,18 @@ class Cec(spawn, object):
             self.expect(self.prompt, timeout)
             response = self.before
 
-        ret = response
-        for msg in self.amsgs:
-            match = re.search(r"(%s)(\r\n)*" % msg, response)
-            if not match:
-                continue
-            logger.debug("CHECKASYNC: FOUND MATCH: '%s'" % msg)
-            start = response.find(match.group(1))
-            end = len(match.group(1))
-            if match.lastindex == 3:
-                # include the matched newline
-                end += len(match.group(3))
-
-            # what surrounds the match (hopefully the expected cmd)
-            ret = response[:start] + response[start + end:]
-
-            # the matched async message
-            # aysncmsg = response[start:start + end]
-            break
+        ret, _ = self._strip_async(response)
         ret = ret.strip().replace('\r\r\n', '\r\n')
         return ret
 
+    def _framed_output(self, output):
+        ret, _ = self._strip_async(output)
+        return ret.strip().replace('\r\r\n', '\r\n')
+
+    def _unframed_output(self, output):
+        for match in self._strip_async(output)[1]:
+            self._record_async(match)
+
     def reconnect(self, after=10, timeout=None):
         self.disconnect()
         sleep(after - 1)
@@ -247,6 +269,96 @@ class Cec(spawn, object):
                 # sleep(2)
         return True
 
+    @property
+    def async_pattern(self):
+        """
+        A single compiled pattern matching any of the amsgs; each message is a
+        named group 'mN' where N is its index in amsgs.  It is recompiled only
+        when amsgs changes.
+        """
+        key = tuple(self.amsgs)
+        if key != self._amsg_key:
+            alts = '|'.join(['(?P<m%d>%s)' % (i, msg) for i, msg in enumerate(key)])
+            self._amsg_re = re.compile(r"(?:%s)(?:\r\n)*" % alts)
+            self._amsg_key = key
+        return self._amsg_re
+
+    def _strip_async(self, buf):
+        """
+        Remove every asynchronous message from buf.  Returns the remaining
+        text and the list of matches.
+        """
+        found = list()
+
+        def strip(match):
+            found.append(match)
+            return ''
+
+        ret = self.async_pattern.sub(strip, buf)
+        return ret, found
+
+    def _record_async(self, match):
+        """
+        Queue an AsyncEvent for a match of async_pattern and notify subscribers.
+        """
+        for name, text in match.groupdict().iteritems():
+            if text is not None and name.startswith('m'):
+                index = int(name[1:])
+                break
+        else:
+            return None
+        pattern = self._amsg_key[index]
+        # the message's own groups follow its named group in the alternation
+        first = match.re.groupindex[name]
+        args = match.groups()[first:first + re.compile(pattern).groups]
+        event = AsyncEvent(now(), self.shelf, text.strip(), pattern, args)
+        logger.debug("CHECKASYNC: FOUND MATCH: '%s'" % pattern)
+        self.events.append(event)
+        for regex, callback in list(self.subscribers):
+            if regex is None or regex.search(event.message):
+                try:
+                    callback(event)
+                except Exception as e:
+                    logger.error("async event subscriber %s failed: %s" % (callback, e))
+        return event
+
+    def subscribe(self, callback, pattern=None):
+        """
+        Call callback(event) for every AsyncEvent whose message matches the
+        regular expression pattern (all events if None).  Returns a token for
+        unsubscribe.
+        """
+        token = (re.compile(pattern) if pattern else None, callback)
+        self.subscribers.append(token)
+        return token
+
+    def unsubscribe(self, token):
+        if token in self.subscribers:
+            self.subscribers.remove(token)
+
+    def wait_for_event(self, pattern, timeout=60, since=None):
+        """
+        Wait for an asynchronous message matching the regular expression
+        pattern.  Events already queued at or after 'since' (epoch seconds,
+        any queued event if None) satisfy the wait, otherwise the console is
+        read until one arrives.  Returns a ReturnCode with the event's message,
+        False on timeout.
+        """
+        regex = re.compile(pattern)
+        deadline = now() + timeout
+        while True:
+            for event in list(self.events):
+                if (since is None or event.time >= since) and regex.search(event.message):
+                    return ReturnCode(True, event.message)
+            remaining = deadline - now()
+            if remaining <= 0:
+                return ReturnCode(False, "Timed out : %s seconds waiting for '%s'" % (timeout, pattern))
+            try:
+                self.expect(self.async_pattern, timeout=remaining)
+            except TIMEOUT:
+                continue
+            self._record_async(self.match)
+
     def __checkasync(self, buf, cmd):
         """
         __checkasync checks pexpect buffers for async CEC
@@ -257,40 +369,20 @@ class Cec(spawn, object):
         message is the pexpect buffer.
         """
         logger.debug("CHECKASYNC: '%s'\nbuf:\n'%s'" % (cmd, buf))
-        ret = ""
-        msg = buf
 
-        for msg in self.amsgs:
-            match = re.search(r"(%s)(\r\n)*" % msg, buf)
-            if not match:
-                continue
-            logger.debug("CHECKASYNC: FOUND MATCH: '%s'" % msg)
-            start = buf.find(match.group(1))
-            end = len(match.group(1))
-            if match.lastindex == 3:
-                # include the matched newline
-                end += len(match.group(3))
-
-            # what surrounds the match (hopefully the expected cmd)
-            ret = buf[:start] + buf[start + end:]
-
-            # the matched async message
-            msg = buf[start:start + end]
-            break
-
-        if not ret:
-            # prevent infinite recursion
+        ret, found = self._strip_async(buf)
+        if not found:
             return ReturnCode(False)
 
+        # more than one async msg may be output while pexpect
+        # was waiting for the echo of a cmd, all of them are removed
+        msg = ''.join([m.group(0) for m in found])
         if ret.find(cmd) != -1:
             logger.debug("CHECKASYNC: successfully matched and removed '%s'" % msg)
+            for match in found:
+                self._record_async(match)
             return ReturnCode(True, msg)
 
-        # we have had instances where two async msgs were output while pexpect
-        # was waiting for the echo of a cmd ... recurse to handle any multiples
-        r = self.__checkasync(ret, cmd)
-        if r:
-            return r
         e = "CHECKASYNC: '%s' timed-out, but no asynchronous output found in:\n" \
             "'%s'\nret: '%s'" % (cmd, buf, ret)
         logger.error(e)
@@ -0,0 +1,251 @@
+"""
+Run commands on many hosts at once from a bounded pool of threads.
+
+A Runner takes (host, command) jobs and hands back a Future for each.  At most
+max_workers jobs are connected at the same time, each in a thread rather than
+a process, and the output is kept whole::
+
+    with Runner(max_workers=32) as r:
+        futures = r.run([('node%d' % i, 'root', 'passw0rd') for i in range(200)], 'uname -r')
+        for f in as_completed(futures):
+            print f.host, f.result().message.strip(), f.timing['total']
+
+Hosts are connected with Client(pooled=True) by default, so several commands
+for the same host share one connection (see otto.connections.pool).
+"""
+import logging
+import os
+import threading
+from Queue import Queue, Empty
+from time import time
+
+from otto.connections.ssh import Client
+from otto.lib.otypes import ReturnCode
+
+instance = os.environ.get('instance') or ''
+logger = logging.getLogger('otto' + instance + '.connections')
+logger.addHandler(logging.NullHandler())
+
+
+class Future(object):
+    """
+    The pending result of a command submitted to a Runner.  result() blocks
+    until it is done and returns the ReturnCode of Client.run, or of
+    Client.connect when the host could not be reached.
+    """
+
+    def __init__(self, host, command):
+        self.host = host
+        self.command = command
+        self.submitted = time()
+        self.started = None
+        self.connected = None
+        self.finished = None
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = list()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        state = 'done' if self.done() else 'running' if self.started else 'pending'
+        return '<Future %s %r %s>' % (self.host, self.command, state)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until done or timeout seconds have passed, returns done().
+        """
+        self._done.wait(timeout)
+        return self.done()
+
+    def result(self, timeout=None):
+        """
+        Returns the ReturnCode, re-raising whatever the job raised.  A
+        RuntimeError is raised if it is not done within timeout seconds.
+        """
+        if not self.wait(timeout):
+            raise RuntimeError("%s on %s did not finish in %s seconds" % (self.command, self.host, timeout))
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self.wait(timeout):
+            raise RuntimeError("%s on %s did not finish in %s seconds" % (self.command, self.host, timeout))
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """
+        Call fn(future) when done, straight away if it already is.
+        """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    @property
+    def timing(self):
+        """
+        Seconds spent 'queued' for a worker, in 'connect', in 'run' and in
+        'total' since it was submitted.  Steps not reached are None.
+        """
+        def span(a, b):
+            return b - a if a is not None and b is not None else None
+
+        return {'queued': span(self.submitted, self.started),
+                'connect': span(self.started, self.connected),
+                'run': span(self.connected, self.finished),
+                'total': span(self.submitted, self.finished)}
+
+    def _set(self, result=None, exception=None):
+        self.finished = time()
+        with self._lock:
+            self._result = result
+            self._exception = exception
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, list()
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                logger.error("callback for %r failed: %s" % (self, e))
+
+
+class Runner(object):
+    """
+    A bounded pool of worker threads running commands over ssh.
+
+    :param max_workers: most jobs running at once; worker threads are started as needed
+    :param timeout: seconds each command may run without output, see Client.run
+    :param pooled: share connections through otto.connections.pool
+    :param connect_timeout: seconds to wait for each connection
+    """
+
+    def __init__(self, max_workers=32, timeout=None, pooled=True, connect_timeout=10):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.pooled = pooled
+        self.connect_timeout = connect_timeout
+        self._queue = Queue()
+        self._workers = list()
+        self._idle = 0  # workers waiting for a job nobody has claimed
+        self._backlog = 0  # jobs queued while every worker was busy
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def submit(self, host, user, password, command, port=22):
+        """
+        Queue command for host and return its Future.
+        """
+        if self._shutdown:
+            raise RuntimeError("submit after shutdown")
+        future = Future(host, command)
+        self._queue.put((future, (host, user, password, port)))
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+            elif len(self._workers) < self.max_workers:
+                t = threading.Thread(target=self._work, name='otto-fanout-%d' % len(self._workers))
+                t.daemon = True
+                self._workers.append(t)
+                t.start()
+            else:
+                self._backlog += 1
+        return future
+
+    def run(self, hosts, command):
+        """
+        Run command on every host, given as (host, user, password) or
+        (host, user, password, port), and return the Futures in order.
+        """
+        return [self.submit(h[0], h[1], h[2], command, *h[3:]) for h in hosts]
+
+    def run_many(self, host, user, password, commands, port=22):
+        """
+        Run every command on one host and return the Futures in order.
+        """
+        return [self.submit(host, user, password, cmd, port) for cmd in commands]
+
+    def shutdown(self, wait=True):
+        """
+        Stop the workers once the queued jobs are done.
+        """
+        self._shutdown = True
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    def _work(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=1)
+            except Empty:
+                continue
+            if job is None:
+                return
+            future, (host, user, password, port) = job
+            self._execute(future, host, user, password, port)
+            with self._lock:
+                if self._backlog:
+                    self._backlog -= 1  # straight on to a queued job
+                else:
+                    self._idle += 1
+
+    def _execute(self, future, host, user, password, port):
+        future.started = time()
+        client = Client(host, user, password, port=port, pooled=self.pooled)
+        try:
+            r = client.connect(timeout=self.connect_timeout)
+            future.connected = time()
+            if not r:
+                future._set(ReturnCode(False, "%s: %s" % (host, r.message)))
+                return
+            future._set(client.run(future.command, timeout=self.timeout))
+        except Exception as e:
+            future._set(exception=e)
+        finally:
+            client.disconnect()
+
+
+def wait(futures, timeout=None):
+    """
+    Wait for futures and return (done, not_done) lists, not_done being
+    those still running after timeout seconds.
+    """
+    end = time() + timeout if timeout is not None else None
+    for f in futures:
+        f.wait(None if end is None else max(0, end - time()))
+    done = [f for f in futures if f.done()]
+    return done, [f for f in futures if not f.done()]
+
+
+def as_completed(futures, timeout=None):
+    """
+    Yield futures as they finish.  RuntimeError is raised if they have
+    not all finished within timeout seconds.
+    """
+    finished = Queue()
+    pending = len(futures)
+    for f in futures:
+        f.add_done_callback(finished.put)
+    end = time() + timeout if timeout is not None else None
+    while pending:
+        try:
+            remaining = None if end is None else max(0, end - time())
+            # a bounded get keeps the main thread interruptible on python 2
+            yield finished.get(timeout=remaining if remaining is not None else 3600 * 24 * 365)
+        except Empty:
+            raise RuntimeError("%d of %d futures unfinished after %s seconds" % (pending, len(futures), timeout))
+        pending -= 1
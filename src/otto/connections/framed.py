@@ -0,0 +1,104 @@
+"""
+Sentinel framed command execution for the pexpect based connections.
+
+Instead of waiting for the echo of the command and then the prompt, each
+command is wrapped as::
+
+    echo @@otto''-b-<token>; <cmd>; echo @@otto''-e-<token> <status>
+
+The quotes vanish when the shell runs the echo, so the markers only ever
+appear in the output, never in the echoed command line.  Output is captured
+by searching for the end marker alone, which does not depend on the echo or
+the window size, and several commands can be sent in one line.
+"""
+import logging
+import os
+import re
+from uuid import uuid4
+
+from otto.lib.otypes import ReturnCode, ConnectionError, Data
+
+instance = os.environ.get('instance') or ''
+logger = logging.getLogger('otto' + instance + '.connections')
+logger.addHandler(logging.NullHandler())
+
+
+class Framed(object):
+    """
+    Mixin for spawn based connections adding run_framed and run_pipelined.
+    Setting framed to True makes the class's run() use framing.
+    """
+    #: when True run() frames its commands
+    framed = False
+    #: shell variable holding the last exit status
+    status_var = '$?'
+    #: exit statuses meaning success
+    success = ('0',)
+    _frame_marker = '@@otto'
+
+    def _frames(self, cmds):
+        """
+        Returns the command line running cmds and a list of
+        (begin marker, end marker regex) for each.
+        """
+        token = uuid4().hex[:12]
+        parts = list()
+        frames = list()
+        for i in range(len(cmds)):
+            tag = '%s-%d' % (token, i)
+            parts.append("echo %s''-b-%s; %s; echo %s''-e-%s %s"
+                         % (self._frame_marker, tag, cmds[i], self._frame_marker, tag, self.status_var))
+            frames.append(('%s-b-%s' % (self._frame_marker, tag),
+                           re.compile(r'%s-e-%s ?(\S*)\r*\n' % (re.escape(self._frame_marker), tag))))
+        return '; '.join(parts), frames
+
+    def _framed_output(self, output):
+        """
+        Hook to clean up the output captured between two markers.
+        """
+        return output
+
+    def _unframed_output(self, output):
+        """
+        Hook to look at what was read outside the markers, less the echoed
+        command line: anything printed before a command's begin marker or
+        between its end marker and the prompt.
+        """
+        pass
+
+    def run_pipelined(self, cmds, timeout=10):
+        """
+        Send all cmds in a single line and return a ReturnCode for each, in
+        order.  status is True if the command's exit status is a success;
+        raw.status holds the exit status as the shell printed it.
+        """
+        if getattr(self, 'child_fd', -1) == -1:
+            raise ConnectionError("not connected")
+        line, frames = self._frames(cmds)
+        logger.debug(line)
+        self.sendline(line)
+        results = list()
+        for begin, end in frames:
+            self.expect(end, timeout)
+            out = self.before
+            start = out.rfind(begin)
+            if start == -1:
+                raise ConnectionError("missing %s in %s" % (begin, out))
+            outside = out[:start]
+            echo = outside.find("echo %s''" % self._frame_marker)
+            self._unframed_output(outside if echo == -1 else outside[:echo])
+            out = self._framed_output(out[start + len(begin):].strip())
+            status = self.match.group(1)
+            ret = ReturnCode(status in self.success, out)
+            ret.raw = Data(status, out, str())
+            results.append(ret)
+        # take the prompt that follows so unframed commands stay in step
+        self.expect(self.prompt, timeout)
+        self._unframed_output(self.before)
+        return results
+
+    def run_framed(self, cmd, timeout=10):
+        """
+        Run one command framed by markers and return its ReturnCode.
+        """
+        return self.run_pipelined([cmd], timeout)[0]
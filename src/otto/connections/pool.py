@@ -0,0 +1,198 @@
+"""
+A process wide pool of authenticated paramiko Transports.
+
+Every Client created with pooled=True gets its Transport from here, so the
+objects a test builds against the same host share one TCP connection, key
+exchange and authentication, each opening its own channels on it::
+
+    a = LinuxSsh('root', 'node1', 'passw0rd', pooled=True)
+    b = LinuxSsh('root', 'node1', 'passw0rd', pooled=True)
+    a.connect()     # connects
+    b.connect()     # reuses a's transport
+    b.disconnect()  # releases it, the connection stays up
+    pool.stats      # {'opened': 1, 'reused': 1, ...}
+
+Transports are keyed by (host, port, user).  Pooled transports send
+keepalives, and a transport no client has used for idle seconds is closed.
+A transport found dead is replaced on the next acquire.  After a fork the
+child starts with an empty pool, the parent's transports can not be used
+there.
+"""
+import atexit
+import logging
+import os
+import threading
+from time import time
+
+import paramiko
+
+instance = os.environ.get('instance') or ''
+logger = logging.getLogger('otto' + instance + '.connections')
+logger.addHandler(logging.NullHandler())
+
+
+class _Entry(object):
+    def __init__(self, transport):
+        self.transport = transport
+        self.users = 0
+        self.last_used = time()
+
+
+class _Pending(object):
+    """
+    A connect in progress, for the other acquires of the same key to wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class ConnectionPool(object):
+    """
+    Transports keyed by (host, port, user) with reference counts.
+    """
+
+    def __init__(self, keepalive=30, idle=300):
+        self.keepalive = keepalive
+        self.idle = idle
+        self.stats = {'opened': 0, 'reused': 0, 'evicted': 0}
+        self._entries = dict()
+        self._pending = dict()
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._reaper = None
+        self._wake = threading.Event()
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # the transports' threads did not survive the fork
+            self._entries = dict()
+            self._pending = dict()
+            self._pid = os.getpid()
+            self._reaper = None
+
+    def _connect(self, host, port, user, password, timeout, key_file, compress):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=host, port=port, username=user, password=password,
+                       timeout=timeout, key_filename=key_file, compress=compress)
+        transport = client.get_transport()
+        if self.keepalive:
+            transport.set_keepalive(self.keepalive)
+        return transport
+
+    def acquire(self, host, port, user, password, timeout=10, key_file=None, compress=True):
+        """
+        Returns an active Transport for (host, port, user), connecting if
+        there is none.  Every acquire must be matched by a release.  The
+        exceptions of SSHClient.connect are passed on, to every acquire that
+        was waiting for the same connection too.
+
+        The pool is not locked while connecting, so a slow host only holds
+        up the acquires for that host.
+        """
+        key = (host, port, user)
+        while True:
+            with self._lock:
+                self._check_fork()
+                entry = self._entries.get(key)
+                if entry is not None and entry.transport.is_active():
+                    self.stats['reused'] += 1
+                    entry.users += 1
+                    entry.last_used = time()
+                    return entry.transport
+                pending = self._pending.get(key)
+                if pending is None:
+                    if entry is not None:
+                        logger.debug("pooled connection to %s@%s:%s died, reconnecting" % (user, host, port))
+                    pending = self._pending[key] = _Pending()
+                    break
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+        try:
+            transport = self._connect(host, port, user, password, timeout, key_file, compress)
+        except Exception as e:
+            with self._lock:
+                if self._pending.get(key) is pending:
+                    del self._pending[key]
+            pending.error = e
+            pending.done.set()
+            raise
+        with self._lock:
+            entry = _Entry(transport)
+            entry.users = 1
+            self._entries[key] = entry
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+            self.stats['opened'] += 1
+            self._start_reaper()
+        pending.done.set()
+        return transport
+
+    def release(self, transport):
+        """
+        Give back a Transport from acquire.  It stays open for other clients
+        until it has been idle for self.idle seconds.
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.transport is transport:
+                    entry.users = max(0, entry.users - 1)
+                    entry.last_used = time()
+                    if not transport.is_active():
+                        del self._entries[key]
+                    return
+
+    def evict_idle(self, idle=None):
+        """
+        Close the transports nobody has held for idle seconds, self.idle
+        by default.  Returns how many were closed.
+        """
+        if idle is None:
+            idle = self.idle
+        closed = 0
+        with self._lock:
+            self._check_fork()
+            for key, entry in self._entries.items():
+                if entry.users == 0 and time() - entry.last_used >= idle:
+                    del self._entries[key]
+                    entry.transport.close()
+                    closed += 1
+            self.stats['evicted'] += closed
+        return closed
+
+    def close_all(self):
+        """
+        Close every pooled transport, held or not.
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                entry.transport.close()
+            self._entries = dict()
+        self._wake.set()  # let the reaper see the pool is empty and exit
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _start_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap, name='otto-ssh-pool')
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            self._wake.wait(max(1.0, min(self.idle / 2.0, 60)))
+            self._wake.clear()
+            self.evict_idle()
+            with self._lock:
+                if not self._entries:
+                    self._reaper = None
+                    return
+
+
+#: the process wide pool used by Client(pooled=True)
+pool = ConnectionPool()
+atexit.register(pool.close_all)
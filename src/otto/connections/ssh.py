@@ -4,14 +4,16 @@ Paramiko based ssh module
 """
 import os
 import logging
+import select
 import socket
+import threading
 from time import sleep, time
-from multiprocessing import Process, Value, Array
 
 import paramiko
 
+from otto.connections.pool import pool
 from otto.lib.contextmanagers import ignored
-from otto.lib.otypes import ReturnCode, ConnectionError, Data, Namespace
+from otto.lib.otypes import ReturnCode, ConnectionError, Data, Namespace, _Background
 
 instance = os.environ.get('instance') or ''
 logger = logging.getLogger('otto' + instance + '.connections')
@@ -32,9 +34,23 @@ class Client(paramiko.SSHClient):
 
     Client.environmentals is a dictionary of environment variables to be set.  They can be manipulated
     on the fly with care or using the env context manager, otto.lib.contextmanager.env().
+
+    Client.sftp is a single SFTP session shared by all the file operations.  It is opened on first
+    use, opened again after a reconnect and closed with the connection.  Client.sftp_stats counts
+    the sessions 'opened' and the times one was 'reused'.
+
+    With pooled=True the Transport comes from otto.connections.pool, shared with every other pooled
+    Client for the same host, port and user, and disconnect() hands it back instead of closing it.
+
+    run() logs the host, exit status and duration of each command at DEBUG, for the JSON log (see
+    otto.lib.log.JsonHandler).  The command line itself is only included with log_commands set,
+    since command lines can carry passwords.
     """
+    #: if True run() includes the command line in its DEBUG record
+    log_commands = False
+
     # pylint: disable=R0913,R0921
-    def __init__(self, host, user, password, port=22, compress=True):
+    def __init__(self, host, user, password, port=22, compress=True, pooled=False):
         self.cwd = str()
         self.environmentals = dict()
         self.host = host
@@ -43,9 +59,49 @@ class Client(paramiko.SSHClient):
         self.password = password
         super(Client, self).__init__()
         self.compression = compress
+        self.pooled = pooled
         self.set_log_channel('otto' + instance + '.connections')
         self.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.connected = False
+        self.sftp_stats = {'opened': 0, 'reused': 0}
+        self._sftp = None
+        self._sftp_lock = threading.Lock()
+
+    @property
+    def sftp(self):
+        """
+        The cached SFTPClient, created on first use or when the previous one
+        belongs to a closed connection.
+        """
+        with self._sftp_lock:
+            sftp = self._sftp
+            if sftp is not None and sftp.get_channel().get_transport() is self.get_transport() \
+                    and not sftp.get_channel().closed:
+                self.sftp_stats['reused'] += 1
+                return sftp
+            self._close_sftp()
+            self._sftp = self.open_sftp()
+            self.sftp_stats['opened'] += 1
+            return self._sftp
+
+    def _close_sftp(self):
+        if self._sftp is not None:
+            with ignored(Exception):
+                self._sftp.close()
+            self._sftp = None
+
+    def close(self):
+        """
+        Close the SFTP session and the connection.
+        """
+        with self._sftp_lock:
+            self._close_sftp()
+        if self.pooled:
+            if self._transport is not None:
+                pool.release(self._transport)
+                self._transport = None
+        else:
+            super(Client, self).close()
 
     # pylint: disable=W0221
     def connect(self, timeout=10, key_file=None):
@@ -58,14 +114,20 @@ class Client(paramiko.SSHClient):
 
         # Policy for automatically adding the hostname and new host key to the local HostKeys
         try:
-            # Calling the base class connect method.
-            super(Client, self).connect(hostname=self.host,
-                                        port=self.port,
-                                        username=self.user,
-                                        password=self.password,
-                                        timeout=timeout,
-                                        key_filename=key_file,
-                                        compress=self.compression)
+            if self.pooled:
+                if self._transport is not None:
+                    pool.release(self._transport)
+                self._transport = pool.acquire(self.host, self.port, self.user, self.password,
+                                               timeout=timeout, key_file=key_file, compress=self.compression)
+            else:
+                # Calling the base class connect method.
+                super(Client, self).connect(hostname=self.host,
+                                            port=self.port,
+                                            username=self.user,
+                                            password=self.password,
+                                            timeout=timeout,
+                                            key_filename=key_file,
+                                            compress=self.compression)
 
         except paramiko.BadHostKeyException as e:
             message = "Server's host key could not be verified"
@@ -109,46 +171,149 @@ class Client(paramiko.SSHClient):
         :rtype: ReturnCode
         """
         ret = ReturnCode(False)
-        if not self.connected:
-            raise ConnectionError("Run was called on an unconnected host. Did you check the result of connect()?")
+        start = time()
         try:
-            if self.environmentals:
-                envstring = str()
-                for var, value in self.environmentals.items():
-                    statement = "%s=%s " % (var, value)
-                    envstring += statement
-                cmd = "%s%s" % (envstring, cmd)
-            if self.cwd:
-                cmd = "cd %s && %s" % (self.cwd, cmd)
-            self._log(logging.DEBUG, 'running command: "%s"' % cmd)
-            stdin, stdout, stderr = self.exec_command(command=cmd, timeout=timeout, bufsize=bufsize)
+            stream = self.run_stream(cmd, timeout=timeout, lines=False,
+                                     chunk=bufsize if bufsize > 0 else Stream.chunk)
+            stdout = ''.join(stream)
         except paramiko.SSHException as e:
             err = "Couldn't complete the command: %s" % str(e)
             logger.critical(err)
             ret.message = err
             return ret
-
-        # we must read stderr _before_ stdout
-        # otherwise paramiko losses the stdout data
-        try:
-            ret.raw = Data(ret.raw.status, ret.raw.stdout, stderr.read())
         except socket.timeout:
             ret.message = "Timeout"
             return ret
 
-        status = stdout.channel.recv_exit_status()
-        ret.raw = Data(status, stdout.read(), ret.raw.stderr)
+        ret.raw = Data(stream.status, stdout, stream.stderr)
+        duration = time() - start
+        fields = {'host': self.host, 'duration': duration, 'status': stream.status}
+        if self.log_commands:
+            fields['command'] = cmd
+            logger.debug('%s: "%s" exited %s in %.3fs', self.host, cmd, stream.status, duration, extra=fields)
+        else:
+            logger.debug('%s: command exited %s in %.3fs', self.host, stream.status, duration, extra=fields)
 
-        if status != 0:
+        if stream.status != 0:
             ret.message = ret.raw.stderr
         else:
             ret.status = True
             ret.message = ret.raw.stdout
 
-        stdin.close()
-
         return ret
 
+    def run_stream(self, cmd, timeout=None, lines=True, chunk=None):
+        """
+        Start cmd and return a Stream yielding its stdout as it arrives, one
+        line at a time or, with lines=False, in chunks of up to chunk bytes.
+        stderr is drained at the same time and kept in Stream.stderr.  Once
+        the iteration ends Stream.status holds the exit status::
+
+            stream = init.run_stream('dmesg')
+            with open('dmesg.log', 'w') as f:
+                for line in stream:
+                    f.write(line)
+            if stream.status:
+                print stream.stderr
+
+        stdout is never buffered, so its size is not limited by memory.
+
+        :param timeout: seconds to wait for any output before socket.timeout is raised
+        :type timeout: float
+        :rtype: Stream
+        """
+        if not self.connected:
+            raise ConnectionError("Run was called on an unconnected host. Did you check the result of connect()?")
+        cmd = self._command(cmd)
+        self._log(logging.DEBUG, 'running command: "%s"' % cmd)
+        chan = self.get_transport().open_session(timeout=timeout)
+        chan.exec_command(cmd)
+        return Stream(chan, timeout=timeout, lines=lines, chunk=chunk)
+
+    def _command(self, cmd):
+        """
+        Returns cmd prefixed with the environmentals and cwd.
+        """
+        if self.environmentals:
+            envstring = str()
+            for var, value in self.environmentals.items():
+                statement = "%s=%s " % (var, value)
+                envstring += statement
+            cmd = "%s%s" % (envstring, cmd)
+        if self.cwd:
+            cmd = "cd %s && %s" % (self.cwd, cmd)
+        return cmd
+
+    def run_many(self, cmds, max_parallel=8, timeout=None):
+        """
+        Run cmds concurrently, each on its own channel of the connected transport,
+        with at most max_parallel running at once.  Output of all channels is
+        drained as it arrives.
+
+        :param cmds: commands to run on remote host
+        :type cmds: list
+        :param max_parallel: channels open at the same time, keep this at or below the
+                             server's MaxSessions (10 for OpenSSH)
+        :type max_parallel: int
+        :param timeout: seconds each command may take, a command that exceeds it is
+                        abandoned and its ReturnCode message is "Timeout"
+        :type timeout: float
+        :return: a ReturnCode for each command, in the order of cmds
+        :rtype: list
+        """
+        if not self.connected:
+            raise ConnectionError("run_many was called on an unconnected host. Did you check the result of connect()?")
+        transport = self.get_transport()
+        results = [None] * len(cmds)
+        pending = list(enumerate(cmds))
+        pending.reverse()
+        running = dict()  # channel: (index, deadline, stdout chunks, stderr chunks)
+
+        def finish(chan, ret):
+            results[running.pop(chan)[0]] = ret
+            chan.close()
+
+        while pending or running:
+            while pending and len(running) < max(1, max_parallel):
+                i, cmd = pending.pop()
+                cmd = self._command(cmd)
+                self._log(logging.DEBUG, 'running command: "%s"' % cmd)
+                try:
+                    chan = transport.open_session()
+                    chan.exec_command(cmd)
+                except paramiko.SSHException as e:
+                    err = "Couldn't complete the command: %s" % str(e)
+                    logger.critical(err)
+                    results[i] = ReturnCode(False, err)
+                    continue
+                chan.setblocking(0)
+                running[chan] = (i, time() + timeout if timeout is not None else None, list(), list())
+
+            wait = 1.0
+            deadlines = [d for _, d, _, _ in running.values() if d is not None]
+            if deadlines:
+                wait = max(0.0, min(wait, min(deadlines) - time()))
+            ready, _, _ = select.select(list(running), [], [], wait)
+
+            for chan in ready:
+                _, _, out, err = running[chan]
+                while chan.recv_ready():
+                    out.append(chan.recv(32768))
+                while chan.recv_stderr_ready():
+                    err.append(chan.recv_stderr(32768))
+                if (chan.eof_received or chan.closed) and not chan.recv_ready() and not chan.recv_stderr_ready():
+                    status = chan.recv_exit_status()
+                    ret = ReturnCode(status == 0)
+                    ret.raw = Data(status, ''.join(out), ''.join(err))
+                    ret.message = ret.raw.stdout if ret.status else ret.raw.stderr
+                    finish(chan, ret)
+
+            now = time()
+            for chan, (_, deadline, _, _) in running.items():
+                if deadline is not None and now >= deadline:
+                    finish(chan, ReturnCode(False, "Timeout"))
+        return results
+
     def disconnect(self):
         """
         Disconnect from the host.
@@ -196,7 +361,7 @@ class Client(paramiko.SSHClient):
         path does not exist an exception will be raised unless expectation is False. Works
         in conjunction with the cd context manager.
         """
-        sftp = self.open_sftp()
+        sftp = self.sftp
         if not path:
             path = ""
         try:
@@ -217,7 +382,7 @@ class Client(paramiko.SSHClient):
                 raise ConnectionError("ls %s failed: %s" % (path, e))
 
     def mkdir(self, dirname, mode=511, expectation=True):
-        sftp = self.open_sftp()
+        sftp = self.sftp
 
         try:
             if dirname[0] == '/':
@@ -235,7 +400,7 @@ class Client(paramiko.SSHClient):
         """
         remove a directory named by a string
         """
-        sftp = self.open_sftp()
+        sftp = self.sftp
 
         try:
             if dirname[0] == '/':
@@ -253,7 +418,7 @@ class Client(paramiko.SSHClient):
         """
         remove a file named by a string
         """
-        sftp = self.open_sftp()
+        sftp = self.sftp
 
         try:
 
@@ -272,7 +437,7 @@ class Client(paramiko.SSHClient):
         """
         return a file-like object of fname on the remote
         """
-        sftp = self.open_sftp()
+        sftp = self.sftp
         try:
             ret = sftp.file(fname, mode, bufsize, )
         except IOError as e:
@@ -304,8 +469,7 @@ class Client(paramiko.SSHClient):
         :return:
         :rtype: Namespace
         """
-        sftp = paramiko.SFTPClient.from_transport(self.get_transport())
-        st = sftp.stat(path)
+        st = self.sftp.stat(path)
         dstat = {'size': st.st_size,
                  'uid': st.st_uid,
                  'gid': st.st_gid,
@@ -317,7 +481,75 @@ class Client(paramiko.SSHClient):
         return ret
 
 
-class parallelCmd(object):
+class Stream(object):
+    """
+    The stdout of a command on a channel, see Client.run_stream.  Iterating
+    reads stdout and stderr together, so neither side can fill its window and
+    stall the command.
+    """
+    chunk = 32768
+
+    def __init__(self, channel, timeout=None, lines=True, chunk=None):
+        self.channel = channel
+        self.timeout = timeout
+        self.lines = lines
+        self.chunk = chunk or self.chunk
+        self.status = None
+        self._stderr = list()
+
+    @property
+    def stderr(self):
+        return ''.join(self._stderr)
+
+    @property
+    def done(self):
+        return self.status is not None
+
+    def _chunks(self):
+        chan = self.channel
+        while True:
+            while chan.recv_stderr_ready():
+                self._stderr.append(chan.recv_stderr(self.chunk))
+            if chan.recv_ready():
+                data = chan.recv(self.chunk)
+                if data:
+                    yield data
+                    continue
+            if (chan.eof_received or chan.closed) and not chan.recv_ready() and not chan.recv_stderr_ready():
+                break
+            ready, _, _ = select.select([chan], [], [], self.timeout)
+            if not ready:
+                self.close()
+                raise socket.timeout("no output for %s seconds" % self.timeout)
+        self.status = chan.recv_exit_status()
+        chan.close()
+
+    def __iter__(self):
+        if not self.lines:
+            for data in self._chunks():
+                yield data
+            return
+        pending = list()  # the chunks of an unfinished line
+        for data in self._chunks():
+            end = data.rfind('\n') + 1
+            if not end:
+                pending.append(data)
+                continue
+            pending.append(data[:end])
+            for line in ''.join(pending).split('\n')[:-1]:
+                yield line + '\n'
+            pending = [data[end:]]
+        if ''.join(pending):
+            yield ''.join(pending)
+
+    def close(self):
+        """
+        Abandon the command.
+        """
+        self.channel.close()
+
+
+class parallelCmd(_Background):
     """
     a non-blocking remote command running object ::
 
@@ -336,23 +568,17 @@ class parallelCmd(object):
 
     and try to store the json data as a dict in .dict .
 
+    The command runs in a thread and its output is kept whole.  To run a
+    command on many hosts use otto.connections.fanout.Runner instead.
     """
 
     def __init__(self, user, hostname, password, command, port=22):
-
+        super(parallelCmd, self).__init__()
         self.client = paramiko.SSHClient()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.command = command
         self.time = float()
         self.dict = dict()  # fio output in dict format
-        self.started = False
-
-        # synchonization varaibles
-        self.__status = Value('i')
-        self.__stdout = Array('c', 1000000)  # 1 MB
-        self.__stderr = Array('c', 1000000)  # 1 MB
-
-        self.p = None
         self.user = user
         self.hostname = hostname
         self.password = password
@@ -368,46 +594,19 @@ class parallelCmd(object):
             output += buf
         return output
 
-    def _runcmd(self, status, stdout, stderr):
-        """
-        this private method is executed as a thread
-
-        :type status: c_int representing a bool
-        :type stdout: c_array of char
-        :type stderr: c_array of char
-
-        """
-
-        self.started = True
+    def _work(self):
         start = time()
-        self.client.connect(self.hostname, self.port, self.user, self.password)
-        stdin, sout, serr = self.client.exec_command(self.command)
-        err = serr.read()
-        for i in range(len(err)):
-            stderr[i] = str(err[i])
-
-        # we must read stderr _before_ stdout
-        # otherwise paramiko loses the stdout data
-        status = sout.channel.recv_exit_status()
-        out = sout.read()
-        status += int(status)
-
-        # copy stdout into shared memory
-        for i in range(len(out)):
-            stdout[i] = str(out[i])
-        self.client.close()
-        self.time = time() - start
-
-    @property
-    def done(self):
-        """
-        :return: whether or not the job is complete
-        :rtype: bool
-        """
-        if self.started and not self.p.is_alive():
-            return True
-        else:
-            return False
+        try:
+            self.client.connect(self.hostname, self.port, self.user, self.password)
+            _, sout, _ = self.client.exec_command(self.command)
+            stream = Stream(sout.channel, lines=False)
+            out = ''.join(stream)
+            self._result = Data(stream.status, out, stream.stderr)
+        except (paramiko.SSHException, socket.error) as e:
+            self._result = Data(-1, str(), str(e))
+        finally:
+            self.client.close()
+            self.time = time() - start
 
     @property
     def result(self):
@@ -428,20 +627,7 @@ class parallelCmd(object):
         """
         if not self.done:
             self.wait()
-        else:
-            return Data(self.__status.value, str(self.__stdout.value), str(self.__stderr.value))
-
-    def run(self):
-        """
-        start the job on the remote host
-        """
-        self.p = Process(target=self._runcmd, args=(self.__status, self.__stdout, self.__stderr))
-        self.p.start()
-        while not self.p.is_alive():
-            sleep(.1)
-            logger.debug("slept not started")
-        else:
-            self.started = True
+        return self._result
 
     def wait(self):
         """
@@ -450,11 +636,9 @@ class parallelCmd(object):
         :rtype: dict
         """
         then = time()
-        while not self.done:
-            sleep(.01)
-        else:
-            logger.debug("waited for {:10.4f} sec".format(time() - then))
-        return self.result
+        ret = super(parallelCmd, self).wait()
+        logger.debug("waited for {:10.4f} sec".format(time() - then))
+        return ret
 
 
 class TunnelSocketCreator(paramiko.SSHClient):
@@ -2,6 +2,7 @@ import os
 import logging
 from time import sleep
 
+from otto.connections.framed import Framed
 from otto.lib.otypes import ConnectionError, ReturnCode
 from otto.lib.pexpect import spawn, EOF, TIMEOUT
 from otto.utils import now, since, timefmt
@@ -11,10 +12,12 @@ logger = logging.getLogger('otto' + instance + '.connections')
 logger.addHandler(logging.NullHandler())
 
 
-class Ssh(spawn, object):
+class Ssh(spawn, Framed):
     """
     Connect via ssh.  This spawns a process running the
     installed ssh client to interact with an appliance.
+
+    With framed set run() uses run_framed, see otto.connections.framed.
     """
 
     def __init__(self, user, host, password, prompt, timeout=10):
@@ -98,6 +101,10 @@ class Ssh(spawn, object):
         logger.debug(cmd)
         if not self.connected:
             raise ConnectionError("not connected")
+        if self.framed and wait:
+            response = self.run_framed(cmd, timeout).message
+            logger.debug(response)
+            return response
         # To handle long commands greater than 50 chars long, change winsize
         if len(cmd) >= 50:
             winsize = self.getwinsize()
@@ -312,6 +312,8 @@ class LinuxSsh(Client, Initiator):
         my_linux = LinuxSsh(cfg.lnx_host1)
         my_linux.connect()
 
+    With pooled=True, or 'pooled': True in the dictionary, the connection is shared with other
+    pooled objects for the same host, see otto.connections.pool.
     """
 
     def __init__(self, *args, **kwargs):
@@ -327,7 +329,8 @@ class LinuxSsh(Client, Initiator):
             self.mount_point = kwargs.get('mount')
 
         self.ethdrv = Ethdrv(self.get_ethdrv)
-        super(LinuxSsh, self).__init__(self.hostname, self.user, self.password)
+        super(LinuxSsh, self).__init__(self.hostname, self.user, self.password,
+                                       pooled=kwargs.get('pooled', getattr(self, 'pooled', False)))
         self.os = 'linux'
         self.nsdir = '/proc/ethdrv'
 
@@ -370,7 +373,7 @@ class LinuxSsh(Client, Initiator):
         """
         if not remotepath:
             remotepath = os.path.basename(localpath)
-        sftpsession = self.open_sftp()
+        sftpsession = self.sftp
 
         return sftpsession.put(localpath, remotepath)
 
@@ -382,7 +385,7 @@ class LinuxSsh(Client, Initiator):
         """
         if not localpath:
             localpath = "%s/%s" % (os.getcwd(), os.path.basename(remotepath))
-        sftpsession = self.open_sftp()
+        sftpsession = self.sftp
 
         return sftpsession.get(remotepath, localpath)
 
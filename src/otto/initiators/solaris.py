@@ -737,7 +737,8 @@ class RSFSystem(object):
 
 class SolarisSsh(Client, ZFSSystem, Initiator):
     """
-    A paramiko based solaris client.
+    A paramiko based solaris client.  Pass pooled=True to share the connection with other
+    pooled objects for the same host, see otto.connections.pool.
     """
 
     def __init__(self, *args, **kwargs):
@@ -750,7 +751,8 @@ class SolarisSsh(Client, ZFSSystem, Initiator):
             self.hostname = args[1]
             self.password = args[2]
         self.ethdrv = Ethdrv(self.get_ethdrv)
-        super(SolarisSsh, self).__init__(self.hostname, self.user, self.password)
+        super(SolarisSsh, self).__init__(self.hostname, self.user, self.password,
+                                         pooled=kwargs.get('pooled', getattr(self, 'pooled', False)))
         self.os = 'solaris'
         self.nsdir = '/dev/ethdrv'
 
@@ -781,7 +783,7 @@ class SolarisSsh(Client, ZFSSystem, Initiator):
         """
         Required function for Ethdrv class
         """
-        sftpsession = self.open_sftp()
+        sftpsession = self.sftp
         try:
             fh = sftpsession.open('/dev/ethdrv/%s' % fname, 'r')
             ret = ReturnCode(True)
@@ -835,7 +837,7 @@ class SolarisSsh(Client, ZFSSystem, Initiator):
         """
         if not remotepath:
             remotepath = os.path.basename(localpath)
-        sftpsession = self.open_sftp()
+        sftpsession = self.sftp
         sftpsession.put(localpath, remotepath)
         return
 
@@ -849,7 +851,7 @@ class SolarisSsh(Client, ZFSSystem, Initiator):
         """
         if not localpath:
             localpath = "%s/%s" % (os.getcwd(), os.path.basename(remotepath))
-        sftpsession = self.open_sftp()
+        sftpsession = self.sftp
         sftpsession.get(remotepath, localpath)
         return
 
@@ -21,7 +21,7 @@ def get_elstats(initiator):
         raise (NotImplementedError('%s does not support elstats' % initiator.os))
 
     if isinstance(initiator, otto.connections.ssh.Client):
-        sftpsession = initiator.open_sftp()
+        sftpsession = initiator.sftp
         try:
             fh = sftpsession.open(fname)
 
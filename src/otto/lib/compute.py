@@ -3,6 +3,19 @@
 Basic numerical tools for use without requiring numpy, et. al.
 Uses filter_for decorator from lib.decorators to facilitate direct
 access to data in dictionaries
+
+numpy is used when it can be imported, otherwise the same results come
+from plain Python.  None of the functions change the list they are given.
+
+For samples too many to keep, e.g. every latency of a long soak run, the
+accumulators hold constant memory however much is added::
+
+    w = Welford()
+    p99 = P2Quantile(99)
+    for lat in latencies:
+        w.add(lat)
+        p99.add(lat)
+    w.mean, w.stdev, p99.value
 """
 
 from __future__ import print_function
@@ -10,6 +23,23 @@ import math
 
 from otto.lib.decorators import filter_for
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _sequence(values):
+    """
+    values as something with a length, a generator becomes a list
+    """
+    return values if hasattr(values, '__len__') else list(values)
+
+
+def _check(values):
+    if not len(values):
+        raise ZeroDivisionError("no values")
+
 
 @filter_for
 def getfrom(values):
@@ -24,10 +54,17 @@ def getfrom(values):
 def median(values):
     """
     :param values: a list of numerical values
-    :return: statistical median for a list of values expressed as a float
+    :return: statistical median for a list of values, the middle value
+        itself for an odd number of them, else a float
     """
-    values.sort()
+    _check(values)
     m = len(values) / 2
+    if numpy is not None:
+        a = numpy.asarray(values, dtype=numpy.float64)
+        if len(values) % 2:
+            return values[numpy.argpartition(a, m)[m]]
+        return float(numpy.median(a))
+    values = sorted(values)
 
     if not len(values) % 2:  # not even
         return (values[m - 1] + values[m]) / 2.0  # average the middle two
@@ -41,7 +78,10 @@ def average(values):
     :param values: a list of numerical values
     :return:  average for a list of values expressed as a float
     """
-    return sum(values) * 1.0 / len(values)
+    _check(values)
+    if numpy is not None:
+        return float(numpy.mean(numpy.asarray(values, dtype=numpy.float64)))
+    return math.fsum(values) / len(values)
 
 
 @filter_for
@@ -50,7 +90,11 @@ def variance(values):
     :param values: a list of numerical values
     :return: the variance of a list of values expressed as a float
     """
-    return average(map(lambda x: (x - average(values)) ** 2, values))
+    _check(values)
+    if numpy is not None:
+        return float(numpy.var(numpy.asarray(values, dtype=numpy.float64)))
+    mean = math.fsum(values) / len(values)
+    return math.fsum((x - mean) ** 2 for x in values) / len(values)
 
 
 @filter_for
@@ -60,3 +104,286 @@ def standard_dev(values):
     :return: the variance of a list of values expressed as a float
     """
     return math.sqrt(variance(values))
+
+
+def percentile(values, pct):
+    """
+    :param values: a list of numerical values
+    :param pct: the percentile to compute, 0 - 100
+    :return: the pct-th percentile of the values, interpolated linearly
+             between the closest ranks as numpy.percentile does
+    """
+    return percentiles(values, (pct,))[0]
+
+
+def percentiles(values, pcts=(50, 90, 99)):
+    """
+    :param values: a list of numerical values
+    :param pcts: the percentiles to compute, 0 - 100
+    :return: a list of the percentiles of the values, sorting them only once
+    """
+    values = _sequence(values)
+    if not len(values):
+        raise ValueError("percentile of an empty list")
+    if numpy is not None:
+        return [float(p) for p in numpy.percentile(numpy.asarray(values, dtype=numpy.float64), pcts)]
+    values = sorted(values)
+    result = list()
+    for pct in pcts:
+        k = (len(values) - 1) * pct / 100.0
+        f = int(math.floor(k))
+        c = min(f + 1, len(values) - 1)
+        result.append(values[f] + (values[c] - values[f]) * (k - f))
+    return result
+
+
+def trimmed_mean(values, proportion=0.1):
+    """
+    :param values: a list of numerical values
+    :param proportion: the fraction of the values to cut off each end
+    :return: the mean of what is left, as scipy.stats.trim_mean computes it
+    """
+    values = _sequence(values)
+    _check(values)
+    cut = int(proportion * len(values))
+    if cut * 2 >= len(values):
+        raise ValueError("proportion too big")
+    if numpy is not None:
+        values = numpy.partition(numpy.asarray(values, dtype=numpy.float64), (cut, len(values) - cut - 1))
+        return float(numpy.mean(values[cut:len(values) - cut]))
+    values = sorted(values)
+    return math.fsum(values[cut:len(values) - cut]) / (len(values) - 2 * cut)
+
+
+def _betacf(a, b, x):
+    """
+    continued fraction of the incomplete beta function, Numerical Recipes 6.4
+    """
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        m2 = 2 * m
+        for aa in (m * (b - m) * x / ((a + m2 - 1.0) * (a + m2)),
+                   -(a + m) * (a + b + m) * x / ((a + m2) * (a + m2 + 1.0))):
+            d = 1.0 + aa * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + aa / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-15:
+            break
+    return h
+
+
+def _betai(a, b, x):
+    """
+    the regularized incomplete beta function I_x(a, b)
+    """
+    if x <= 0.0 or x >= 1.0:
+        return max(0.0, min(1.0, x))
+    bt = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return bt * _betacf(a, b, x) / a
+    return 1.0 - bt * _betacf(b, a, 1.0 - x) / b
+
+
+def t_quantile(p, df):
+    """
+    :param p: probability, 0 - 1
+    :param df: degrees of freedom
+    :return: the value Student's t distribution with df degrees of freedom
+             falls below with probability p
+    """
+    if p == 0.5:
+        return 0.0
+    if p < 0.5:
+        return -t_quantile(1.0 - p, df)
+
+    def tail(t):  # P(T > t)
+        return 0.5 * _betai(df / 2.0, 0.5, df / (df + t * t))
+
+    lo, hi = 0.0, 1.0
+    while tail(hi) > 1.0 - p:
+        hi *= 2
+    for _ in range(200):
+        mid = (lo + hi) / 2.0
+        if tail(mid) > 1.0 - p:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo < 1e-12 * hi:
+            break
+    return (lo + hi) / 2.0
+
+
+def confidence_interval(values, confidence=0.95):
+    """
+    :param values: a list of numerical values, at least two
+    :param confidence: the confidence level, 0 - 1
+    :return: (low, high) around the mean from Student's t distribution
+    """
+    if len(values) < 2:
+        raise ValueError("a confidence interval needs two values or more")
+    mean = average(values)
+    sample_dev = math.sqrt(variance(values) * len(values) / (len(values) - 1))
+    half = t_quantile(0.5 + confidence / 2.0, len(values) - 1) * sample_dev / math.sqrt(len(values))
+    return mean - half, mean + half
+
+
+class Welford(object):
+    """
+    A running count, mean, variance, min and max in constant memory, using
+    Welford's update.  update() takes a whole list at once, and two of them
+    can be merged, e.g. one per host::
+
+        w = Welford()
+        w.update(latencies)
+        w.add(12.5)
+        w.mean, w.variance, w.stdev
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def update(self, values):
+        """
+        Add many values, as one batch merged in with numpy
+        """
+        if numpy is None:
+            for x in values:
+                self.add(x)
+            return
+        if hasattr(values, '__len__'):
+            values = numpy.asarray(values, dtype=numpy.float64)
+        else:
+            values = numpy.fromiter(values, numpy.float64)
+        if not len(values):
+            return
+        batch = Welford()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch._m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+
+    def merge(self, other):
+        """
+        Add in everything another Welford has seen (Chan et al.)
+        """
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self._m2, self.min, self.max = \
+                other.count, other.mean, other._m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        """
+        population variance, as variance() computes it
+        """
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def sample_variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+
+class P2Quantile(object):
+    """
+    An estimate of one percentile in constant memory, the P-square algorithm
+    of Jain and Chlamtac: five markers whose heights are adjusted as values
+    arrive.  Up to five values it is exact.
+    """
+
+    def __init__(self, pct):
+        self.p = pct / 100.0
+        self.count = 0
+        self._q = list()  # marker heights
+        self._n = [0, 1, 2, 3, 4]  # marker positions
+        p = self.p
+        self._want = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]  # desired positions
+        self._step = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x):
+        self.count += 1
+        q = self._q
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+        n = self._n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        want = self._want
+        for i in range(5):
+            want[i] += self._step[i]
+        for i in (1, 2, 3):
+            d = want[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                h = self._parabolic(i, d)
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / float(n[i + d] - n[i])
+                q[i] = h
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self._q, self._n
+        return q[i] + d / float(n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / float(n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / float(n[i] - n[i - 1]))
+
+    def update(self, values):
+        for x in values:
+            self.add(x)
+
+    @property
+    def value(self):
+        """
+        the current estimate, None before any value
+        """
+        if not self.count:
+            return None
+        if self.count <= 5:
+            return percentile(self._q, self.p * 100)
+        return self._q[2]
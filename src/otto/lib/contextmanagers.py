@@ -76,3 +76,38 @@ class env:
             self.initiator.environmentals[self.var] = self.oldvalue
         else:
             self.initiator.environmentals.pop(self.var)
+
+
+class expertmode:
+    """
+    This class keeps an appliance in EXPERTMODE for every call in its scope
+    instead of entering and leaving it around each expert_run.  Sessions
+    nest; only the outermost one sends '/expertmode' and 'exit'.
+
+    Ex::
+
+        with expertmode(sr):
+            for lun in sr.luns:
+                print sr.diskmap(lun)
+
+    """
+
+    def __init__(self, appliance):
+        self.appliance = appliance
+        self.prompt = None
+
+    def __enter__(self):
+        a = self.appliance
+        if not a.expert_depth:
+            self.prompt = a.prompt
+            a.prompt = a.expert_prompt
+            a.run('/expertmode')
+        a.expert_depth += 1
+        return a
+
+    def __exit__(self, type, value, traceback):
+        a = self.appliance
+        a.expert_depth -= 1
+        if not a.expert_depth:
+            a.prompt = self.prompt
+            a.run('exit')
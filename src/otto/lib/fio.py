@@ -1,17 +1,19 @@
-import gzip
-from os import environ
+import socket
+import threading
+import zlib
+from os import environ, getpid
 from logging import getLogger, NullHandler
 from pprint import pformat
-from multiprocessing import Process, Value, Array
 from time import sleep
-import cStringIO
 
+import paramiko
 from simplejson import JSONDecodeError, loads
 
 from otto.lib.common import wait_file_exists
 from otto.lib.compute import average, standard_dev, median
 from otto.lib.decorators import wait_until
-from otto.lib.otypes import ReturnCode, InitiatorError, ConnectionError
+from otto.lib.latency import Histogram, PERCENTILES
+from otto.lib.otypes import ReturnCode, InitiatorError, ConnectionError, _Background
 from otto.utils import now
 
 instance = environ.get('instance') or ''
@@ -234,6 +236,9 @@ def calculate_stats(stats):
           'iops': {'average': 1010.1, 'deviation': 10.1, 'median': 1010.0},
           'lat': {'average': 0.2, 'deviation': 0.5, 'median': 0.1}
         }
+
+    The lat figures are of the runs' mean latencies.  For percentiles across
+    runs merge their json+ histograms with otto.lib.latency.Histogram.
     """
 
     iops = list()
@@ -322,6 +327,103 @@ def fio_config(initiator, luns, shelf, tlen=None, mode='rw', size='1G'):
     return args
 
 
+def target_devices(initiator, targets):
+    """
+    Return {target: device} for fio's filename, resolving every target from
+    a single aoestat of the initiator.  InitiatorError lists the targets
+    not found.
+    """
+    if initiator.os == 'solaris':
+        def device(s):
+            return '/dev/rdsk/%sp0' % s['device'] if s.get('device') else None
+    elif initiator.os == 'linux':
+        def device(s):
+            return s.get('path') or ('/dev/%s' % s['file'] if s.get('file') else None)
+    else:
+        raise NotImplementedError("target_devices only supports solaris and linux")
+    stat = initiator.aoestat
+    devices = dict()
+    missing = list()
+    for targ in targets:
+        dev = device(stat[targ]) if targ in stat else None
+        if dev:
+            devices[targ] = dev
+        else:
+            missing.append(targ)
+    if missing:
+        raise InitiatorError('fio lun %s not found' % ', '.join(missing))
+    return devices
+
+
+def _section(name, options):
+    lines = ['[%s]' % name]
+    for key, value in options:
+        if value is True:
+            lines.append(key)
+        elif value is not None and value is not False:
+            lines.append('%s=%s' % (key, value))
+    return '\n'.join(lines) + '\n'
+
+
+def fio_jobfile(initiator, luns, shelf, tlen=None, mode='rw', size='1G', bs='128k', iodepth=64,
+                overrides=None, options=None):
+    """
+    Return the text of a fio job file running fio_config's workload as a
+    [global] section and a section per target, for any number of targets::
+
+        text = fio_jobfile(init, range(200), 91, tlen=60, overrides={5: {'rw': 'randrw', 'rwmixread': 70},
+                                                                    '91.7': {'rate_iops': 500}})
+        path = put_jobfile(init, text)
+        init.run_and_check('fio --output-format=json %s' % path)
+
+    :param luns: lun numbers on shelf, the targets are all resolved in one aoestat
+    :param tlen: seconds to run for, time based, otherwise size is written
+    :param overrides: {lun or 'shelf.lun': {fio option: value}} for single targets,
+                      e.g. iodepth, bs, rw, rwmixread, rate or rate_iops
+    :param options: more [global] options, True for a flag and None to drop one
+    """
+    if tlen is None and not size:
+        raise NotImplementedError("fio needs either time or size")
+    if initiator.os == 'solaris':
+        engine = 'solarisaio'
+    elif initiator.os == 'linux':
+        engine = 'libaio'
+    else:
+        raise NotImplementedError("fio_jobfile only supports solaris and linux")
+    overrides = overrides or dict()
+    targets = ['%s.%s' % (shelf, i) for i in luns]
+    devices = target_devices(initiator, targets)
+
+    settings = [('ioengine', engine), ('iodepth', iodepth), ('bs', bs), ('rw', mode),
+                ('norandommap', True), ('group_reporting', True)]
+    if tlen:
+        settings += [('time_based', True), ('runtime', tlen)]
+    else:
+        settings.append(('size', size))
+    if options:
+        options = dict(options)
+        settings = [(k, options.pop(k)) if k in options else (k, v) for k, v in settings] + sorted(options.items())
+    sections = [_section('global', settings)]
+    for lun, targ in zip(luns, targets):
+        extra = overrides.get(targ) or overrides.get(lun) or overrides.get(str(lun)) or dict()
+        sections.append(_section('e%s' % targ, [('filename', devices[targ])] + sorted(extra.items())))
+    return '\n'.join(sections)
+
+
+def put_jobfile(initiator, text, path=None):
+    """
+    Write a job file to the initiator over sftp and return its path, by
+    default otto-<pid>.fio in the working directory.
+    """
+    path = path or 'otto-%d.fio' % getpid()
+    f = initiator.sftp.open(path, 'w')
+    try:
+        f.write(text)
+    finally:
+        f.close()
+    return path
+
+
 def nofiorunning(initiator):
     """
     Return True if fio is not running
@@ -407,9 +509,17 @@ def fioresult(initiator, check=True, expectation=False):
         raise e
 
     if check:
-        for i in range(len(j['jobs'])):
-            if j['jobs'][i]['error'] != 0:
-                return ReturnCode(False, 'fio[%d] error code: %s' % (i, j['jobs'][i]['error']))
+        return check_jobs(j)
+    return ReturnCode(True, j)
+
+
+def check_jobs(j):
+    """
+    Return ReturnCode(True, j) unless a job in the fio output j has an error.
+    """
+    for i in range(len(j['jobs'])):
+        if j['jobs'][i]['error'] != 0:
+            return ReturnCode(False, 'fio[%d] error code: %s' % (i, j['jobs'][i]['error']))
     return ReturnCode(True, j)
 
 
@@ -426,7 +536,7 @@ def fio_is_running(initiator, expectation=False):
         raise InitiatorError(result.message)
 
 
-class Fio(object):
+class Fio(_Background):
     """
     a nonblocking fio object ::
 
@@ -445,110 +555,82 @@ class Fio(object):
 
     and try to store the json data as a dict in .dict .
 
-    """
+    The job runs in a thread on its own initiator object, so any number of
+    them can run against the same host at once.  fio's gzipped output is
+    inflated as it arrives and kept whole, whatever its size.  With
+    pooled=True the jobs for a host share one connection from
+    otto.connections.pool instead of connecting one each.
 
-    def __init__(self, connection, config, envvars=''):
+    """
 
-        self.p = Process(target=self._runcmd, args=(self.__status, self.__message))
-        self.initiator = type(connection)(connection.user, connection.hostname, connection.password)
+    def __init__(self, connection, config, envvars='', pooled=False):
+        super(Fio, self).__init__()
+        kwargs = {'pooled': True} if pooled else dict()
+        self.initiator = type(connection)(connection.user, connection.hostname, connection.password, **kwargs)
+        self.initiator.port = getattr(connection, 'port', 22)
         self.config = config
         self.envvars = envvars
         self.time = float()
         self.dict = dict()  # fio output in dict format
-        self.started = False
-        self.__status = Value('i')
-        self.__message = Array('c', 10000)
-
-    def _read(self, channelobj):
-        """read until EOF"""
-        buf = channelobj.readline()
-        output = str(buf)
-        while buf:
-            buf = channelobj.readline()
-            output += buf
-        return output
-
-    def _runcmd(self, status, message):
-        """
-        this private method is executed as a thread
+        self.__status = None
+        self.__output = str()
 
-        :type status: c_int representing a bool
-        :type message: c_array of char
-        """
-        r = self.initiator.connect()
-        if not r:
-            logger.critical("connect failed ... enabling paramiko logging")
-            import paramiko
+    @property
+    def thread_name(self):
+        return 'otto-fio-%s' % self.initiator.hostname
 
-            paramiko.common.logging.basicConfig(level=paramiko.common.DEBUG)
+    def _work(self):
+        try:
             r = self.initiator.connect()
             if not r:
-                raise ConnectionError("Failed to connect %s" % r.message)
-
-        monitortime = False
-        if 'runtime' in self.config:
-            config = self.config.split()
-            monitortime = 0
-            for param in config:
-                if 'runtime' in param or 'ramp_time' in param:
-                    monitortime += int(param.split('=')[1])
-            monitortime += 120
-            logger.critical("timeout set to %s" % monitortime)
-        cmd = "%s fio --output-format=json %s | gzip" % (self.envvars, self.config)
-
-        self.started = True
-        start = now()
-
-        try:
-            if monitortime:
-                result = self.initiator.run_and_check(cmd, monitortime)
-            else:
-                result = self.initiator.run_and_check(cmd)
-                try:
-                    logger.critical(pformat("".join(
-                        gzip.GzipFile('', 'r', 0,
-                                      cStringIO.StringIO(result.raw.stdout)).read())))
-                except IOError as e:
-                    logger.critical("couldn't write out result: %s %s", (e, result))
-        except InitiatorError, e:
-            result = ReturnCode(False, message=str(e))
-
-        self.time = now() - start
-
-        status.value = int(result.status)
-        for i in range(len(result.message)):
-            message[i] = str(result.message[i])
-
-        self.initiator.disconnect()
-
-    def wait(self):
-        """
-        This is basicaly join.  It blocks untill the job is done.
-        :return: a dictionary version of the json output
-        :rtype: dict
-        """
-        while not self.done:
-            sleep(.1)
-
-        return self.result
+                logger.critical("connect failed ... enabling paramiko logging")
+                paramiko.common.logging.basicConfig(level=paramiko.common.DEBUG)
+                r = self.initiator.connect()
+                if not r:
+                    self.__status, self.__output = False, "Failed to connect %s" % r.message
+                    return
+
+            monitortime = None
+            if 'runtime' in self.config:
+                config = self.config.split()
+                monitortime = 0
+                for param in config:
+                    if 'runtime' in param or 'ramp_time' in param:
+                        monitortime += int(param.split('=')[1])
+                monitortime += 120
+                logger.critical("timeout set to %s" % monitortime)
+            cmd = "%s fio --output-format=json %s | gzip" % (self.envvars, self.config)
+
+            start = now()
+            try:
+                self.__status, self.__output = self._collect(cmd, monitortime)
+            finally:
+                self.time = now() - start
+        finally:
+            self.initiator.disconnect()
 
-    def run(self):
-        """
-        start the fio job on the remote host
+    def _collect(self, cmd, timeout):
         """
-        self.p.start()
-        self.started = True
+        Run cmd and inflate its gzipped stdout a chunk at a time.
 
-    @property
-    def done(self):
-        """
-        :return: whether or not the job is complete
-        :rtype: bool
+        :return: (exit status as a bool, fio's output or the error)
         """
-        if self.started and not self.p.is_alive():
-            return True
-        else:
-            return False
+        inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)  # expect a gzip header
+        output = list()
+        try:
+            stream = self.initiator.run_stream(cmd, timeout=timeout, lines=False)
+            for data in stream:
+                output.append(inflate.decompress(data))
+            output.append(inflate.flush())
+        except socket.timeout:
+            return False, "Timeout"
+        except (zlib.error, paramiko.SSHException) as e:
+            return False, str(e)
+        output = ''.join(output)
+        # the exit status is gzip's, fio failing shows as no output
+        if stream.status != 0 or not output:
+            return False, stream.stderr or output
+        return True, output
 
     @property
     def result(self):
@@ -558,12 +640,307 @@ class Fio(object):
         """
         if not self.done:
             return ReturnCode(False, message="Not done yet")
-        else:
-            message = str()
+        if self._result is None:
+            message = self.__output
             try:
-                message = "".join(gzip.GzipFile('', 'r', 0, cStringIO.StringIO(self.__message.raw)).read())
                 message = loads(message)
-            except (JSONDecodeError, IOError):
-                message = message
+                self.dict = message
+            except JSONDecodeError:
+                pass
+            self._result = ReturnCode(bool(self.__status), message)
+            self.__output = None  # the decoded copy is all that is kept
+        return self._result
+
+
+class FioMonitor(_Background):
+    """
+    Run fio with --status-interval over a live channel and follow it ::
+
+        m = FioMonitor(init, '--name=a --rw=randread --runtime=60 --filename=/dev/sdb')
+        m.run()
+        while not m.done:
+            sleep(5)
+            print m.series('a', 'read', 'iops')[-1:]
+        m.wait()
+        m.result.message  # the final report, as fioresult returns it
+
+    fio prints a whole json report every interval seconds.  Each one is
+    decoded as it arrives and every job in it is added to .samples, a dict
+    of jobname to a list of::
+
+        {'time': seconds since the epoch,
+         'read': {'iops': 1010.1, 'bw': 900, 'io_bytes': ..., 'total_ios': ..., 'clat': {99.0: 68, ...}},
+         'write': {...}, 'trim': {...}}
+
+    The values are fio's own, averaged since the job started.  clat holds
+    fio's completion latency percentiles in the unit it reports them
+    (usec from clat, nsec from clat_ns on fio 3).  callback, if given, is
+    called with each decoded report as it arrives.  The job is done when
+    its channel reports the exit status.
+
+    """
+
+    thread_name = 'otto-fio-monitor'
+
+    def __init__(self, initiator, config, interval=1, envvars='', callback=None, timeout=None):
+        super(FioMonitor, self).__init__()
+        self.initiator = initiator
+        self.config = config
+        self.interval = interval
+        self.envvars = envvars
+        self.callback = callback
+        self.timeout = timeout
+        self.samples = dict()
+        self.frames = 0
+        self.last = None  # the latest report
+        self.time = float()
+
+    @staticmethod
+    def _sample(t, job):
+        sample = {'time': t}
+        for ddir in ('read', 'write', 'trim'):
+            d = job.get(ddir)
+            if not d:
+                continue
+            clat = d.get('clat_ns') or d.get('clat') or dict()
+            sample[ddir] = {'iops': d.get('iops'), 'bw': d.get('bw'), 'io_bytes': d.get('io_bytes'),
+                            'total_ios': d.get('total_ios'),
+                            'clat': dict((float(k), v) for k, v in clat.get('percentile', dict()).items())}
+        return sample
+
+    def _frame(self, text):
+        try:
+            frame = loads(text)
+        except JSONDecodeError as e:
+            logger.error("undecodable fio status: %s", e)
+            return
+        self.frames += 1
+        self.last = frame
+        if 'timestamp_ms' in frame:
+            t = frame['timestamp_ms'] / 1000.0
+        else:
+            t = frame.get('timestamp') or now()
+        for job in frame.get('jobs', list()):
+            self.samples.setdefault(job['jobname'], list()).append(self._sample(t, job))
+        if self.callback:
+            try:
+                self.callback(frame)
+            except Exception as e:
+                logger.error("fio status callback failed: %s", e)
+
+    def _work(self):
+        cmd = "%s fio --output-format=json --status-interval=%s %s" % (self.envvars, self.interval, self.config)
+        logger.info(cmd)
+        start = now()
+        try:
+            stream = self.initiator.run_stream(cmd, timeout=self.timeout)
+            pending = list()
+            for line in stream:
+                if not pending and not line.startswith('{'):
+                    continue  # fio's warnings go to stdout as well
+                pending.append(line)
+                if line.startswith('}'):  # a report ends with a closing brace in column 0
+                    self._frame(''.join(pending))
+                    pending = list()
+            if stream.status != 0:
+                self._result = ReturnCode(False, 'err: %s' % (stream.stderr or 'fio exited %s' % stream.status))
+            elif self.last is None:
+                self._result = ReturnCode(False, 'err: no output')
+            else:
+                self._result = check_jobs(self.last)
+        except socket.timeout:
+            self._result = ReturnCode(False, 'Timeout')
+        except paramiko.SSHException as e:
+            self._result = ReturnCode(False, str(e))
+        finally:
+            self.time = now() - start
+
+    def series(self, jobname, ddir, key, percentile=None):
+        """
+        The [(time, value), ...] of one number for one job so far, e.g.
+        series('a', 'read', 'iops') or series('a', 'write', 'clat', 99.0).
+        """
+        series = list()
+        for sample in self.samples.get(jobname, list()):
+            if ddir not in sample:
+                continue
+            value = sample[ddir][key]
+            if percentile is not None:
+                value = value.get(float(percentile))
+            series.append((sample['time'], value))
+        return series
+
+
+def merge_bins(*histograms):
+    """
+    Sum fio json+ latency histograms, dicts of bucket value to count as in
+    a job's ['read']['clat_ns']['bins'].
+    """
+    h = Histogram.from_bins(*histograms)
+    return dict(zip((int(v) for v in h.values), (int(c) for c in h.counts)))
 
-            return ReturnCode(bool(self.__status.value), message)
+
+def bins_percentiles(bins, percentiles=PERCENTILES):
+    """
+    Return {percentile: value} from a histogram the way fio computes them:
+    the first bucket at which the running count reaches the percentile.
+    """
+    return Histogram.from_bins(bins).percentiles(percentiles)
+
+
+def summarize(jobs):
+    """
+    Add up a list of fio json+ jobs into::
+
+        {'read': {'iops': ..., 'bw': ..., 'io_bytes': ..., 'total_ios': ...,
+                  'clat': {'mean': ns, 'min': ns, 'max': ns, 'percentile': {99.0: ns, ...}}},
+         'write': {...}, 'trim': {...}}
+
+    iops and bw are summed, the latency figures come from the merged
+    clat_ns histograms so they are exact across jobs rather than averages of
+    each job's percentiles.  See otto.lib.latency for more of them.
+    """
+    report = dict()
+    for ddir in ('read', 'write', 'trim'):
+        stats = [j[ddir] for j in jobs if j.get(ddir)]
+        if not stats:
+            continue
+        h = Histogram.from_bins(*[s.get('clat_ns', dict()).get('bins', dict()) for s in stats])
+        clat = {'percentile': h.percentiles()}
+        if h.total:
+            clat['mean'] = h.mean
+            clat['min'] = h.min
+            clat['max'] = h.max
+        report[ddir] = {'iops': sum(s.get('iops', 0) for s in stats),
+                        'bw': sum(s.get('bw', 0) for s in stats),
+                        'io_bytes': sum(s.get('io_bytes', 0) for s in stats),
+                        'total_ios': sum(s.get('total_ios', 0) for s in stats),
+                        'clat': clat}
+    return report
+
+
+class FioGroup(_Background):
+    """
+    Run fio job files on many initiators, started together ::
+
+        g = FioGroup([(init1, jobfile), (init2, jobfile), (init3, other)])
+        g.run()
+        g.wait()
+        g.result        # ReturnCode, False if any host failed
+        g.hosts         # [{'host': 'init1', 'result': ReturnCode, 'summary': {...}}, ...]
+        g.aggregate     # summarize() over every job on every host
+        g.skew          # seconds between releasing the first and the last host
+
+    An initiator that is not connected fails the group.  The job files, the text of a fio job
+    file each as fio_jobfile builds them, are uploaded over sftp and each host's shell is started
+    waiting on its stdin, all of it in parallel.  Only when every host has
+    reported ready is each of them sent the go that execs fio, so the start
+    skew is a write on each channel rather than a round of connections.  If
+    any host fails to get ready none of them starts.  The job files are
+    removed once the run is over.
+
+    fio writes json+ so the latency histograms can be merged, see summarize.
+    """
+
+    thread_name = 'otto-fio-group'
+
+    def __init__(self, jobs, remote_dir='/tmp', envvars='', timeout=None):
+        super(FioGroup, self).__init__()
+        self.jobs = jobs
+        self.remote_dir = remote_dir
+        self.envvars = envvars
+        self.timeout = timeout
+        self.hosts = [{'host': init.hostname, 'result': None, 'summary': None} for init, _ in jobs]
+        self.aggregate = None
+        self.skew = None
+        self.time = float()
+        self.__streams = [None] * len(jobs)
+        self.__paths = [None] * len(jobs)
+
+    def _prepare(self, i):
+        init, jobfile = self.jobs[i]
+        path = '%s/otto-fio-%d-%d.fio' % (self.remote_dir, getpid(), i)
+        transport = init.get_transport()
+        if transport is None or not transport.is_active():
+            self.hosts[i]['result'] = ReturnCode(False, "%s: not connected" % init.hostname)
+            return
+        try:
+            put_jobfile(init, jobfile, path)
+            self.__paths[i] = path
+            cmd = "echo ready; read go && %s exec fio --output-format=json+ %s" % (self.envvars, path)
+            logger.info(cmd)
+            stream = init.run_stream(cmd, timeout=self.timeout)
+            lines = iter(stream)
+            if next(lines, None) != 'ready\n':
+                raise paramiko.SSHException("no shell: %s" % stream.stderr)
+            self.__streams[i] = (stream, lines)
+        except (IOError, socket.error, paramiko.SSHException, ConnectionError) as e:
+            self.hosts[i]['result'] = ReturnCode(False, "%s: %s" % (init.hostname, e))
+
+    def _collect(self, i):
+        stream, lines = self.__streams[i]
+        try:
+            output = ''.join(lines)
+        except socket.timeout:
+            self.hosts[i]['result'] = ReturnCode(False, 'Timeout')
+            return
+        except paramiko.SSHException as e:
+            self.hosts[i]['result'] = ReturnCode(False, str(e))
+            return
+        if stream.status != 0 or not output:
+            self.hosts[i]['result'] = ReturnCode(False, 'err: %s' % (stream.stderr or 'no output'))
+            return
+        try:
+            j = loads(output)
+        except JSONDecodeError as e:
+            self.hosts[i]['result'] = ReturnCode(False, 'err: %s' % e)
+            return
+        self.hosts[i]['result'] = check_jobs(j)
+        self.hosts[i]['summary'] = summarize(j['jobs'])
+
+    def _cleanup(self, i):
+        init = self.jobs[i][0]
+        try:
+            init.rm(self.__paths[i])
+        except (IOError, socket.error, paramiko.SSHException, ConnectionError) as e:
+            logger.warning("%s: could not remove %s: %s" % (init.hostname, self.__paths[i], e))
+
+    @staticmethod
+    def _each(target, indexes):
+        threads = [threading.Thread(target=target, args=(i,)) for i in indexes]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+    def _work(self):
+        start = now()
+        try:
+            self._each(self._prepare, range(len(self.jobs)))
+            ready = [s for s in self.__streams if s is not None]
+            if len(ready) < len(self.jobs):
+                for stream, _ in ready:
+                    stream.close()
+                failed = [h['result'].message for h in self.hosts if h['result'] is not None]
+                self._result = ReturnCode(False, 'not started: %s' % '; '.join(failed))
+                return
+
+            release = list()
+            for stream, _ in self.__streams:
+                stream.channel.sendall('go\n')
+                release.append(now())
+            self.skew = release[-1] - release[0]
+
+            self._each(self._collect, range(len(self.jobs)))
+            failed = [h for h in self.hosts if not h['result']]
+            if failed:
+                self._result = ReturnCode(False, '; '.join('%s: %s' % (h['host'], h['result'].message)
+                                                           for h in failed))
+            else:
+                self.aggregate = summarize([job for h in self.hosts
+                                            for job in h['result'].message['jobs']])
+                self._result = ReturnCode(True, self.aggregate)
+        finally:
+            self._each(self._cleanup, [i for i, path in enumerate(self.__paths) if path])
+            self.time = now() - start
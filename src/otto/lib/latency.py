@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Latency histograms from fio json+ output.
+
+fio --output-format=json+ reports each job's completion latencies as
+clat_ns bins, bucket value in nanoseconds to IO count.  Percentiles of
+several jobs, hosts or runs can not be averaged, their histograms have to be
+added up first.  A Histogram holds the bins as two sorted integer arrays and
+merges any number of them at once::
+
+    h = Histogram.merge(Histogram.from_report(r, 'read') for r in reports)
+    h = Histogram.from_bins(*[job['read']['clat_ns']['bins'] for job in jobs])
+    h.percentiles((50, 99, 99.99))   # {50.0: 102400, 99.0: 411648, 99.99: 1531904}
+    h.exceeding(1000000)             # fraction of IOs slower than 1ms
+
+numpy is used when it can be imported, otherwise the same results come
+from plain Python, more slowly.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, imap
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PERCENTILES = (1, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 95, 99, 99.5, 99.9, 99.95, 99.99)
+
+
+def _array(values):
+    if numpy is not None:
+        return numpy.asarray(values, dtype=numpy.int64)
+    return array('l', values)
+
+
+class _Slots(dict):
+    """
+    Numbers distinct keys in the order they are first looked up.
+    """
+
+    def __missing__(self, key):
+        slot = self[key] = len(self)
+        return slot
+
+
+class Histogram(object):
+    """
+    Sorted bucket values and their counts.
+    """
+
+    def __init__(self, values=(), counts=()):
+        self.values = _array(values)
+        self.counts = _array(counts)
+        self._cumulative = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def __add__(self, other):
+        return Histogram.merge([self, other])
+
+    def __eq__(self, other):
+        return list(self.values) == list(other.values) and list(self.counts) == list(other.counts)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<Histogram %d buckets %d samples>' % (len(self), self.total)
+
+    @classmethod
+    def from_bins(cls, *bins):
+        """
+        From json+ bins dicts, {'1024': 12, ...}, all of them added up.
+
+        fio has fewer than two thousand buckets however many jobs report
+        them, so each distinct key is converted to a number once and the
+        counts are summed into a slot per key.
+        """
+        if numpy is not None:
+            slots = _Slots()
+            index = numpy.fromiter(imap(slots.__getitem__, chain.from_iterable(bins)), numpy.intp)
+            if not len(index):
+                return cls()
+            counts = numpy.fromiter(chain.from_iterable(b.itervalues() for b in bins), numpy.int64, len(index))
+            # float64 sums are exact below 2**53 IOs
+            sums = numpy.bincount(index, weights=counts, minlength=len(slots)).astype(numpy.int64)
+            values = numpy.empty(len(slots), numpy.int64)
+            for key, slot in slots.iteritems():
+                values[slot] = int(key)
+            order = numpy.argsort(values)
+            keep = sums[order] != 0
+            return cls(values[order][keep], sums[order][keep])
+        merged = dict()
+        for b in bins:
+            for key, count in b.iteritems():
+                merged[key] = merged.get(key, 0) + count
+        items = sorted((int(v), c) for v, c in merged.iteritems() if c)
+        return cls([v for v, _ in items], [c for _, c in items])
+
+    @classmethod
+    def from_job(cls, job, ddir='read'):
+        """
+        From one job of a json+ report, for ddir 'read', 'write' or 'trim'.
+        """
+        return cls.from_bins(job.get(ddir, dict()).get('clat_ns', dict()).get('bins', dict()))
+
+    @classmethod
+    def from_report(cls, report, ddir='read'):
+        """
+        All the jobs of a decoded json+ report merged.
+        """
+        return cls.from_bins(*[job.get(ddir, dict()).get('clat_ns', dict()).get('bins', dict())
+                               for job in report.get('jobs', list())])
+
+    @classmethod
+    def merge(cls, histograms):
+        """
+        Add up any number of histograms in one pass.
+        """
+        histograms = list(histograms)
+        if numpy is not None:
+            if not histograms:
+                return cls()
+            values = numpy.concatenate([h.values for h in histograms])
+            counts = numpy.concatenate([h.counts for h in histograms])
+            if not len(values):
+                return cls()
+            order = numpy.argsort(values)
+            values = values[order]
+            counts = counts[order]
+            starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(values)) + 1))
+            return cls(values[starts], numpy.add.reduceat(counts, starts))
+        merged = dict()
+        for h in histograms:
+            for v, c in zip(h.values, h.counts):
+                merged[v] = merged.get(v, 0) + c
+        values = sorted(merged)
+        return cls(values, [merged[v] for v in values])
+
+    @property
+    def cumulative(self):
+        """
+        Running count of IOs up to and including each bucket.
+        """
+        if self._cumulative is None:
+            if numpy is not None:
+                self._cumulative = numpy.cumsum(self.counts)
+            else:
+                running = 0
+                cumulative = array('l')
+                for c in self.counts:
+                    running += c
+                    cumulative.append(running)
+                self._cumulative = cumulative
+        return self._cumulative
+
+    @property
+    def total(self):
+        return int(self.cumulative[-1]) if len(self) else 0
+
+    @property
+    def mean(self):
+        if not self.total:
+            return None
+        if numpy is not None:
+            return float(numpy.dot(self.values.astype(numpy.float64), self.counts)) / self.total
+        return float(sum(v * c for v, c in zip(self.values, self.counts))) / self.total
+
+    @property
+    def min(self):
+        return int(self.values[0]) if len(self) else None
+
+    @property
+    def max(self):
+        return int(self.values[-1]) if len(self) else None
+
+    def percentiles(self, percentiles=PERCENTILES):
+        """
+        Return {percentile: bucket value} the way fio computes them, the
+        first bucket at which the running count reaches the percentile.
+        """
+        total = self.total
+        if not total:
+            return dict()
+        wanted = [float(p) for p in percentiles]
+        if numpy is not None:
+            idx = numpy.searchsorted(self.cumulative, numpy.array(wanted) / 100.0 * total, side='left')
+            idx = numpy.minimum(idx, len(self) - 1)
+            return dict(zip(wanted, (int(v) for v in self.values[idx])))
+        cumulative = self.cumulative
+        return dict((p, self.values[min(bisect_left(cumulative, p / 100.0 * total), len(self) - 1)])
+                    for p in wanted)
+
+    def percentile(self, p):
+        return self.percentiles((p,)).get(float(p))
+
+    def cdf(self):
+        """
+        (values, fractions): the fraction of IOs at or below each bucket value.
+        """
+        total = float(self.total or 1)
+        if numpy is not None:
+            return self.values, self.cumulative / total
+        return list(self.values), [c / total for c in self.cumulative]
+
+    def tail(self):
+        """
+        (values, fractions): the fraction of IOs slower than each bucket
+        value, the complement of cdf for plotting the tail on a log scale.
+        """
+        values, fractions = self.cdf()
+        if numpy is not None:
+            return values, 1.0 - fractions
+        return values, [1.0 - f for f in fractions]
+
+    def exceeding(self, latency):
+        """
+        The fraction of IOs slower than latency, in the unit of the bins.
+        """
+        total = self.total
+        if not total:
+            return 0.0
+        if numpy is not None:
+            i = numpy.searchsorted(self.values, latency, side='right')
+        else:
+            i = bisect_right(self.values, latency)
+        below = int(self.cumulative[i - 1]) if i else 0
+        return (total - below) / float(total)
@@ -3,20 +3,30 @@
 """
 Classes supporting logging from scripts and the executor.
 """
+import cgi
 import datetime
+import errno
+import httplib
 import re
 import logging
 import sys
-import inspect
 import os
 import itertools
+import json
 import mimetools
 import mimetypes
-import urllib2
-import string
+import shutil
+import socket
+import struct
+import tempfile
+import urlparse
+import threading
 import time
-from logging import DEBUG, INFO, WARNING, ERROR
+import Queue
+import zlib
+from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL
 from logging.handlers import WatchedFileHandler
+from stat import ST_DEV, ST_INO
 
 from otto.lib.otypes import ReturnCode
 
@@ -30,6 +40,7 @@ class MultiPartForm(object):
     def __init__(self):
         self.form_fields = []
         self.files = []
+        self.paths = []
         self.boundary = mimetools.choose_boundary()
         return
 
@@ -49,6 +60,24 @@ class MultiPartForm(object):
         self.files.append((fieldname, filename, mimetype, body))
         return
 
+    def add_path(self, fieldname, filename, path, mimetype=None, compress=False):
+        """
+        Add a file to be read from path only as the form is sent by
+        iter_body, gzipped on the way when compress is set.
+        """
+        if compress:
+            filename += '.gz'
+            mimetype = 'application/x-gzip'
+        elif mimetype is None:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.paths.append((fieldname, filename, mimetype, path, compress))
+        return
+
+    @property
+    def size(self):
+        """Bytes to be read from the paths added."""
+        return sum(os.path.getsize(p[3]) for p in self.paths)
+
     def __str__(self):
         """Return a string representing the form data, including attached files."""
         # Build a list of lists, each containing "lines" of the
@@ -87,6 +116,84 @@ class MultiPartForm(object):
         flattened.append('')
         return '\r\n'.join(flattened)
 
+    def iter_body(self, blocksize=65536, progress=None, level=6):
+        """
+        Yield the form data in pieces of about blocksize, reading the files
+        added with add_path a block at a time, so it can be sent however big
+        they are.  progress(sent, total) is called with the bytes read so far.
+        Every call starts over from the beginning of the files.
+        """
+        part_boundary = '--' + self.boundary + '\r\n'
+        for name, value in self.form_fields:
+            yield '%sContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (part_boundary, name, value)
+        for field_name, filename, content_type, body in self.files:
+            yield '%sContent-Disposition: file; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n%s\r\n' % (
+                part_boundary, field_name, filename, content_type, body)
+        total = self.size
+        sent = 0
+        for field_name, filename, content_type, path, compress in self.paths:
+            yield '%sContent-Disposition: file; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n' % (
+                part_boundary, field_name, filename, content_type)
+            z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(blocksize), ''):
+                    sent += len(block)
+                    if z is not None:
+                        block = z.compress(block)
+                    if block:
+                        yield block
+                    if progress is not None:
+                        progress(sent, total)
+            if z is not None:
+                yield z.flush()
+            yield '\r\n'
+        yield '--' + self.boundary + '--\r\n'
+
+
+def upload(url, form, retries=3, backoff=1.0, blocksize=65536, progress=None, timeout=60):
+    """
+    POST a MultiPartForm to url with chunked transfer encoding, streaming it
+    from form.iter_body so memory use does not grow with the files.  A
+    connection failure or 5xx reply is retried up to retries times, waiting
+    backoff, 2 * backoff, ... seconds in between; each attempt streams the
+    files again from disk.
+
+    :return: ReturnCode with the body of the reply, False with the last error
+             when every attempt failed
+    """
+    parts = urlparse.urlsplit(url)
+    selector = parts.path or '/'
+    if parts.query:
+        selector += '?' + parts.query
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        conn = httplib.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        try:
+            conn.putrequest('POST', selector)
+            conn.putheader('Content-Type', form.get_content_type())
+            conn.putheader('Transfer-Encoding', 'chunked')
+            conn.endheaders()
+            for piece in form.iter_body(blocksize, progress):
+                if piece:
+                    conn.send('%x\r\n%s\r\n' % (len(piece), piece))
+            conn.send('0\r\n\r\n')
+            response = conn.getresponse()
+            data = response.read()
+        except (socket.error, httplib.HTTPException) as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            continue
+        finally:
+            conn.close()
+        if response.status >= 500:
+            error = "%s %s" % (response.status, response.reason)
+            continue
+        if response.status >= 400:
+            return ReturnCode(False, "%s %s" % (response.status, response.reason))
+        return ReturnCode(True, data)
+    return ReturnCode(False, "%s failed after %d attempts: %s" % (url, retries + 1, error))
+
 
 class Dispatcher(logging.Formatter):
     instance = os.environ.get('instance') or ''
@@ -136,10 +243,314 @@ class LogFilter:
         return record.levelno == self.__level
 
 
+class QueuedHandler(logging.Handler):
+    """
+    Hands records to a single writer thread through a bounded queue, so the
+    thread logging never waits on disk.  The writer takes whatever has
+    queued up, writes it to each of the handlers behind it in one go per
+    file and flushes them every flush_interval seconds and whenever the
+    queue runs dry::
+
+        h = QueuedHandler([WatchedFileHandler('full.log'), errors], maxsize=10000, full='drop')
+        logger.addHandler(h)
+
+    full says what a record does when maxsize records are already waiting:
+
+        'block' waits for room, nothing is lost but the caller is slowed to disk speed
+        'drop' throws it away and counts it in .dropped, a warning saying how
+               many were lost is written once there is room again
+
+    flush() waits for everything queued so far to be written and flushed.
+    close(), called from logging.shutdown at exit, writes what is left and
+    stops the writer.
+    """
+
+    def __init__(self, handlers, maxsize=10000, full='block', flush_interval=1.0):
+        logging.Handler.__init__(self)
+        if full not in ('block', 'drop'):
+            raise ValueError("full must be 'block' or 'drop'")
+        self.handlers = list(handlers)
+        self.full = full
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.queue = Queue.Queue(maxsize)
+        self._reported = 0
+        self._closed = False
+        self._writer = threading.Thread(target=self._write, name='otto-log-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def prepare(self, record):
+        """
+        Settle everything about the record that could change before the
+        writer gets to it.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._closed:
+            return
+        try:
+            record = self.prepare(record)
+            if self.full == 'block':
+                self.queue.put(record)
+            else:
+                self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if self._writer.is_alive():
+            self.queue.put(None)  # the writer flushes when it gets to it
+            self.queue.join()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if self._writer.is_alive():
+                self.queue.put(StopIteration)
+                self._writer.join()
+            for handler in self.handlers:
+                handler.close()
+        logging.Handler.close(self)
+
+    def _write(self):
+        last_flush = time.time()
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except Queue.Empty:
+                batch = list()
+            while len(batch) < 1000:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            stop = StopIteration in batch
+            records = [r for r in batch if r is not None and r is not StopIteration]
+            if self.dropped > self._reported:
+                records.append(logging.LogRecord('otto', WARNING, __file__, 0,
+                                                 '%d log records dropped, the log queue was full',
+                                                 (self.dropped - self._reported,), None))
+                self._reported = self.dropped
+            for handler in self.handlers:
+                try:
+                    _write_batch(handler, records)
+                except Exception:
+                    handler.handleError(records[-1])
+            if stop or None in batch or not batch or self.queue.empty() or \
+                    time.time() - last_flush > self.flush_interval:
+                for handler in self.handlers:
+                    handler.flush()
+                last_flush = time.time()
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+
+def _write_batch(handler, records):
+    """
+    Write the records handler takes, as one write if it writes to a file.
+    """
+    # like Log.logResult's, a record without a level goes to every handler
+    records = [r for r in records if r.levelno is None or (r.levelno >= handler.level and handler.filter(r))]
+    if not records:
+        return
+    if not isinstance(handler, logging.StreamHandler):
+        for record in records:
+            handler.acquire()
+            try:
+                handler.emit(record)
+            finally:
+                handler.release()
+        return
+    text = list()
+    for record in records:
+        line = handler.format(record)
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        text.append(line)
+    text.append('')
+    handler.acquire()
+    try:
+        if isinstance(handler, WatchedFileHandler):
+            _reopen_if_moved(handler)
+        if isinstance(handler, logging.FileHandler) and handler.stream is None:
+            handler.stream = handler._open()
+            if isinstance(handler, WatchedFileHandler):
+                handler._statstream()
+        handler.stream.write('\n'.join(text))
+    finally:
+        handler.release()
+
+
+def _reopen_if_moved(handler):
+    """
+    What WatchedFileHandler.emit checks before each record, once a batch.
+    """
+    try:
+        sres = os.stat(handler.baseFilename)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        sres = None
+    if not sres or sres[ST_DEV] != handler.dev or sres[ST_INO] != handler.ino:
+        if handler.stream is not None:
+            handler.stream.flush()
+            handler.stream.close()
+            handler.stream = None
+            handler.stream = handler._open()
+            handler._statstream()
+
+
+# what every LogRecord has, anything else on a record came in through extra=
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | frozenset(('message', 'asctime'))
+
+# what Log adds to the records it formats itself, see _fields
+_LOG_EXTRA = frozenset(('text', 'caller', 'fields'))
+
+# one index entry per record: time, level, crc32 of the host, offset in the log
+_JSON_INDEX = struct.Struct('<dBIQ')
+
+
+def _host_key(host):
+    return zlib.crc32(str(host)) & 0xffffffff if host is not None else 0
+
+
+class JsonHandler(logging.Handler):
+    """
+    Write each record as one JSON object on a line, and beside the log a
+    fixed width index of time, level and host to the line's byte offset, so
+    query can seek to what it wants instead of reading the whole log.
+
+    The object has time, level, caller, logger and message, plus whatever the
+    record was given as extra, e.g. host, command and duration, and the
+    fields given to the Log methods.  Neither can replace those five::
+
+        logger.info('ran %s', cmd, extra={'host': h, 'command': cmd, 'duration': 0.25})
+        {"time":1519905600.25,"level":"INFO","caller":"ssh.py:188","logger":"otto.connections",
+         "message":"ran uname","host":"node1","command":"uname","duration":0.25}
+
+    Times in the index never go backwards, a record logged late by another
+    thread is indexed at the time of the one before it.
+    """
+
+    def __init__(self, filename):
+        logging.Handler.__init__(self)
+        self.baseFilename = os.path.abspath(filename)
+        self.indexFilename = self.baseFilename + '.idx'
+        self.stream = open(self.baseFilename, 'ab')
+        self.stream.seek(0, os.SEEK_END)
+        self.offset = self.stream.tell()
+        self.index = open(self.indexFilename, 'ab')
+        self.index.seek(0, os.SEEK_END)
+        self.last = 0.0
+        if self.index.tell() >= _JSON_INDEX.size:
+            with open(self.indexFilename, 'rb') as f:
+                f.seek(-_JSON_INDEX.size, os.SEEK_END)
+                self.last = _JSON_INDEX.unpack(f.read(_JSON_INDEX.size))[0]
+
+    def format(self, record):
+        entry = dict()
+        for key, value in vars(record).iteritems():
+            if key not in _RECORD_ATTRS and key not in _LOG_EXTRA:
+                entry[key] = value
+        entry.update(getattr(record, 'fields', None) or ())
+        entry['time'] = record.created
+        entry['level'] = record.levelname if record.levelno is not None else 'RESULT'
+        entry['logger'] = record.name
+        caller = getattr(record, 'caller', None)
+        if caller is None and record.lineno is not None:
+            caller = '%s:%d' % (record.filename, record.lineno)
+        if caller is not None:
+            entry['caller'] = caller
+        entry['message'] = record.text if hasattr(record, 'text') else record.getMessage()
+        return json.dumps(entry, separators=(',', ':'), default=str) + '\n'
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.acquire()  # Log.logResult calls emit without handle
+        try:
+            self.last = max(self.last, record.created)
+            self.stream.write(line)
+            self.index.write(_JSON_INDEX.pack(self.last, min(record.levelno or 0, 255),
+                                              _host_key(getattr(record, 'host', None)), self.offset))
+            self.offset += len(line)
+            self.stream.flush()
+            self.index.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self.stream.close()
+            self.index.close()
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+
+def query(filename, start=None, end=None, level=None, host=None, batch=4096):
+    """
+    Yield the decoded records of a JsonHandler log logged from start to end,
+    as time.time() values, at level or above and from host, each given or
+    not.  The index is bisected for start and read up to end, only the
+    records it matches are read from the log::
+
+        for r in query(log.jsonLogFile, t1, t2, level=ERROR, host='node1'):
+            print r['time'], r['caller'], r['message']
+    """
+    if isinstance(level, basestring):
+        level = logging.getLevelName(level)
+    key = _host_key(host)
+    size = _JSON_INDEX.size
+    with open(filename + '.idx', 'rb') as index, open(filename, 'rb') as log:
+        count = os.fstat(index.fileno()).st_size // size
+        lo, hi = 0, count
+        if start is not None:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                index.seek(mid * size)
+                if _JSON_INDEX.unpack(index.read(size))[0] < start:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        index.seek(lo * size)
+        while lo < count:
+            data = index.read(min(batch, count - lo) * size)
+            lo += len(data) // size
+            for t, levelno, hostkey, offset in (_JSON_INDEX.unpack_from(data, i) for i in xrange(0, len(data), size)):
+                if end is not None and t > end:
+                    return
+                if (level is not None and levelno < level) or (host is not None and hostkey != key):
+                    continue
+                log.seek(offset)
+                record = json.loads(log.readline())
+                if host is not None and record.get('host') != host:
+                    continue
+                if (start is not None and record['time'] < start) or (end is not None and record['time'] > end):
+                    continue
+                yield record
+
+
 def formatMesg(message, levelno, frame, fmt):
     """
     This function formats a log message according to the values of a log entry for programs
-    making a call into the log class which bypass the dispatcher
+    making a call into the log class which bypass the dispatcher.  frame is the caller's
+    frame, as sys._getframe returns it, or its inspect.stack() record.
 
     The possible configurable values for log format are::
 
@@ -164,18 +575,21 @@ def formatMesg(message, levelno, frame, fmt):
 
     """
 
-    info = inspect.getframeinfo(frame[0])
+    if isinstance(frame, tuple):  # a record from inspect.stack()
+        frame = frame[0]
+    code = frame.f_code
 
-    asctime = datetime.datetime.now().strftime('%F %H:%M:%S,%f')[:-3]
     created = time.time()
-    filename = os.path.basename(info.filename) or ''
-    funcName = info.function or ''
+    now = datetime.datetime.fromtimestamp(created)
+    asctime = now.strftime('%F %H:%M:%S,%f')[:-3]
+    filename = os.path.basename(code.co_filename) or ''
+    funcName = code.co_name or ''
     levelname = logging.getLevelName(levelno)
-    lineno = info.lineno
+    lineno = frame.f_lineno
     module = ''  # not implemented
-    msec = datetime.datetime.now().strftime('%f')[:-3]
+    msec = now.strftime('%f')[:-3]
     name = ''  # not implemented
-    pathname = info.filename
+    pathname = code.co_filename
     process = ''  # not implemented
     processName = ''  # not implemented
     relativeCreated = ''  # not implemented
@@ -189,6 +603,123 @@ def formatMesg(message, levelno, frame, fmt):
                   'threadName': threadName}
 
 
+# one pass over each line finds what the index needs (groups would cost the pattern its
+# fast literal scan); only a line whose first mark is a warning or a step is searched on
+# for a stronger one, so errors win over warnings and warnings over steps wherever they are
+_HTML_MARKS = re.compile(r'ERROR|CRITICAL|WARNING|TEST COMPLETED')
+_HTML_KINDS = (('err', 'Errors', '<FONT COLOR="#FF0000">'), ('wrn', 'Warnings', '<FONT COLOR="#FF9933">'),
+               ('step', 'Steps', None))
+_HTML_KIND = {'ERROR': _HTML_KINDS[0], 'CRITICAL': _HTML_KINDS[0], 'WARNING': _HTML_KINDS[1],
+              'TEST COMPLETED': _HTML_KINDS[2]}
+_HTML_STRONGER = {'wrn': re.compile(r'ERROR|CRITICAL'), 'step': re.compile(r'ERROR|CRITICAL|WARNING')}
+
+
+def render_html(logfile, htmlfile=None, page_lines=0):
+    """
+    Write logfile as HTML, errors in red and warnings in orange, with an
+    index at the top linking to every error, warning and step (each TEST
+    COMPLETED line).  The log is read a line at a time and the HTML and the
+    index are written as they are made, so memory use does not grow with
+    the log.
+
+    With page_lines the log is split into pages of that many lines,
+    htmlfile-0001.html and on, each linking to the pages before and after
+    it, and htmlfile holds only the index, so a browser can open any part of
+    a huge log.
+
+    Next to htmlfile an .idx file lists every indexed line as::
+
+        kind number byte-offset line-number page
+
+    byte-offset being where the line starts in logfile, for seeking to it.
+
+    :return: htmlfile, by default logfile with .log replaced by .html
+    """
+    htmlfile = htmlfile or re.sub('.log$', '.html', logfile)
+    base = re.sub('.html$', '', htmlfile)
+    links = dict((kind, tempfile.TemporaryFile()) for kind, _, _ in _HTML_KINDS)
+    counts = dict((kind, 0) for kind, _, _ in _HTML_KINDS)
+    sidecar = open(base + '.idx', 'w')
+    pages = [0]
+    state = {'body': None, 'lines': 0}
+
+    def page_name(n):
+        return '%s-%04d.html' % (os.path.basename(base), n)
+
+    def open_page():
+        if not page_lines:
+            state['body'] = tempfile.TemporaryFile()
+            return
+        if state['body'] is not None:
+            state['body'].write('<p/><a href="%s">next</a>\n</HTML>\n' % page_name(pages[0] + 1))
+            state['body'].close()
+        pages[0] += 1
+        state['body'] = open('%s-%04d.html' % (base, pages[0]), 'w')
+        state['body'].write('<HTML>\n<a name="top"/><a href="%s">index</a>' % os.path.basename(htmlfile))
+        if pages[0] > 1:
+            state['body'].write(' <a href="%s">previous</a>' % page_name(pages[0] - 1))
+        state['body'].write('\n<p/>\n')
+        state['lines'] = 0
+
+    try:
+        offset = 0
+        with open(logfile, 'rb') as log:
+            for lineno, line in enumerate(log, 1):
+                if state['body'] is None or (page_lines and state['lines'] == page_lines):
+                    open_page()
+                text = cgi.escape(line) if '<' in line or '>' in line or '&' in line else line
+                m = _HTML_MARKS.search(line)
+                if m:
+                    kind, _, font = _HTML_KIND[m.group()]
+                    while kind in _HTML_STRONGER:
+                        m = _HTML_STRONGER[kind].search(line, m.end())
+                        if not m:
+                            break
+                        kind, _, font = _HTML_KIND[m.group()]
+                    counts[kind] += 1
+                    n = counts[kind]
+                    target = page_name(pages[0]) if page_lines else ''
+                    links[kind].write('%s<a href="%s#%s%d">%d</a>' % (', ' if n > 1 else '', target, kind, n, n))
+                    sidecar.write('%s %d %d %d %d\n' % (kind, n, offset, lineno, pages[0]))
+                    if font:
+                        text = '<a name=%s%d />%s%s</FONT><a href="#top">Back to top</a>\n' % (kind, n, font, text)
+                    else:
+                        text = '<a name=%s%d />%s' % (kind, n, text)
+                state['body'].write(('<br/>' if state['lines'] else '') + text)
+                state['lines'] += 1
+                offset += len(line)
+
+        with open(htmlfile, 'w') as html:
+            html.write('<HTML>\n')
+            html.write('<a name="top"/>')
+            for kind, title, _ in _HTML_KINDS:
+                if not counts[kind]:
+                    html.write('%s: 0\n' % title)
+                else:
+                    html.write('%s: ' % title)
+                    links[kind].seek(0)
+                    shutil.copyfileobj(links[kind], html)
+                    html.write('\n')
+                html.write('<p/>\n')
+            if page_lines:
+                html.write('Pages: %s\n' % ', '.join('<a href="%s">%d</a>' % (page_name(n), n)
+                                                     for n in xrange(1, pages[0] + 1)))
+                if state['body'] is not None:
+                    state['body'].write('</HTML>\n')
+            elif state['body'] is not None:
+                state['body'].seek(0)
+                shutil.copyfileobj(state['body'], html)
+            html.write('</HTML>\n')
+    finally:
+        sidecar.close()
+        if state['body'] is not None:
+            state['body'].close()
+        for f in links.values():
+            f.close()
+
+    return htmlfile
+
+
 def setFormat(lvl, fmt):
     """
     Set the format for a specific log level.
@@ -205,9 +736,28 @@ def setFormat(lvl, fmt):
         Dispatcher.errorFormat = fmt
 
 
+def _fields(frame, text, fields=None):
+    """
+    extra= for a record Log formatted itself: the message as given, the
+    caller, which the record would otherwise place in this module, and the
+    caller's fields, kept apart so a field can share a name with a LogRecord
+    attribute like name or module.
+    """
+    return {'text': text, 'fields': fields or None,
+            'caller': '%s:%d' % (os.path.basename(frame.f_code.co_filename), frame.f_lineno)}
+
+
 class Log(object):
     def __init__(self, level=logging.DEBUG, name=None, logdir='./', stdout=True, multiFile=False, post=False,
-                 ws='www-qa.coraid.com'):
+                 ws='www-qa.coraid.com', queued=False, queue_size=10000, full='block', jsonl=False):
+        """
+        With queued=True the log files are written by a QueuedHandler's thread
+        instead of by the thread logging, see QueuedHandler for queue_size and
+        full.  The console is still written straight away.
+
+        With jsonl=True every record is also written to jsonLogFile by a
+        JsonHandler, to be searched with query.
+        """
         self.logdir = logdir
         self.ws = ws
         self.instance = os.environ.get('instance') or ''
@@ -236,8 +786,7 @@ class Log(object):
             self.logger.addHandler(StdOutHandler)
 
         if name is None:
-            frame = inspect.stack()[1]
-            name = inspect.getfile(frame[0]).split('/')[-1].split(".py")[0]
+            name = sys._getframe(1).f_code.co_filename.split('/')[-1].split(".py")[0]
 
         logFileBase = self.logdir + name + "-" + time.strftime('%Y%m%d_%H%M')
 
@@ -251,7 +800,15 @@ class Log(object):
         FullLogFileHandler.setLevel(level)
         FullLogFileHandler._name = "LogFile-FULL"
         FullLogFileHandler.setFormatter(Dispatcher())
-        self.logger.addHandler(FullLogFileHandler)
+        files = [FullLogFileHandler]
+
+        self.jsonLogFile = None
+        if jsonl:
+            self.jsonLogFile = logFileBase + "_FULL.jsonl"
+            JsonLogFileHandler = JsonHandler(self.jsonLogFile)
+            JsonLogFileHandler.setLevel(level)
+            JsonLogFileHandler._name = "LogFile-JSON"
+            files.append(JsonLogFileHandler)
 
         """
         In the case of multiFile = True:
@@ -292,167 +849,171 @@ class Log(object):
             WarningFileHandler.setFormatter(Dispatcher())
             ErrorFileHandler.setFormatter(Dispatcher())
 
-            # Add handlers to root logger
-            self.logger.addHandler(DebugFileHandler)
-            self.logger.addHandler(CommentFileHandler)
-            self.logger.addHandler(InfoFileHandler)
-            self.logger.addHandler(WarningFileHandler)
-            self.logger.addHandler(ErrorFileHandler)
-
-    def debug(self, msg):
-        frame = inspect.stack()[1]
-        msg = formatMesg(msg, DEBUG, frame, Dispatcher.debugFormat)
-        self.logger.debug(msg)
-
-    def comment(self, msg):
-        frame = inspect.stack()[1]
-        msg = formatMesg(msg, COMMENT, frame, Dispatcher.commentFormat)
-        self.logger.log(COMMENT, msg)
-
-    def info(self, msg):
-        frame = inspect.stack()[1]
-        msg = formatMesg(msg, INFO, frame, Dispatcher.infoFormat)
-        self.logger.info(msg)
-
-    def warning(self, msg):
-        frame = inspect.stack()[1]
-        msg = formatMesg(msg, WARNING, frame, Dispatcher.warningFormat)
-        self.logger.warning(msg)
-
-    def error(self, msg):
-        frame = inspect.stack()[1]
-        msg = formatMesg(msg, ERROR, frame, Dispatcher.errorFormat)
-        self.logger.error(msg)
+            files.extend([DebugFileHandler, CommentFileHandler, InfoFileHandler, WarningFileHandler,
+                          ErrorFileHandler])
+
+        # Add handlers to root logger
+        self.queue = None
+        if queued:
+            self.queue = QueuedHandler(files, maxsize=queue_size, full=full)
+            self.logger.addHandler(self.queue)
+        else:
+            for handler in files:
+                self.logger.addHandler(handler)
+
+    @staticmethod
+    def _writers(logger):
+        """
+        A logger's handlers, with those behind a QueuedHandler in its place
+        """
+        handlers = list()
+        for handler in logger.handlers:
+            if isinstance(handler, QueuedHandler):
+                handlers.extend(handler.handlers)
+            elif not isinstance(handler, logging.NullHandler):
+                handlers.append(handler)
+        return handlers
+
+    @property
+    def handlers(self):
+        """
+        The logger's handlers, with those behind a QueuedHandler in its place
+        """
+        return self._writers(self.logger)
+
+    def enabled(self, levelno):
+        """
+        Whether a message at levelno would be written by any handler, the
+        logger's own or, as the record propagates, one of its ancestors'.
+        """
+        if not self.logger.isEnabledFor(levelno):
+            return False
+        logger = self.logger
+        while logger:
+            for handler in self._writers(logger):
+                if levelno >= handler.level:
+                    return True
+            if not logger.propagate:
+                break
+            logger = logger.parent
+        return False
+
+    def flush(self):
+        """
+        Wait until everything logged so far is in the files.
+        """
+        for handler in self.logger.handlers:
+            handler.flush()
+
+    def _log(self, levelno, fmt, msg, args, fields):
+        """
+        Write msg % args for the caller of the method calling this, only
+        looking at the caller's frame and formatting when the level is enabled.
+        """
+        if not self.enabled(levelno):
+            return
+        if args:
+            msg = msg % args
+        frame = sys._getframe(2)
+        self.logger.log(levelno, formatMesg(msg, levelno, frame, getattr(Dispatcher, fmt)),
+                        extra=_fields(frame, msg, fields))
+
+    def debug(self, msg, *args, **fields):
+        """
+        Log msg at DEBUG.  With args the message is msg % args, formatted only
+        if it is going to be written::
+
+            log.debug("%d of %d targets up: %s", up, total, stat)
+
+        Keyword arguments, e.g. host, command or duration, are kept as fields
+        of the record for the JSON log, see JsonHandler.  Any name will do.
+        """
+        self._log(DEBUG, 'debugFormat', msg, args, fields)
+
+    def comment(self, msg, *args, **fields):
+        self._log(COMMENT, 'commentFormat', msg, args, fields)
+
+    def info(self, msg, *args, **fields):
+        self._log(INFO, 'infoFormat', msg, args, fields)
+
+    def warning(self, msg, *args, **fields):
+        self._log(WARNING, 'warningFormat', msg, args, fields)
+
+    def error(self, msg, *args, **fields):
+        self._log(ERROR, 'errorFormat', msg, args, fields)
+
+    def critical(self, msg, *args, **fields):
+        self._log(CRITICAL, 'errorFormat', msg, args, fields)
 
     def write(self, msg):
         """
         Put a message into the log.  This method can take a string or a result type dict.
         """
-        frame = inspect.stack()[1]
+        frame = sys._getframe(1)
 
         if type(msg) == str:
-            msg = formatMesg(msg, COMMENT, frame, Dispatcher.commentFormat)
-            self.logger.log(COMMENT, msg)
+            text = formatMesg(msg, COMMENT, frame, Dispatcher.commentFormat)
+            self.logger.log(COMMENT, text, extra=_fields(frame, msg))
         elif type(msg) == dict:
             status = msg['status']
+            extra = _fields(frame, msg['value'], {'status': status})
             if status == 'pass':
                 msg['value'] = formatMesg(msg['value'], INFO, frame, Dispatcher.infoFormat)
-                self.logger.info(msg['value'])
+                self.logger.info(msg['value'], extra=extra)
             elif status == 'warning':
                 msg['value'] = formatMesg(msg['value'], WARNING, frame, Dispatcher.warningFormat)
-                self.logger.warning(msg['value'])
+                self.logger.warning(msg['value'], extra=extra)
             elif status == 'fail':
                 msg['value'] = formatMesg(msg['value'], ERROR, frame, Dispatcher.errorFormat)
-                self.logger.error(msg['value'])
+                self.logger.error(msg['value'], extra=extra)
             else:
                 msg['value'] = formatMesg(msg['value'] + "Status: UNKNOWN", ERROR, frame, Dispatcher.errorFormat)
-                self.logger.warning(msg['value'])
+                self.logger.warning(msg['value'], extra=extra)
         elif type(msg) == ReturnCode:
+            extra = _fields(frame, str(msg), {'status': msg.status})
             if msg:
                 msg = formatMesg(str(msg), INFO, frame, Dispatcher.infoFormat)
-                self.logger.info(msg)
+                self.logger.info(msg, extra=extra)
             elif not msg:
                 msg = formatMesg(str(msg), ERROR, frame, Dispatcher.errorFormat)
-                self.logger.error(msg)
+                self.logger.error(msg, extra=extra)
         else:
             print str(type(msg))
 
-    def post(self):
+    def post(self, compress=True, progress=None, retries=3):
         """
-        Post data to self.ws through the post.py form
+        Post the log and its HTML rendering to self.ws through the post.py
+        form, streamed and gzipped unless compress is False; see upload.
         """
         postUrl = 'http://' + self.ws + ':80/cgi-bin/post.py'
+        self.flush()
 
-        # Create the form with simple fields
-        logform = MultiPartForm()
-        logfilename = string.rsplit(self.fullLogFile, '/', 1)[1]
-        logform.add_file('file', logfilename, open(self.fullLogFile))
-        body = str(logform)
-
-        # Build the request
-        request = urllib2.Request(postUrl)
-        request.add_header('Content-type', logform.get_content_type())
-        request.add_header('Content-length', len(body))
-        request.add_data(body)
-
-        # print request.get_data()
-        urllib2.urlopen(request).read()
-
-        htmlFile = self.format_html()
-        htmlform = MultiPartForm()
-        htmlfilename = string.rsplit(htmlFile, '/', 1)[1]
-        htmlform.add_file('file', htmlfilename, open(htmlFile))
-
-        request = urllib2.Request(postUrl)
-        body = str(htmlform)
-        request.add_header('Content-type', htmlform.get_content_type())
-        request.add_header('Content-length', len(body))
-        request.add_data(body)
-        # request.get_data()
-        response = urllib2.urlopen(request)
-        data = response.read()
+        data = None
+        for path in (self.fullLogFile, self.format_html()):
+            form = MultiPartForm()
+            form.add_path('file', os.path.basename(path), path, compress=compress)
+            r = upload(postUrl, form, retries=retries, progress=progress)
+            if not r:
+                raise IOError("posting %s failed: %s" % (path, r.message))
+            data = r.message
 
         s = re.search("^file location: (.+)", data, re.MULTILINE)
         location = s.group(1)
 
         print "http://%s%s\n" % (self.ws, location)
 
-    def format_html(self):
-        html = []
-
-        errors = []
-        error_count = 0
-
-        warnings = []
-        warning_count = 0
-
-        log = open(self.fullLogFile)
-        htmlFileName = re.sub('.log$', '.html', self.fullLogFile)
-
-        for line in log:
-            if re.search('ERROR', line):
-                error_count += 1
-                err = 'err' + str(error_count)
-                errors.append('<a href="#err' + str(error_count) + '">' + str(error_count) + '</a>')
-                html.append(
-                    '<a name=' + err + ' />' + '<FONT COLOR="#FF0000">' + line + '</FONT><a href="#top">Back to top</a>\n')
-            elif re.search('WARNING', line):
-                warning_count += 1
-                wrn = 'wrn' + str(warning_count)
-                warnings.append('<a href="#wrn' + str(warning_count) + '">' + str(warning_count) + '</a>')
-                html.append(
-                    '<a name=' + wrn + ' />' + '<FONT COLOR="#FF9933">' + line + '</FONT><a href="#top">Back to top</a>\n')
-            else:
-                html.append(line)
-
-        htmlFile = open(htmlFileName, 'w')
-        htmlFile.write('<HTML>\n')
-
-        htmlFile.write('<a name="top"/>')
-
-        if not errors:
-            htmlFile.write('Errors: 0\n')
-        else:
-            htmlFile.write('Errors: ' + ', '.join(errors) + '\n')
-
-        htmlFile.write('<p/>\n')
-
-        if not warnings:
-            htmlFile.write('Warnings: 0\n')
-        else:
-            htmlFile.write('Warnings: ' + ', '.join(warnings) + '\n')
-
-        htmlFile.write('<p/>\n')
-        htmlFile.write('<br/>'.join(html))
-        htmlFile.write('</HTML>\n')
-
-        return htmlFileName
+    def format_html(self, page_lines=0):
+        """
+        Render the full log as HTML, see render_html, and return the file name.
+        """
+        self.flush()
+        return render_html(self.fullLogFile, page_lines=page_lines)
 
     def setLevel(self, level):
         """
         Changes the log level of existing log handlers
         """
-        handlers = self.logger.handlers
+        handlers = self.handlers
         for handler in handlers:
             handler.setLevel(level)
 
@@ -463,6 +1024,7 @@ class Log(object):
         """
         record = logging.LogRecord(None, None, None, None, "TEST COMPLETED - ID: %s w/ STATUS: %s", (tcid, result),
                                    None)
+        record.test, record.status = tcid, result  # fields of the JSON record
         handlers = self.logger.handlers
         for handler in handlers:
             handler.emit(record)
@@ -473,7 +1035,7 @@ class Log(object):
         Returns a list of active fileHandlers
         """
         fileHandlers = list()
-        handlers = self.logger.handlers
+        handlers = self.handlers
         for handler in handlers:
             try:
                 if handler._name.startswith("LogFile-"):
@@ -5,8 +5,10 @@
 """
     otypes is a collection of utility classes/types used by otto and scripts.
 """
+import threading
 from collections import namedtuple
 from pprint import pformat
+from time import time
 
 
 class ResultType(dict):
@@ -279,12 +281,149 @@ class Namespace(dict):
                 self.__setattr__(k, v)
 
 
+class LunTopology(dict):
+    """
+    The dictionary returned by Srx.luns/Srx.list, indexed as it is built so
+    that lookups do not have to walk every lun, raid and component::
+
+        luns = sr.luns
+        luns.location('43.5')         # ('1', '0', '2')  (lun, raid, position)
+        luns.drive('1.0.2')           # '43.5'
+        luns.drives('1')              # ['43.3', '43.4', '43.5']
+        luns.in_state('recovering')   # ['1']
+
+    States are indexed per comma separated token, so a lun in state
+    'degraded,recovering' is found under both.  The indexes are rebuilt
+    lazily after the dictionary is modified.
+    """
+
+    def __init__(self, luns=None):
+        super(LunTopology, self).__init__(luns or {})
+        self._index = None
+
+    def _invalidate(self):
+        self._index = None
+
+    def __setitem__(self, key, value):
+        super(LunTopology, self).__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super(LunTopology, self).__delitem__(key)
+        self._invalidate()
+
+    def pop(self, *args):
+        self._invalidate()
+        return super(LunTopology, self).pop(*args)
+
+    def popitem(self):
+        self._invalidate()
+        return super(LunTopology, self).popitem()
+
+    def setdefault(self, *args):
+        self._invalidate()
+        return super(LunTopology, self).setdefault(*args)
+
+    def update(self, *args, **kwargs):
+        super(LunTopology, self).update(*args, **kwargs)
+        self._invalidate()
+
+    def clear(self):
+        super(LunTopology, self).clear()
+        self._invalidate()
+
+    @property
+    def index(self):
+        """
+        The indexes as a dictionary of 'location', 'element', 'drives' and 'state'.
+        """
+        if self._index is None:
+            location = dict()
+            element = dict()
+            drives = dict()
+            state = dict()
+            for num, lun in self.iteritems():
+                drives[num] = list()
+                states = [lun.get('state')] + [raid.get('state') for raid in lun.get('raids', list())]
+                for st in states:
+                    for token in (st or '').split(','):
+                        if token:
+                            state.setdefault(token, set()).add(num)
+                for rnum, raid in enumerate(lun.get('raids', list())):
+                    rnum = str(raid.get('number', rnum))
+                    for comp in raid['components']:
+                        drive = comp.get('drive') or comp.get('device')
+                        elem = comp.get('element') or '%s.%s.%s' % (num, rnum, comp['position'])
+                        element[elem] = drive
+                        if drive and drive.find('.') != -1:
+                            location[drive] = tuple(elem.split('.'))
+                            drives[num].append(drive)
+            self._index = {'location': location, 'element': element, 'drives': drives,
+                           'state': dict((k, sorted(v, key=int)) for k, v in state.iteritems())}
+        return self._index
+
+    def location(self, drive):
+        """
+        Returns the (lun, raid, position) of a drive or None if it is not in a lun.
+        """
+        return self.index['location'].get(str(drive))
+
+    def drive(self, element):
+        """
+        Returns the drive ('shelf.slot') of a lun element ('lun.raid.position').
+        """
+        return self.index['element'].get(element)
+
+    def drives(self, lun):
+        """
+        Returns a list of the drives in a lun.
+        """
+        return self.index['drives'].get(str(lun), list())
+
+    def in_state(self, state):
+        """
+        Returns a list of the luns whose state includes state.
+        """
+        return self.index['state'].get(state, list())
+
+    def restrict(self, slots):
+        """
+        Returns a LunTopology with only the luns whose drives are all in slots.
+        """
+        use = set(str(s) for s in slots)
+        keep = LunTopology()
+        for num, lun in self.iteritems():
+            if all(d.split('.')[1] in use for d in self.drives(num)):
+                dict.__setitem__(keep, num, lun)
+        return keep
+
+
 class Drive(dict):
-    def __init__(self, shelf, slot, runner):
+    """
+    A lazy view of a single drive's 'drives -j' output.
+
+    With a ttl the parsed output is kept as a snapshot for ttl seconds so
+    that successive lookups like::
+
+        sr.s3.model, sr.s3.firmware
+
+    cost a single console round trip.  Use refresh() to force a new read or
+    invalidate() to drop the snapshot; the owning Srx invalidates it
+    whenever it runs a command that changes the drive.  The default ttl of 0
+    disables the snapshot, every lookup reads the drive.
+    """
+    #: default number of seconds a snapshot is considered fresh, 0 for none
+    ttl = 0
+
+    def __init__(self, shelf, slot, runner, ttl=None):
         assert isinstance(slot, int)
         self.shelf = shelf
         self.slot = slot
         self.runner = runner
+        if ttl is not None:
+            self.ttl = ttl
+        self._snapshot = None
+        self._stamp = 0.0
         super(Drive, self).__init__()
 
     def __iter__(self):
@@ -308,6 +447,8 @@ class Drive(dict):
             return None
 
     def __getattr__(self, item):
+        if item.startswith('_'):
+            raise AttributeError(item)
         vals = self._get_data()
 
         if item in vals:
@@ -318,7 +459,23 @@ class Drive(dict):
     def get(self, item):
         return self._get_data().get(item)
 
+    def invalidate(self):
+        """
+        Drop the current snapshot, the next lookup will query the drive.
+        """
+        self._snapshot = None
+
+    def refresh(self):
+        """
+        Query the drive now and return the new snapshot.
+        """
+        self.invalidate()
+        return self._get_data()
+
     def _get_data(self):
+        if self._snapshot is not None and time() - self._stamp < self.ttl:
+            return self._snapshot
+
         ddict = dict()
         cmd = 'drives -j %s.%s' % (self.shelf, self.slot)
         ret = self.runner(cmd)
@@ -333,4 +490,75 @@ class Drive(dict):
             if value.strip().startswith("'"):
                 value = value.lstrip("'").rstrip("'").strip()
             ddict[key] = value
+        self._snapshot = ddict
+        self._stamp = time()
         return ddict
+
+
+class _Background(object):
+    """
+    Base of the objects that run a job in a daemon thread::
+
+        job.run()
+        # do other things
+        job.wait()  # or use an 'if not job.done:' control struct
+        job.result
+
+    Subclasses implement _work, which runs in the thread and leaves its
+    outcome in self._result.
+    """
+    #: name of the thread, None for the threading default
+    thread_name = None
+
+    def __init__(self):
+        self.started = False
+        self.p = None
+        self._result = None
+        self._finished = threading.Event()
+
+    def _work(self):
+        raise NotImplementedError
+
+    def _runcmd(self):
+        """
+        this private method is executed as a thread
+        """
+        try:
+            self._work()
+        finally:
+            self._finished.set()
+
+    def run(self):
+        """
+        start the job
+        """
+        self.p = threading.Thread(target=self._runcmd, name=self.thread_name)
+        self.p.daemon = True
+        self.started = True
+        self.p.start()
+
+    @property
+    def done(self):
+        """
+        :return: whether or not the job is complete
+        :rtype: bool
+        """
+        return self._finished.is_set()
+
+    def wait(self):
+        """
+        This is basically join.  It blocks until the job is done.
+        :return: the result
+        """
+        while not self._finished.wait(1):  # a bounded wait stays interruptible
+            pass
+        return self.result
+
+    @property
+    def result(self):
+        """
+        ReturnCode of the job, False until it is done
+        """
+        if not self.done:
+            return ReturnCode(False, message="Not done yet")
+        return self._result
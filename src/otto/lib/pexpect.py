@@ -252,6 +252,8 @@ class spawn(object):
         self.maxread = maxread  # max bytes to read at one time into buffer
         self.buffer = ''  # This is the read buffer. See maxread.
         self.searchwindowsize = searchwindowsize  # Anything before searchwindowsize point is preserved, but not searched.
+        self.searchoverlap = 4096  # Bytes of already searched data that expect searches again with each fresh read.
+        self.readchunk = 65536  # max bytes expect drains from the child per wakeup.
         # Most Linux machines don't like delaybeforesend to be below 0.03 (30 ms).
         self.delaybeforesend = 0.05  # Sets sleep time used just before sending data to child. Time in seconds.
         self.delayafterclose = 0.1  # Sets delay in close() method to allow kernel time to update process status. Time in seconds.
@@ -1160,17 +1162,20 @@ class spawn(object):
         if searchwindowsize == -1:
             searchwindowsize = self.searchwindowsize
 
+        # The buffer grows in place and each pass searches only what was just
+        # read plus searchoverlap bytes before it, so a large output costs
+        # linear rather than quadratic time.
+        incoming = bytearray(self.buffer)
+        overlap = max(self.searchoverlap, searcher.overlap)
+        poller = self.__poller()
         try:
-            incoming = self.buffer
             freshlen = len(incoming)
-            # logger.debug("RX(" + str(freshlen) + "B): " + incoming.encode("hex") + "\t" + incoming)
-            # logger.debug("RX(" + str(freshlen) + "B):" + "\t" + incoming)
             while True:  # Keep reading until exception or return.
-                index = searcher.search(incoming, freshlen, searchwindowsize)
+                index = searcher.search(incoming, freshlen, searchwindowsize, overlap)
                 if index >= 0:
-                    self.buffer = incoming[searcher.end:]
-                    self.before = incoming[: searcher.start]
-                    self.after = incoming[searcher.start: searcher.end]
+                    self.buffer = str(incoming[searcher.end:])
+                    self.before = str(incoming[: searcher.start])
+                    self.after = str(incoming[searcher.start: searcher.end])
                     self.match = searcher.match
                     self.match_index = index
                     return self.match_index
@@ -1178,13 +1183,13 @@ class spawn(object):
                 if timeout < 0 and timeout is not None:
                     raise TIMEOUT('Timeout exceeded in expect_any().')
                     # Still have time left, so read more data
-                c = self.read_nonblocking(self.maxread, timeout)
-                freshlen = len(c)
-                time.sleep(0.0001)
-                incoming = incoming + c
+                c = self.read_nonblocking(max(self.maxread, self.readchunk), timeout)
+                incoming += c
+                freshlen = len(c) + self.__drain(poller, incoming, self.readchunk - len(c))
                 if timeout is not None:
                     timeout = end_time - time.time()
         except EOF as e:
+            incoming = str(incoming)
             self.buffer = ''
             self.before = incoming
             self.after = EOF
@@ -1198,6 +1203,7 @@ class spawn(object):
                 self.match_index = None
                 raise EOF(str(e) + '\n' + str(self))
         except TIMEOUT as e:
+            incoming = str(incoming)
             self.buffer = incoming
             self.before = incoming
             self.after = TIMEOUT
@@ -1211,7 +1217,7 @@ class spawn(object):
                 self.match_index = None
                 raise TIMEOUT(str(e) + '\n' + str(self))
         except:
-            self.before = incoming
+            self.before = str(incoming)
             self.after = None
             self.match = None
             self.match_index = None
@@ -1338,6 +1344,46 @@ class spawn(object):
                     break
                 self.__interact_writen(self.child_fd, data)
 
+    def __poller(self):
+        """
+        This returns a select.poll object watching child_fd, or None on
+        platforms without poll().
+        """
+
+        if not hasattr(select, 'poll') or self.child_fd < 0:
+            return None
+        poller = select.poll()
+        poller.register(self.child_fd, select.POLLIN)
+        return poller
+
+    def __drain(self, poller, buf, size):
+        """
+        This appends up to size characters that the child has already written
+        to buf without waiting and returns how many were read. End of file or
+        an error stops the drain; the next read_nonblocking() reports it.
+        """
+
+        total = 0
+        while total < size:
+            if poller is not None:
+                try:
+                    ready = poller.poll(0)
+                except select.error:
+                    break
+            else:
+                ready = self.__select([self.child_fd], [], [], 0)[0]
+            if not ready:
+                break
+            try:
+                s = os.read(self.child_fd, size - total)
+            except OSError:
+                break
+            if not s:
+                break
+            buf += s
+            total += len(s)
+        return total
+
     @staticmethod
     def __select(iwtd, owtd, ewtd, timeout=None):
         """
@@ -1391,9 +1437,6 @@ class searcher_string(object):
         may be a list; a sequence of strings; or the EOF or TIMEOUT types.
         """
 
-        self.start = first_match
-        self.match = best_match
-        self.end = self.start + len(self.match)
         self.eof_index = -1
         self.timeout_index = -1
         self._strings = []
@@ -1405,6 +1448,8 @@ class searcher_string(object):
                 self.timeout_index = n
                 continue
             self._strings.append((n, s))
+        # a match may begin this far back in data that was already searched
+        self.overlap = max([len(s) for n, s in self._strings] or [0])
 
     def __str__(self):
         """
@@ -1422,14 +1467,16 @@ class searcher_string(object):
         ss = zip(*ss)[1]
         return '\n'.join(ss)
 
-    def search(self, buf, freshlen, searchwindowsize=None):
+    def search(self, buf, freshlen, searchwindowsize=None, overlap=None):
         """
         This searches 'buf' for the first occurence of one of the search
         strings.  'freshlen' must indicate the number of bytes at the end of
         'buf' which have not been searched before. It helps to avoid
         searching the same, possibly big, buf over and over again.
 
-        See class spawn for the 'searchwindowsize' argument.
+        See class spawn for the 'searchwindowsize' argument. 'overlap' is
+        accepted for symmetry with searcher_re; a string match can never
+        begin further back than its own length before the fresh data.
 
         If there is a match this returns the index of that string, and sets
         'start', 'end' and 'match'. Otherwise, this returns -1.
@@ -1464,6 +1511,9 @@ class searcher_string(object):
                 best_index, best_match = index, s
         if first_match == absurd_match:
             return -1
+        self.start = first_match
+        self.match = best_match
+        self.end = self.start + len(self.match)
         return best_index
 
 
@@ -1494,9 +1544,6 @@ class searcher_re(object):
         expressions, or the EOF or TIMEOUT types.
         """
 
-        self.start = first_match
-        self.match = the_match
-        self.end = self.match.end()
         self.eof_index = -1
         self.timeout_index = -1
         self._searches = []
@@ -1508,6 +1555,7 @@ class searcher_re(object):
                 self.timeout_index = n
                 continue
             self._searches.append((n, s))
+        self.overlap = 0
 
     def __str__(self):
         """
@@ -1525,13 +1573,20 @@ class searcher_re(object):
         ss = zip(*ss)[1]
         return '\n'.join(ss)
 
-    def search(self, buf, freshlen, searchwindowsize=None):
+    def search(self, buf, freshlen, searchwindowsize=None, overlap=None):
         """
         This searches 'buf' for the first occurence of one of the regular
         expressions. 'freshlen' must indicate the number of bytes at the end of
         'buf' which have not been searched before.
 
-        See class spawn for the 'searchwindowsize' argument.
+        See class spawn for the 'searchwindowsize' argument. If 'overlap' is
+        given and there is no searchwindowsize, only the fresh data and the
+        'overlap' bytes before it are searched, so a match can not begin
+        further back than that.
+
+        'buf' may be a bytearray; the match is then found in place and only
+        rebuilt against a str copy once it is known, so 'match' always holds
+        str groups.
 
         If there is a match this returns the index of that string, and sets
         'start', 'end' and 'match'. Otherwise, returns -1.
@@ -1539,12 +1594,14 @@ class searcher_re(object):
 
         absurd_match = len(buf)
         first_match = absurd_match
-        # 'freshlen' doesn't help here -- we cannot predict the
-        # length of a match, and the re module provides no help.
-        if searchwindowsize is None:
-            searchstart = 0
-        else:
+        # we cannot predict the length of a match, so without a
+        # searchwindowsize the caller bounds how far back it may start.
+        if searchwindowsize is not None:
             searchstart = max(0, len(buf) - searchwindowsize)
+        elif overlap is not None:
+            searchstart = max(0, len(buf) - freshlen - overlap)
+        else:
+            searchstart = 0
         for index, s in self._searches:
             match = s.search(buf, searchstart)
             if match is None:
@@ -1556,6 +1613,12 @@ class searcher_re(object):
                 best_index = index
         if first_match == absurd_match:
             return -1
+        if not isinstance(buf, str):
+            # the same search from the same start finds the same match
+            the_match = the_match.re.search(str(buf), first_match)
+        self.start = first_match
+        self.match = the_match
+        self.end = self.match.end()
         return best_index
 
 
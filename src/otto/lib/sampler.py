@@ -0,0 +1,255 @@
+"""
+Background performance sampling of an SRX during long running tests.
+
+The sampler polls Srx.iostats and Srx.sysstat at a fixed interval and stores
+the values as floats in fixed size ring buffers, so a soak run of any length
+uses bounded memory::
+
+    mon = Srx(shelf, iface)         # a connection used only by the sampler
+    mon.connect()
+    sampler = ApplianceSampler(mon, interval=5)
+    sampler.start()
+    ...                             # run fio
+    sampler.stop()
+    print sampler.percentiles(('iostats', '10'), 'read_avg', (50, 99))
+    print sampler.overhead()
+    sampler.export_csv('iostats.csv')
+
+The sampler's console commands must not share a connection with the test, use
+a dedicated Srx object.  The time each scrape takes and how late each sample
+starts relative to its schedule are recorded so their effect on the appliance
+console can be reported with overhead().
+"""
+import csv
+import logging
+import os
+import threading
+from array import array
+from time import time
+
+from otto.lib.compute import average, percentile
+
+instance = os.environ.get('instance') or ''
+logger = logging.getLogger('otto' + instance + '.lib')
+logger.addHandler(logging.NullHandler())
+
+NAN = float('nan')
+
+
+class Ring(object):
+    """
+    A fixed capacity ring of rows of floats backed by a single array('d').
+    Once full the oldest row is overwritten.
+    """
+
+    def __init__(self, capacity, width, fill=0):
+        self.capacity = capacity
+        self.width = width
+        self.data = array('d', [NAN] * (capacity * width))
+        self.head = 0  # next row to write
+        self.count = 0
+        # rows appended before this ring existed, used to align late series
+        for _ in range(fill):
+            self.append([NAN] * width)
+
+    @property
+    def nbytes(self):
+        return self.data.itemsize * len(self.data)
+
+    def append(self, row):
+        base = self.head * self.width
+        for i, v in enumerate(row):
+            self.data[base + i] = v
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _indexes(self):
+        start = (self.head - self.count) % self.capacity
+        return [(start + i) % self.capacity for i in range(self.count)]
+
+    def rows(self):
+        """
+        Returns the rows oldest first as a list of tuples.
+        """
+        w = self.width
+        return [tuple(self.data[i * w:(i + 1) * w]) for i in self._indexes()]
+
+    def column(self, col):
+        """
+        Returns one column oldest first as a list.
+        """
+        return [self.data[i * self.width + col] for i in self._indexes()]
+
+
+class ApplianceSampler(threading.Thread):
+    """
+    Poll an Srx's iostats and sysstat every interval seconds in a daemon thread.
+
+    Series are keyed by (command, id), eg. ('iostats', '10'), ('iostats', '10.0.1')
+    or ('sysstat', '0'), and each holds the fields in IOSTATS or SYSSTAT.  At most
+    capacity samples are kept; new series that would take the buffers past
+    max_bytes are dropped with a warning.
+    """
+    IOSTATS = ('read_MB', 'read_avg', 'read_max', 'write_MB', 'write_avg', 'write_max')
+    SYSSTAT = ('idle', 'int')
+    TICK = ('scheduled', 'start', 'cost')
+
+    def __init__(self, sr, interval=5.0, capacity=17280, max_bytes=64 * 1024 * 1024,
+                 iostats=True, sysstat=True):
+        super(ApplianceSampler, self).__init__(name='sampler-%s' % getattr(sr, 'shelf', ''))
+        self.daemon = True
+        self.sr = sr
+        self.interval = float(interval)
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.commands = [c for c, on in (('iostats', iostats), ('sysstat', sysstat)) if on]
+        self.ticks = Ring(capacity, len(self.TICK))
+        self.series = dict()
+        self.dropped = set()
+        self.errors = 0
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.ticks.nbytes + sum(r.nbytes for r in self.series.values())
+
+    def fields(self, key):
+        return self.IOSTATS if key[0] == 'iostats' else self.SYSSTAT
+
+    def run(self):
+        start = time()
+        n = 0
+        while not self._stopped.is_set():
+            scheduled = start + n * self.interval
+            self._stopped.wait(max(0, scheduled - time()))
+            if self._stopped.is_set():
+                break
+            self.sample(scheduled)
+            # skip the slots a slow scrape overran
+            n = max(n + 1, int((time() - start) / self.interval) + 1)
+
+    def stop(self, timeout=None):
+        """
+        Stop sampling and wait for the sampler thread to finish.
+        """
+        self._stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def sample(self, scheduled=None):
+        """
+        Take one sample now.  This is what the thread runs every interval, it
+        can also be called directly when not started.
+        """
+        t0 = time()
+        if scheduled is None:
+            scheduled = t0
+        rows = dict()
+        try:
+            if 'iostats' in self.commands:
+                for i, d in self.sr.iostats.iteritems():
+                    rows[('iostats', i)] = [float(d['read']['MB']), float(d['read']['avg']),
+                                            float(d['read']['max']), float(d['write']['MB']),
+                                            float(d['write']['avg']), float(d['write']['max'])]
+            if 'sysstat' in self.commands:
+                for cpu, d in self.sr.sysstat.iteritems():
+                    rows[('sysstat', cpu)] = [float(d.get('idle%', NAN)), float(d.get('int%', NAN))]
+        except Exception as e:  # keep sampling through transient console errors
+            self.errors += 1
+            logger.error("sampler: %s" % e)
+        cost = time() - t0
+
+        with self._lock:
+            for key in rows:
+                if key not in self.series and key not in self.dropped:
+                    need = self.capacity * len(self.fields(key)) * 8
+                    if self.nbytes + need > self.max_bytes:
+                        logger.warning("sampler: memory cap reached, not recording %s" % str(key))
+                        self.dropped.add(key)
+                        continue
+                    self.series[key] = Ring(self.capacity, len(self.fields(key)), fill=self.ticks.count)
+            self.ticks.append([scheduled, t0, cost])
+            for key, ring in self.series.iteritems():
+                ring.append(rows.get(key) or [NAN] * ring.width)
+
+    def times(self):
+        """
+        Returns the start time of every sample, oldest first.
+        """
+        return self.ticks.column(1)
+
+    def values(self, key, field, window=None):
+        """
+        Returns the recorded values of a field oldest first, limited to the
+        last window seconds if given.  Missing samples are left out.
+        """
+        with self._lock:
+            ring = self.series.get(key)
+            if ring is None:
+                return list()
+            vals = ring.column(self.fields(key).index(field))
+            times = self.times()
+        if window is not None and times:
+            vals = [v for t, v in zip(times, vals) if t >= times[-1] - window]
+        return [v for v in vals if v == v]  # drop NaN
+
+    def rate(self, key, direction='read', window=None):
+        """
+        Returns the average MB/s of a lun or disk over the window.
+        """
+        vals = self.values(key, '%s_MB' % direction, window)
+        return average(vals) if vals else NAN
+
+    def percentiles(self, key, field, pcts=(50, 90, 99), window=None):
+        """
+        Returns {pct: value} for a field over the window.
+        """
+        vals = self.values(key, field, window)
+        return dict((p, percentile(vals, p) if vals else NAN) for p in pcts)
+
+    def overhead(self):
+        """
+        Returns the number of samples and the mean, 99th percentile and max of
+        the time each scrape took ('cost') and how late it started ('jitter'),
+        in seconds.
+        """
+        with self._lock:
+            rows = self.ticks.rows()
+        report = {'samples': len(rows), 'errors': self.errors, 'interval': self.interval}
+        for name, vals in (('cost', [r[2] for r in rows]), ('jitter', [r[1] - r[0] for r in rows])):
+            if vals:
+                report[name] = {'mean': average(vals), 'p99': percentile(vals, 99), 'max': max(vals)}
+        return report
+
+    def _columns(self):
+        keys = sorted(self.series)
+        names = ['%s:%s:%s' % (k[0], k[1], f) for k in keys for f in self.fields(k)]
+        cols = [self.series[k].column(i) for k in keys for i in range(len(self.fields(k)))]
+        return names, cols
+
+    def export_csv(self, fname):
+        """
+        Write the samples to a csv file with one row per sample.
+        """
+        with self._lock:
+            names, cols = self._columns()
+            times = self.times()
+        with open(fname, 'wb') as f:
+            w = csv.writer(f)
+            w.writerow(['time'] + names)
+            for i, t in enumerate(times):
+                w.writerow([t] + [c[i] for c in cols])
+
+    def export_npz(self, fname):
+        """
+        Write the samples to a numpy .npz file, one array per column plus 'time'.
+        Requires numpy.
+        """
+        import numpy as np
+
+        with self._lock:
+            names, cols = self._columns()
+            times = self.times()
+        arrays = dict((n, np.array(c)) for n, c in zip(names, cols))
+        np.savez(fname, time=np.array(times), **arrays)
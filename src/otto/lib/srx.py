@@ -5,7 +5,6 @@ A collection of functions to simplfy common SRX operations
 """
 import logging
 import os
-import re
 import socket
 from time import sleep, time
 from random import sample
@@ -63,22 +62,24 @@ def get_luns(sr):
     return list(available)
 
 
-def is_inited(sr, lun):
+def is_inited(sr, lun, snap=None):
     """
     check if a lun's parity is built
 
     :param sr: an srx object
     :param lun: a lun number as int or str
+    :param snap: an optional Srx.snapshot() to use instead of querying the srx
 
     :return: return code with number of seconds until done in message field
     """
     result = ReturnCode(False)
     lun = str(lun)
-    l = sr.list.get(lun)
+    src = snap or sr
+    l = src.list.get(lun)
     if not l:
         raise ApplianceUsage("lun not found '%s'" % lun)
     if l.get('state') == 'initing':
-        t = sr.when.get(lun)
+        t = src.when.get(lun)
         if t:
             t = t['time']  # mmmmm
         result = ReturnCode(False, get_sec(t))
@@ -89,7 +90,7 @@ def is_inited(sr, lun):
         if component.get('state') == 'initing':
             result.status = False
             lc = "%s.%s" % (lun, component['number'])
-            wt = sr.when.get(lc)
+            wt = src.when.get(lc)
             if wt:
                 t = wt['time'] or '0:0:0'
             else:
@@ -121,16 +122,55 @@ def wait_is_inited(sr, lun, usetime=False):
     return ret
 
 
-def is_recovering(sr, lun):
+def wait_is_inited_event(sr, lun, timeout=86400):
+    """
+    Wait until a lun's parity is built, blocking on the srx's 'building parity'
+    asynchronous messages between checks instead of polling.  Falls back to
+    wait_is_inited for connections that do not capture async messages.
+
+    :param sr: an srx object
+    :param lun: a lun number as int or str
+    :param timeout: seconds to wait
+    """
+    if getattr(sr, 'events', None) is None:
+        return wait_is_inited(sr, lun)
+    lun = str(lun)
+    return _wait_event(sr, lun, lambda: is_inited(sr, lun),
+                       r"building parity (complete|aborted): %s\.[0-9]+" % lun, timeout)
+
+
+def _wait_event(sr, lun, check, pattern, timeout):
+    """
+    Run check until it is True, waiting for an async message matching pattern
+    in between.
+    """
+    deadline = time() + timeout
+    since = time()
+    result = check()
+    while not result:
+        remaining = deadline - time()
+        if remaining <= 0:
+            return ReturnCode(False, "Timed out : {0} seconds".format(timeout))
+        ev = sr.wait_for_event(pattern, timeout=remaining, since=since)
+        if not ev:
+            return ev
+        logger.info("lun %s: %s", lun, ev.message)
+        since = time()
+        result = check()
+    return result
+
+
+def is_recovering(sr, lun, snap=None):
     """
     Is this lun recovering?
 
     :param sr: an srx object
     :param lun: a lun number as str
+    :param snap: an optional Srx.snapshot() to use instead of querying the srx
     :return: returnCode with lun state as message
     """
     result = ReturnCode(False)
-    l = sr.list.get(lun)
+    l = (snap or sr).list.get(lun)
     if l:
         if sr.version >= 7:
             if l['state'].find('recovering') != -1:
@@ -158,9 +198,35 @@ def wait_is_recovering(sr, lun):
     return is_recovering(sr, lun)
 
 
-def is_degraded(sr, lun):
+def wait_is_recovering_event(sr, lun, timeout=86400):
+    """
+    Wait until this lun is recovering, blocking on the srx's 'beginning
+    recovery' asynchronous messages between checks instead of polling every
+    minute.  Falls back to wait_is_recovering for connections that do not
+    capture async messages.
+
+    :param sr: an srx object
+    :param lun: a lun number as str
+    :param timeout: seconds to wait
+    :return: returnCode with lun state as message
+    """
+    if getattr(sr, 'events', None) is None:
+        return wait_is_recovering(sr, lun)
+    return _wait_event(sr, lun, lambda: is_recovering(sr, lun),
+                       r"beginning recovery of .*\b%s\.[0-9]+\.[0-9]+" % lun, timeout)
+
+
+def is_degraded(sr, lun, snap=None):
+    """
+    Is this lun degraded?
+
+    :param sr: an srx object
+    :param lun: a lun number as str
+    :param snap: an optional Srx.snapshot() to use instead of querying the srx
+    :return: returnCode with lun state as message
+    """
     result = ReturnCode(False)
-    l = sr.list.get(lun)
+    l = (snap or sr).list.get(lun)
     if l:
         if sr.version >= 7:
             if l['state'].find('degraded') != -1:
@@ -194,9 +260,17 @@ def wait_is_online(sr, lun):
     return is_online(sr, lun)
 
 
-def is_failed(sr, lun):
+def is_failed(sr, lun, snap=None):
+    """
+    Is this lun failed?
+
+    :param sr: an srx object
+    :param lun: a lun number as str
+    :param snap: an optional Srx.snapshot() to use instead of querying the srx
+    :return: returnCode with lun state as message
+    """
     result = ReturnCode(False)
-    l = sr.list.get(lun)
+    l = (snap or sr).list.get(lun)
     if l:
         if sr.version >= 7:
             if l['state'].find('failed') != -1:
@@ -420,14 +494,12 @@ def rdfail_preboot(sr, lun, disk=None):
     if not _kfscmd(sr, 'allow'):
         return result
 
-    # Lets get the info from the lun we want to fail a disk
-    l = sr.list.get(lun)
+    # Lets get the drives of the lun we want to fail a disk
+    for drive in sr.list.drives(lun):
+        slot = drive.split('.')[1]
 
-    for c in l['raids'][0]['components']:
-        regExp = re.search(r'd+.(d+)', c['device'])
-
-        if regExp and (regExp.group(1) == disk or disk is None):
-            disk2fail = regExp.group(1)
+        if slot == disk or disk is None:
+            disk2fail = slot
             if sr.version >= 7:
                 cmd = "echo \'echo rdfail on > /n/raiddev/%s/ctl\' > /n/kfs/srx/srlocal0" % disk2fail
             else:
@@ -457,18 +529,18 @@ def rdfail(sr, lun, disk=None):
 
     result = ReturnCode(False)
 
-    # Lets get the info from the lun we want to fail a disk
-    l = sr.list.get(lun)
+    # Lets get the drives of the lun we want to fail a disk
+    luns = sr.list
 
-    if not l:
+    if lun not in luns:
         result.message = "Seems like lun %s does not exist" % lun
         return result
 
-    for c in l['raids'][0]['components']:
-        regExp = re.search(r'd+.(d+)', c['device'])
+    for drive in luns.drives(lun):
+        slot = drive.split('.')[1]
 
-        if regExp and (regExp.group(1) == disk or disk is None):
-            disk2fail = regExp.group(1)
+        if slot == disk or disk is None:
+            disk2fail = slot
             cmd = "echo rdfail on > /raiddev/%s/ctl" % disk2fail
 
             if sr.version >= 7:
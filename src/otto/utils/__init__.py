@@ -9,6 +9,7 @@
 """
 from __future__ import print_function
 import os
+import re
 import logging
 import time
 import shutil
@@ -502,3 +503,22 @@ def overlay_dicts(dict1, dict2):
         ret[k] = v
     return ret
 
+
+
+def split_marked(text, marker, lineterm='\r*\n'):
+    """
+    Split the output of a pipelined command line where each command was
+    preceded by 'echo <marker> <key>' into an OrderedDict of::
+
+        {key: [line, ...]}
+
+    Lines before the first marker are dropped.
+    """
+    sections = OrderedDict()
+    current = None
+    for line in re.split(lineterm, text):
+        if line.startswith(marker):
+            current = sections.setdefault(line[len(marker):].strip(), list())
+        elif current is not None:
+            current.append(line)
+    return sections
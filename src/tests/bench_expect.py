@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of Cec.run and Ssh.run on multi-megabyte outputs.
+
+Both classes are attached to a local /bin/sh standing in for the appliance
+console, which then cats a generated file, so only the expect engine is
+measured.  Each size is timed with the previous expect_loop (string
+concatenation, a 0.1ms sleep per read and a rescan of the whole buffer) and
+with the current one::
+
+    python tests/bench_expect.py 1 4 16
+
+"""
+import os
+import sys
+import tempfile
+import time
+
+from otto.connections.cec import Cec
+from otto.connections.ssh_pexpect import Ssh
+from otto.lib.pexpect import spawn, TIMEOUT
+
+PROMPT = 'BENCH> '
+
+
+def legacy_expect_loop(self, searcher, timeout=-1, searchwindowsize=-1):
+    """
+    expect_loop as it was before the bytearray rewrite.
+    """
+    self.searcher = searcher
+    if timeout == -1:
+        timeout = self.timeout
+    if timeout is not None:
+        end_time = time.time() + timeout
+    if searchwindowsize == -1:
+        searchwindowsize = self.searchwindowsize
+    incoming = self.buffer
+    freshlen = len(incoming)
+    while True:
+        index = searcher.search(incoming, freshlen, searchwindowsize)
+        if index >= 0:
+            self.buffer = incoming[searcher.end:]
+            self.before = incoming[: searcher.start]
+            self.after = incoming[searcher.start: searcher.end]
+            self.match = searcher.match
+            self.match_index = index
+            return self.match_index
+        if timeout < 0 and timeout is not None:
+            raise TIMEOUT('Timeout exceeded in expect_any().')
+        c = self.read_nonblocking(self.maxread, timeout)
+        freshlen = len(c)
+        time.sleep(0.0001)
+        incoming = incoming + c
+        if timeout is not None:
+            timeout = end_time - time.time()
+
+
+def console(cls):
+    """
+    Returns an instance of cls connected to a local shell.
+    """
+    if cls is Cec:
+        c = Cec(0, 'lo', prompt=PROMPT)
+    else:
+        c = Ssh('bench', 'localhost', None, PROMPT)
+        c.connected = True
+    env = dict(os.environ, PS1=PROMPT)
+    spawn.__init__(c, '/bin/sh', [], timeout=600, env=env)
+    c.expect_exact(PROMPT)
+    return c
+
+
+def bench(cls, fname, loop):
+    saved = spawn.expect_loop
+    spawn.expect_loop = loop
+    try:
+        c = console(cls)
+        start = time.time()
+        out = c.run('cat %s' % fname, timeout=600)
+        elapsed = time.time() - start
+        c.close(force=True)
+    finally:
+        spawn.expect_loop = saved
+    return elapsed, len(out)
+
+
+def main(sizes):
+    line = 'd' * 79 + '\n'
+    for mb in sizes:
+        fd, fname = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write(line * (mb * 1024 * 1024 / len(line)))
+        try:
+            for cls in (Cec, Ssh):
+                old, n = bench(cls, fname, legacy_expect_loop)
+                new, m = bench(cls, fname, saved_loop)
+                assert n == m, "outputs differ: %d != %d" % (n, m)
+                print "%-4s %4d MB  before %8.2fs %8.1f MB/s  after %8.2fs %8.1f MB/s" % (
+                    cls.__name__, mb, old, mb / old, new, mb / new)
+        finally:
+            os.remove(fname)
+
+
+saved_loop = spawn.expect_loop
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [1, 4])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Benchmark fanning one command out to many simulated hosts.
+
+The local ssh server stand-in (tests/sshstub.py) runs in its own process and
+answers every command after delay seconds; each simulated host is a distinct
+user, so it gets its own TCP connection, key exchange and authentication.
+Compared are a process per host as parallelCmd used to do, and
+fanout.Runner with a bounded thread pool, with and without the connection
+pool::
+
+    python tests/bench_fanout.py [hosts] [delay] [max_workers]
+
+"""
+import sys
+from multiprocessing import Process, Queue
+from time import time, sleep
+
+import paramiko
+
+from otto.connections.fanout import Runner, wait
+from otto.connections.pool import pool
+from otto.lib.compute import percentile
+from tests.sshstub import SshStub
+
+
+def serve(delay, q):
+    server = SshStub(delay=delay).start()
+    q.put(server.port)
+    while True:
+        sleep(60)
+
+
+def one_process(port, user, q):
+    """
+    What the old parallelCmd did in its child process.
+    """
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect('127.0.0.1', port, user, 'x')
+    _, out, err = client.exec_command('echo $USER')
+    err.read()
+    q.put(out.read())
+    client.close()
+
+
+def processes(port, n):
+    q = Queue()
+    procs = [Process(target=one_process, args=(port, 'host%03d' % i, q)) for i in range(n)]
+    for p in procs:
+        p.start()
+    out = [q.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return out
+
+
+def main(n=200, delay=0.1, max_workers=64):
+    q = Queue()
+    server = Process(target=serve, args=(delay, q))
+    server.daemon = True
+    server.start()
+    port = q.get()
+    hosts = [('127.0.0.1', 'host%03d' % i, 'x', port) for i in range(n)]
+    try:
+        start = time()
+        processes(port, n)
+        t_proc = time() - start
+
+        runs = list()
+        for pooled in (True, False):
+            start = time()
+            with Runner(max_workers=max_workers, pooled=pooled) as r:
+                futures = r.run(hosts, 'echo $USER')
+                wait(futures)
+            runs.append((pooled, time() - start, futures))
+            pool.close_all()
+    finally:
+        server.terminate()
+    print "%d hosts, %.0fms server delay" % (n, delay * 1000)
+    print "process per host              %7.2fs" % t_proc
+    for pooled, t_runner, futures in runs:
+        failed = [f for f in futures if not f.result()]
+        totals = [f.timing['total'] for f in futures]
+        connects = [f.timing['connect'] for f in futures]
+        print "Runner(%3d workers, pooled=%d) %7.2fs  %d failed" % (max_workers, pooled, t_runner, len(failed))
+        print "  per host connect p50 %.3fs p99 %.3fs, total p50 %.3fs p99 %.3fs" % (
+            percentile(connects, 50), percentile(connects, 99), percentile(totals, 50), percentile(totals, 99))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200, float(args[1]) if len(args) > 1 else 0.1,
+         int(args[2]) if len(args) > 2 else 64)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Benchmark merging fio json+ latency histograms of many jobs::
+
+    python tests/bench_latency.py [jobs] [bins per job]
+
+Each job gets bins from the range of fio's bucket values.  Shown for numpy
+and plain Python are the time to add up every job's bins in one from_bins,
+and the time to turn each report into a Histogram and merge those.
+"""
+import random
+import sys
+from time import time
+
+from otto.lib import latency
+from otto.lib.latency import Histogram
+
+
+def fio_buckets():
+    # fio's buckets: 64 per power of two past the first 128 values
+    values = list(range(128))
+    for group in range(1, 29):
+        base = 1 << (group + 6)
+        values.extend(base + i * (base >> 6) for i in range(64))
+    return values
+
+
+def main(jobs=5000, nbins=300):
+    rng = random.Random(1)
+    buckets = fio_buckets()[500:1400]
+    reports = [{'jobs': [{'read': {'clat_ns': {'bins': dict((str(v), rng.randint(1, 1000))
+                                                            for v in rng.sample(buckets, nbins))}}}]}
+               for _ in range(jobs)]
+    print "%d jobs, %d bins each" % (jobs, nbins)
+    saved = latency.numpy
+    for name, numpy in (('numpy', saved), ('python', None)):
+        if name == 'numpy' and numpy is None:
+            continue
+        latency.numpy = numpy
+        start = time()
+        h = Histogram.from_bins(*[r['jobs'][0]['read']['clat_ns']['bins'] for r in reports])
+        p = h.percentiles((50, 99, 99.99))
+        once = time() - start
+        start = time()
+        histograms = [Histogram.from_report(r) for r in reports]
+        parsed = time() - start
+        start = time()
+        assert Histogram.merge(histograms) == h
+        merged = time() - start
+        print "%-6s from_bins %6.3fs | from_report %6.3fs + merge %6.3fs  p50 %d p99 %d p99.99 %d" % (
+            name, once, parsed, merged, p[50.0], p[99.0], p[99.99])
+    latency.numpy = saved
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 5000, int(args[1]) if len(args) > 1 else 300)
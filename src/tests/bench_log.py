@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Benchmark the cost of one lib.log.Log message, written and filtered out::
+
+    python tests/bench_log.py [messages] [stack depth]
+
+Log is at INFO with only its file handler, so info() is written and debug()
+is not.  The calls are made stack depth frames down, as from inside a
+wait_until loop, and are compared with what every call used to cost:
+inspect.stack() and formatting, whether or not the level was enabled.
+"""
+import inspect
+import logging
+import shutil
+import sys
+import tempfile
+from time import time
+
+from otto.lib.log import Dispatcher, Log, formatMesg, INFO, DEBUG
+
+
+def old_debug(log, msg):
+    frame = inspect.stack()[1]
+    msg = formatMesg(msg, DEBUG, frame, Dispatcher.debugFormat)
+    log.logger.debug(msg)
+
+
+def old_info(log, msg):
+    frame = inspect.stack()[1]
+    msg = formatMesg(msg, INFO, frame, Dispatcher.infoFormat)
+    log.logger.info(msg)
+
+
+def nested(depth, fn):
+    if depth:
+        return nested(depth - 1, fn)
+    return fn()
+
+
+def timed(n, depth, fn):
+    def loop():
+        start = time()
+        for i in xrange(n):
+            fn(i)
+        return time() - start
+
+    return nested(depth, loop) / n * 1e6
+
+
+def main(n=20000, depth=20):
+    logdir = tempfile.mkdtemp() + '/'
+    log = Log(level=INFO, name='bench', logdir=logdir, stdout=False)
+    try:
+        print "%d messages, %d frames deep, usec per message" % (n, depth)
+        print "               written  filtered"
+        print "inspect.stack %8.1f %9.1f" % (timed(n, depth, lambda i: old_info(log, 'message %d' % i)),
+                                              timed(n, depth, lambda i: old_debug(log, 'message %d' % i)))
+        print "_getframe     %8.1f %9.1f" % (timed(n, depth, lambda i: log.info('message %d', i)),
+                                              timed(n, depth, lambda i: log.debug('message %d', i)))
+    finally:
+        for handler in list(log.logger.handlers):
+            if not isinstance(handler, logging.NullHandler):
+                log.logger.removeHandler(handler)
+        shutil.rmtree(logdir)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 20000, int(args[1]) if len(args) > 1 else 20)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark rendering a large log as HTML, in memory as format_html used to
+and streamed by render_html, each in a fresh process::
+
+    python tests/bench_log_html.py [lines] [page lines]
+
+Shown are the time and how much the process grew while rendering.
+"""
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+from multiprocessing import Process, Queue
+from time import time
+
+from otto.lib.log import render_html
+
+
+def in_memory(logfile):
+    """
+    format_html before it streamed
+    """
+    html = []
+    errors = []
+    error_count = 0
+    warnings = []
+    warning_count = 0
+    log = open(logfile)
+    htmlFileName = re.sub('.log$', '.html', logfile)
+    for line in log:
+        if re.search('ERROR', line):
+            error_count += 1
+            err = 'err' + str(error_count)
+            errors.append('<a href="#err' + str(error_count) + '">' + str(error_count) + '</a>')
+            html.append('<a name=' + err + ' />' + '<FONT COLOR="#FF0000">' + line +
+                        '</FONT><a href="#top">Back to top</a>\n')
+        elif re.search('WARNING', line):
+            warning_count += 1
+            wrn = 'wrn' + str(warning_count)
+            warnings.append('<a href="#wrn' + str(warning_count) + '">' + str(warning_count) + '</a>')
+            html.append('<a name=' + wrn + ' />' + '<FONT COLOR="#FF9933">' + line +
+                        '</FONT><a href="#top">Back to top</a>\n')
+        else:
+            html.append(line)
+    htmlFile = open(htmlFileName, 'w')
+    htmlFile.write('<HTML>\n<a name="top"/>')
+    htmlFile.write('Errors: ' + ', '.join(errors) + '\n<p/>\n')
+    htmlFile.write('Warnings: ' + ', '.join(warnings) + '\n<p/>\n')
+    htmlFile.write('<br/>'.join(html))
+    htmlFile.write('</HTML>\n')
+    htmlFile.close()
+
+
+def measure(q, fn, args):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time()
+    fn(*args)
+    q.put((time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before))
+
+
+def run(fn, *args):
+    q = Queue()
+    p = Process(target=measure, args=(q, fn, args))
+    p.start()
+    result = q.get()
+    p.join()
+    return result
+
+
+def main(n=1000000, page_lines=100000):
+    tmp = tempfile.mkdtemp()
+    logfile = os.path.join(tmp, 'soak_FULL.log')
+    try:
+        with open(logfile, 'w') as f:
+            for i in xrange(n):
+                level = 'ERROR   ' if i % 1000 == 0 else 'WARNING ' if i % 100 == 0 else 'INFO    '
+                f.write('%s- 2016-01-01 00:00:00,000 - soak.py->loop:42 - iteration %d of the soak run\n' % (level, i))
+        print "%d lines, %.0fMB" % (n, os.path.getsize(logfile) / 1e6)
+        print "                    seconds   grew MB"
+        print "in memory           %7.2f %9.1f" % tuple(v / d for v, d in zip(run(in_memory, logfile), (1, 1024)))
+        print "render_html         %7.2f %9.1f" % tuple(v / d for v, d in zip(run(render_html, logfile), (1, 1024)))
+        print "render_html paged   %7.2f %9.1f" % tuple(v / d for v, d in zip(
+            run(render_html, logfile, None, page_lines), (1, 1024)))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 1000000, int(args[1]) if len(args) > 1 else 100000)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmark finding the errors of one host in a time window of a big log.
+
+n records a millisecond apart from 32 hosts, one in a hundred an error, are
+written through a JsonHandler.  The errors of one host in a window of a
+tenth of the run are then found by scanning the text log with a regex, by
+decoding every line of the JSON log, and with query::
+
+    python tests/bench_log_query.py [records]
+
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+from time import time
+
+from otto.lib.log import JsonHandler, query, ERROR, INFO
+
+
+def main(n=1000000):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'run_FULL.jsonl')
+    text = os.path.join(tmp, 'run_FULL.log')
+    logger = logging.getLogger('otto.bench.query')
+    logger.propagate = False
+    handler = JsonHandler(path)
+    logger.addHandler(handler)
+    t0 = 1500000000.0
+    try:
+        with open(text, 'w') as f:
+            for i in range(n):
+                level = ERROR if i % 100 == 0 else INFO
+                host = 'node%02d' % (i % 32)
+                record = logger.makeRecord(logger.name, level, 'run.py', 42, 'shelf 7 lun %d write 128k', (i,), None,
+                                           extra={'host': host})
+                record.created = t0 + i / 1000.0
+                logger.handle(record)
+                f.write('%s %.3f %s - shelf 7 lun %d write 128k\n' % (logging.getLevelName(level), record.created,
+                                                                      host, i))
+        start, end = t0 + n * 0.45 / 1000, t0 + n * 0.55 / 1000
+        print "%d records, %dMB JSON, %dKB index" % (n, os.path.getsize(path) >> 20,
+                                                     os.path.getsize(path + '.idx') >> 10)
+
+        then = time()
+        pattern = re.compile(r'^ERROR (\S+) node04 ')
+        found = 0
+        with open(text) as f:
+            for line in f:
+                m = pattern.match(line)
+                if m and start <= float(m.group(1)) <= end:
+                    found += 1
+        print "regex scan of text   %7.3fs  %d found" % (time() - then, found)
+
+        then = time()
+        found = 0
+        with open(path) as f:
+            for line in f:
+                r = json.loads(line)
+                if r['level'] == 'ERROR' and r['host'] == 'node04' and start <= r['time'] <= end:
+                    found += 1
+        print "decode every line    %7.3fs  %d found" % (time() - then, found)
+
+        then = time()
+        found = len(list(query(path, start, end, level=ERROR, host='node04')))
+        print "query                %7.3fs  %d found" % (time() - then, found)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Benchmark Log(multiFile=True) writing its files from the calling thread
+against Log(queued=True) handing them to a writer thread::
+
+    python tests/bench_log_queue.py [messages] [flush delay ms]
+
+Every flush of a log file sleeps flush delay ms, standing in for a result
+directory on a slow NFS server.  Shown are the caller's time per message,
+mean and 99th percentile, and the throughput until everything is on disk.
+"""
+import logging
+import shutil
+import sys
+import tempfile
+from time import sleep, time
+
+from otto.lib.compute import percentile
+from otto.lib.log import Log, INFO
+
+
+class SlowFile(object):
+    def __init__(self, f, delay):
+        self.f = f
+        self.delay = delay
+
+    def write(self, data):
+        self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+        sleep(self.delay)
+
+    def close(self):
+        self.f.close()
+
+
+def run(n, delay, queued):
+    logdir = tempfile.mkdtemp() + '/'
+    log = Log(level=INFO, name='bench', logdir=logdir, stdout=False, multiFile=True, queued=queued)
+    for handler in log.fileHandlers:
+        handler.stream = SlowFile(handler.stream, delay)
+    calls = list()
+    try:
+        start = time()
+        for i in xrange(n):
+            t = time()
+            log.info('message %d of %d', i, n)
+            calls.append(time() - t)
+        log.flush()
+        total = time() - start
+    finally:
+        for handler in list(log.logger.handlers):
+            if not isinstance(handler, logging.NullHandler):
+                log.logger.removeHandler(handler)
+                handler.close()
+        shutil.rmtree(logdir)
+    return sum(calls) / n * 1e6, percentile(calls, 99) * 1e6, n / total
+
+
+def main(n=5000, delay_ms=0.2):
+    print "%d messages, %.1fms per flush, 6 files" % (n, delay_ms)
+    print "           mean us   p99 us   msgs/s"
+    for name, queued in (('direct', False), ('queued', True)):
+        print "%-8s %9.1f %8.1f %8.0f" % ((name,) + run(n, delay_ms / 1000.0, queued))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 5000, float(args[1]) if len(args) > 1 else 0.2)
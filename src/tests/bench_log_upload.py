@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmark posting a big log to the web server.
+
+A log of size MB is written and posted to the local HTTP server stand-in
+(tests/httpstub.py), once as Log.post used to, the whole multipart body
+built as a string and sent with urllib2, and once with log.upload streaming
+it gzipped in chunks.  Each runs in a fresh interpreter so its peak RSS is
+its own; the old way is skipped above 512MB::
+
+    python tests/bench_log_upload.py [size MB]
+
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from tests.httpstub import HttpStub
+
+OLD = """
+import resource, sys, time, urllib2
+from otto.lib.log import MultiPartForm
+start = time.time()
+form = MultiPartForm()
+form.add_file('file', 'big.log', open(sys.argv[1]))
+body = str(form)
+request = urllib2.Request(sys.argv[2])
+request.add_header('Content-type', form.get_content_type())
+request.add_header('Content-length', len(body))
+request.add_data(body)
+urllib2.urlopen(request).read()
+print time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+NEW = """
+import resource, sys, time
+from otto.lib.log import MultiPartForm, upload
+start = time.time()
+form = MultiPartForm()
+form.add_path('file', 'big.log', sys.argv[1], compress=True)
+assert upload(sys.argv[2], form)
+print time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+
+def run(code, path, url):
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    seconds, maxrss = subprocess.check_output([sys.executable, '-c', code, path, url], cwd=here).split()
+    return float(seconds), int(maxrss) / 1024.0
+
+
+def main(mb=1024):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'big.log')
+    line = 'INFO     2018-03-01 12:00:00,000 - test.py:42 - shelf 7 lun 3 write 128k at offset %d\n'
+    with open(path, 'w') as f:
+        block = ''.join(line % i for i in range(10000))
+        while f.tell() < mb << 20:
+            f.write(block)
+    server = HttpStub().start()
+    try:
+        print "%dMB log" % (os.path.getsize(path) >> 20)
+        if mb <= 512:
+            print "string + urllib2   %7.2fs  peak RSS %7.1fMB" % run(OLD, path, server.url)
+        else:
+            print "string + urllib2   skipped, it would hold the log three times over"
+        print "upload, gzip       %7.2fs  peak RSS %7.1fMB" % run(NEW, path, server.url)
+        sent = server.uploads[-1]
+        print "  received %dMB, md5 %s" % (sent['size'] >> 20, sent['md5'])
+    finally:
+        server.stop()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Benchmark Client.run_many against one Client.run per command.
+
+A local paramiko server (tests/sshstub.py) answers every command after
+delay seconds, standing in for the round trip to an initiator::
+
+    python tests/bench_run_many.py [commands] [delay] [max_parallel]
+
+"""
+import sys
+from time import time
+
+from otto.connections.ssh import Client
+from tests.sshstub import SshStub
+
+
+def main(n=50, delay=0.02, max_parallel=8):
+    server = SshStub(delay=delay).start()
+    c = Client('127.0.0.1', 'root', 'x', port=server.port)
+    c.connect()
+    cmds = ['echo %d' % i for i in range(n)]
+    try:
+        start = time()
+        serial = [c.run(cmd) for cmd in cmds]
+        t_serial = time() - start
+
+        start = time()
+        parallel = c.run_many(cmds, max_parallel=max_parallel)
+        t_parallel = time() - start
+    finally:
+        c.disconnect()
+        server.stop()
+    assert [r.message for r in serial] == [r.message for r in parallel]
+    print "%d commands, %.0fms server delay" % (n, delay * 1000)
+    print "run       %7.3fs  %6.1fms/command" % (t_serial, t_serial / n * 1000)
+    print "run_many  %7.3fs  %6.1fms/command  (max_parallel=%d)" % (t_parallel, t_parallel / n * 1000,
+                                                                    max_parallel)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 50, float(args[1]) if len(args) > 1 else 0.02,
+         int(args[2]) if len(args) > 2 else 8)
@@ -0,0 +1,150 @@
+"""
+A local HTTP server standing in for the post.py form of the web server in
+tests and benchmarks.  Uploads are taken apart as they arrive and nothing is
+kept but a digest of each file, gunzipped first if its name ends in .gz::
+
+    server = HttpStub(fail=1)       # drop the first upload half way
+    server.start()
+    upload('http://127.0.0.1:%d/cgi-bin/post.py' % server.port, form)
+    server.uploads                  # [{'filename': ..., 'size': ..., 'md5': ...}]
+    server.stop()
+
+"""
+import hashlib
+import re
+import threading
+import zlib
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Drop(Exception):
+    pass
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def body(self):
+        """
+        Yield the request body as it arrives, undoing chunked encoding.
+        """
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            self.server.stub.chunked += 1
+            while True:
+                size = int(self.rfile.readline().split(';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return
+                data = self.rfile.read(size)
+                self.rfile.readline()
+                yield data
+        else:
+            left = int(self.headers.get('Content-Length', 0))
+            while left:
+                data = self.rfile.read(min(left, 65536))
+                left -= len(data)
+                yield data
+
+    def do_POST(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests += 1
+            drop = stub.requests <= stub.fail
+        boundary = re.search('boundary=(.+)', self.headers.get('Content-Type', '')).group(1)
+        try:
+            uploaded = self.parse(self.body(), '\r\n--' + boundary, drop)
+        except _Drop:
+            self.close_connection = 1
+            return
+        with stub.lock:
+            stub.uploads.extend(uploaded)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        for u in uploaded:
+            self.wfile.write('file location: /logs/%s\n' % u['filename'])
+
+    def parse(self, pieces, marker, drop):
+        """
+        Split the multipart body into files with a window no longer than the
+        boundary, digesting each as it goes.
+        """
+        uploaded = list()
+        buf = '\r\n'  # the first boundary has no CRLF in front of it
+        current = None
+        received = 0
+        for piece in pieces:
+            received += len(piece)
+            if drop and received > 65536:
+                raise _Drop()
+            buf += piece
+            while True:
+                if current is None:
+                    end = buf.find('\r\n\r\n')
+                    if end < 0:
+                        break
+                    name = re.search('filename="([^"]*)"', buf[:end])
+                    current = {'filename': name.group(1) if name else None, 'size': 0, 'md5': hashlib.md5(),
+                               'z': zlib.decompressobj(16 + zlib.MAX_WBITS) if name and name.group(1).endswith('.gz') else None}
+                    buf = buf[end + 4:]
+                i = buf.find(marker)
+                if i < 0:
+                    keep = len(marker) - 1
+                    self.feed(current, buf[:-keep])
+                    buf = buf[-keep:]
+                    break
+                self.feed(current, buf[:i])
+                if current['z'] is not None:
+                    self.feed(current, current.pop('z').flush(), raw=True)
+                current.pop('z', None)
+                current['md5'] = current['md5'].hexdigest()
+                uploaded.append(current)
+                current = None
+                buf = buf[i + len(marker):]
+                if buf.startswith('--'):
+                    return uploaded
+        return uploaded
+
+    def feed(self, current, data, raw=False):
+        if not raw and current.get('z') is not None:
+            data = current['z'].decompress(data)
+        current['size'] += len(data)
+        current['md5'].update(data)
+
+
+class HttpStub(object):
+    """
+    A threaded HTTP server on 127.0.0.1.  The first fail uploads are cut
+    off after 64KB without an answer, to exercise retries.
+    """
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.requests = 0
+        self.chunked = 0
+        self.uploads = list()
+        self.lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), StubHandler)
+        self.server.stub = self
+        self.port = self.server.server_address[1]
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/cgi-bin/post.py' % self.port
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.1})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
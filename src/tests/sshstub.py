@@ -0,0 +1,212 @@
+"""
+A local paramiko ssh server standing in for an initiator in tests and
+benchmarks.  Any user and password are accepted, exec requests are run
+with /bin/sh on the local host with the channel as their stdin, and sftp
+works on the local filesystem::
+
+    server = SshStub(delay=0.02)    # each command answers 20ms late
+    server.start()
+    c = Client('127.0.0.1', 'root', 'x', port=server.port)
+    c.connect()
+    ...
+    server.stop()
+
+"""
+import os
+import select
+import socket
+import subprocess
+import threading
+from time import sleep
+
+import paramiko
+
+_KEY = list()
+
+
+def host_key():
+    if not _KEY:
+        _KEY.append(paramiko.RSAKey.generate(1024))
+    return _KEY[0]
+
+
+class StubSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class StubSFTPServer(paramiko.SFTPServerInterface):
+    """
+    SFTP straight onto the local filesystem.
+    """
+
+    def list_folder(self, path):
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, f)), f)
+                    for f in os.listdir(path)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        f = os.fdopen(fd, mode)
+        handle = StubSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+class StubInterface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OR_REASON_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        t = threading.Thread(target=self.server.execute, args=(channel, command))
+        t.daemon = True
+        t.start()
+        return True
+
+
+class SshStub(object):
+    """
+    A threaded ssh server on 127.0.0.1.  delay seconds are slept before each
+    command runs, to emulate a round trip to a remote host.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.commands = list()
+        self.transports = list()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.sock.listen(128)
+        self._thread = threading.Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.sock.close()
+        for t in self.transports:
+            t.close()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                r, _, _ = select.select([self.sock], [], [], 0.1)
+                if not r:
+                    continue
+                conn, _ = self.sock.accept()
+            except (socket.error, select.error, ValueError):
+                return
+            t = paramiko.Transport(conn)
+            t.add_server_key(host_key())
+            self.setup(t)
+            t.start_server(server=StubInterface(self))
+            self.transports.append(t)
+
+    def setup(self, transport):
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, StubSFTPServer)
+
+    def execute(self, channel, command):
+        self.commands.append(command)
+        if self.delay:
+            sleep(self.delay)
+        p = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        pipes = {p.stdout.fileno(): channel.sendall, p.stderr.fileno(): channel.sendall_stderr}
+        stdin = [channel]
+        try:
+            while pipes:
+                r, _, _ = select.select(list(pipes) + stdin, [], [])
+                if channel in r:
+                    data = channel.recv(65536)
+                    try:
+                        if data:
+                            p.stdin.write(data)
+                            p.stdin.flush()
+                        else:
+                            stdin = list()
+                            p.stdin.close()
+                    except IOError:  # the command does not read its stdin
+                        stdin = list()
+                for fd in r:
+                    if fd is channel:
+                        continue
+                    data = os.read(fd, 65536)
+                    if data:
+                        pipes[fd](data)
+                    else:
+                        del pipes[fd]
+            channel.send_exit_status(p.wait())
+            channel.shutdown_write()
+        except (socket.error, EOFError):  # the client went away
+            p.kill()
+        finally:
+            try:
+                channel.close()
+            except EOFError:
+                pass
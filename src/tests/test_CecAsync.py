@@ -0,0 +1,69 @@
+import unittest
+
+from otto.connections.cec import Cec
+from otto.lib.otypes import ReturnCode
+from otto.lib.srx import wait_is_inited_event
+
+
+class TestCecAsync(unittest.TestCase):
+    def setUp(self):
+        self.cec = Cec(43, 'eth0')
+
+    def test_strip(self):
+        buf = 'luns\r\nrecovery complete: 1.0.2\r\nLUN  STATE\r\nbuilding parity complete: 3.0\r\n1 normal'
+        ret, found = self.cec._strip_async(buf)
+        self.assertEqual(ret, 'luns\r\nLUN  STATE\r\n1 normal')
+        self.assertEqual(len(found), 2)
+
+    def test_events(self):
+        seen = list()
+        token = self.cec.subscribe(seen.append, r"parity")
+        _, found = self.cec._strip_async('unrecoverable failure on raid 2.0\r\nbuilding parity complete: 3.0\r\n')
+        for m in found:
+            self.cec._record_async(m)
+        self.assertEqual([e.message for e in self.cec.events],
+                         ['unrecoverable failure on raid 2.0', 'building parity complete: 3.0'])
+        self.assertEqual(self.cec.events[1].args, ('3.0',))
+        self.assertEqual([e.message for e in seen], ['building parity complete: 3.0'])
+        self.cec.unsubscribe(token)
+        self.assertEqual(self.cec.subscribers, [])
+
+    def test_wait_queued(self):
+        _, found = self.cec._strip_async('recovery complete: 1.0.2')
+        self.cec._record_async(found[0])
+        self.assertTrue(self.cec.wait_for_event(r"recovery complete: 1\.", timeout=0))
+        self.assertFalse(self.cec.wait_for_event(r"recovery complete: 1\.", timeout=0,
+                                                 since=self.cec.events[0].time + 1))
+
+    def test_args_from_match(self):
+        # matches in the console buffer but not on the message by itself
+        self.cec.amsgs.append(r"drive (\d+\.\d+) lost(?=\r\n)")
+        _, found = self.cec._strip_async('drive 43.3 lost\r\n')
+        self.assertEqual(self.cec._record_async(found[0]).args, ('43.3',))
+
+    def test_amsgs_change(self):
+        self.cec.amsgs.append('shelf on fire')
+        _, found = self.cec._strip_async('shelf on fire\r\n')
+        self.assertEqual(self.cec._record_async(found[0]).pattern, 'shelf on fire')
+
+    def test_lib_waiter(self):
+        states = ['initing', 'initing', 'normal']
+
+        class FakeSr(object):
+            events = list()
+            version = 7
+            when = dict()
+
+            @property
+            def list(self):
+                return {'1': {'state': states.pop(0), 'raids': []}}
+
+            def wait_for_event(self, pattern, timeout, since):
+                return ReturnCode(True, 'building parity complete: 1.0')
+
+        self.assertTrue(wait_is_inited_event(FakeSr(), 1, timeout=10))
+        self.assertEqual(states, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from otto.appliances.srx import Srx
+from otto.lib.otypes import Drive, ReturnCode
+
+
+class Runner(object):
+    def __init__(self):
+        self.calls = list()
+
+    def __call__(self, cmd, expectation=True, timeout=10):
+        self.calls.append(cmd)
+        if cmd.startswith('drives -j'):
+            return ReturnCode(True, "model:'ST9500530NS'\r\nfirmware:SN04")
+        return ReturnCode(True, '')
+
+
+class TestDrive(unittest.TestCase):
+    def setUp(self):
+        self.runner = Runner()
+
+    def test_snapshot(self):
+        d = Drive(43, 3, self.runner, ttl=5)
+        self.assertEqual(d.model, 'ST9500530NS')
+        self.assertEqual(d.firmware, 'SN04')
+        self.assertEqual(d['model'], 'ST9500530NS')
+        self.assertEqual(len(self.runner.calls), 1)
+
+    def test_refresh(self):
+        d = Drive(43, 3, self.runner, ttl=5)
+        d.get('model')
+        d.refresh()
+        d.get('model')
+        self.assertEqual(len(self.runner.calls), 2)
+
+    def test_no_ttl(self):
+        d = Drive(43, 3, self.runner)
+        d.model, d.firmware
+        self.assertEqual(len(self.runner.calls), 2)
+
+    def test_srx_invalidates(self):
+        sr = Srx(43, 'eth0', version=7)
+        sr.slots = 6
+        sr.run = lambda cmd, timeout=10: ''
+        for slot in range(sr.slots):
+            setattr(sr, 's%s' % slot, Drive(sr.shelf, slot, self.runner, ttl=5))
+            getattr(sr, 's%s' % slot).get('model')
+
+        sr.setsize('-c', '43.3')
+        self.assertIsNone(sr.s3._snapshot)
+        self.assertIsNotNone(sr.s2._snapshot)
+
+        sr.rmspare(['43.1', '43.4-5'])
+        self.assertEqual([getattr(sr, 's%s' % s)._snapshot is None for s in range(sr.slots)],
+                         [False, True, False, True, True, True])
+
+        sr.s0.refresh()
+        sr.fail('1.0.0')
+        self.assertIsNone(sr.s0._snapshot)
+
+    def test_run_many_invalidates(self):
+        sr = Srx(43, 'eth0', version=7)
+        sr.slots = 6
+        sr.run = lambda cmd, timeout=10: ''
+        for slot in range(sr.slots):
+            setattr(sr, 's%s' % slot, Drive(sr.shelf, slot, self.runner, ttl=5))
+            getattr(sr, 's%s' % slot).get('model')
+
+        sr.run_many(['drives', 'fail 43.3'])
+        self.assertIsNone(sr.s3._snapshot)
+        self.assertIsNotNone(sr.s2._snapshot)
+
+        with sr.expert_session():
+            sr.run_many(['echo 1 > /raiddev/2/ctl'])
+            sr.expert_run('replacedrive 43.4')
+        self.assertIsNone(sr.s2._snapshot)
+        self.assertIsNone(sr.s4._snapshot)
+        self.assertIsNotNone(sr.s5._snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import re
+import unittest
+
+from otto.appliances.srx import Srx
+
+
+class FakeSrx(Srx):
+    """
+    An Srx whose console echoes markers and answers 'ok <cmd>' to everything else.
+    """
+
+    def __init__(self):
+        super(FakeSrx, self).__init__(43, 'eth0', version=7)
+        self.sent = list()
+
+    def run(self, cmd, wait=True, force=False, ans='y', timeout=60):
+        self.sent.append((cmd, self.prompt))
+        out = list()
+        for c in cmd.split('; '):
+            m = re.match(r'echo (.*)$', c)
+            out.append(m.group(1) if m else 'ok %s' % c)
+        return '\r\n'.join(out)
+
+
+class TestExpertSession(unittest.TestCase):
+    def setUp(self):
+        self.sr = FakeSrx()
+
+    def test_expert_run(self):
+        ret = self.sr.expert_run('fcstat')
+        self.assertEqual(ret.message, 'ok fcstat')
+        self.assertEqual([c for c, _ in self.sr.sent], ['/expertmode', 'fcstat', 'exit'])
+        self.assertEqual(self.sr.prompt, self.sr.sent[-1][1])
+
+    def test_session(self):
+        prompt = self.sr.prompt
+        with self.sr.expert_session():
+            with self.sr.expert_session():
+                self.sr.expert_run('fcstat')
+            self.sr.expert_run('sysstat')
+            self.assertEqual(self.sr.prompt, Srx.expert_prompt)
+        self.assertEqual([c for c, _ in self.sr.sent], ['/expertmode', 'fcstat', 'sysstat', 'exit'])
+        self.assertEqual(self.sr.prompt, prompt)
+        self.assertEqual(self.sr.expert_depth, 0)
+
+    def test_run_many(self):
+        rets = self.sr.run_many(['fcstat', 'sysstat', 'true'])
+        self.assertEqual(len(self.sr.sent), 3)
+        self.assertEqual([r.message for r in rets], ['ok fcstat', 'ok sysstat', 'ok true'])
+
+    def test_run_many_error(self):
+        with self.assertRaises(Exception):
+            self.sr.run_many(['fcstat', 'bogus; echo error: bogus'])
+        self.assertFalse(self.sr.run_many(['bogus; echo error: bogus'], expectation=False)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
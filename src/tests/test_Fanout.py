@@ -0,0 +1,83 @@
+import socket
+import unittest
+from time import sleep, time
+
+from otto.connections.fanout import Runner, as_completed, wait
+from otto.connections.pool import pool
+from otto.connections.ssh import parallelCmd
+from tests.sshstub import SshStub
+
+
+class TestRunner(unittest.TestCase):
+    def setUp(self):
+        self.server = SshStub(delay=0.05).start()
+        self.port = self.server.port
+
+    def tearDown(self):
+        pool.close_all()
+        self.server.stop()
+
+    def hosts(self, n):
+        # distinct users stand in for distinct hosts, each gets its own connection
+        return [('127.0.0.1', 'user%d' % i, 'x', self.port) for i in range(n)]
+
+    def test_fanout(self):
+        with Runner(max_workers=8) as r:
+            futures = r.run(self.hosts(20), 'echo $USER-ok')
+            done, not_done = wait(futures, timeout=60)
+        self.assertEqual(len(done), 20)
+        self.assertEqual(not_done, [])
+        self.assertTrue(all(f.result() for f in futures))
+        for f in futures:
+            self.assertGreater(f.timing['run'], 0.04)
+            self.assertGreaterEqual(f.timing['total'], f.timing['run'])
+        self.assertEqual(len(r._workers), 8)
+        self.assertEqual((r._idle, r._backlog), (8, 0))
+
+    def test_reuse_workers(self):
+        with Runner(max_workers=4) as r:
+            for _ in range(3):
+                wait(r.run(self.hosts(4), 'true'), timeout=60)
+                end = time() + 5  # a worker counts itself idle just after its future is done
+                while r._idle < 4 and time() < end:
+                    sleep(0.01)
+                self.assertEqual((r._idle, r._backlog), (4, 0))
+            self.assertEqual(len(r._workers), 4)
+
+    def test_as_completed(self):
+        seen = list()
+        with Runner(max_workers=4) as r:
+            futures = r.run_many('127.0.0.1', 'root', 'x', ['sleep 0.5; echo slow', 'echo fast'], port=self.port)
+            futures[0].add_done_callback(seen.append)
+            order = [f.result().message for f in as_completed(futures, timeout=30)]
+        self.assertEqual(order, ['fast\n', 'slow\n'])
+        self.assertEqual(seen, [futures[0]])
+
+    def test_no_truncation(self):
+        with Runner() as r:
+            f = r.submit('127.0.0.1', 'root', 'x', 'head -c 3000000 /dev/zero', port=self.port)
+            self.assertEqual(len(f.result(timeout=60).message), 3000000)
+
+    def test_unreachable(self):
+        s = socket.socket()
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+        s.close()
+        with Runner(connect_timeout=2) as r:
+            f = r.submit('127.0.0.1', 'root', 'x', 'true', port=port)
+            self.assertFalse(f.result(timeout=30))
+            self.assertIsNotNone(f.timing['connect'])
+
+    def test_parallel_cmd(self):
+        cmd = parallelCmd('root', '127.0.0.1', 'x', 'head -c 2000000 /dev/zero; echo err >&2', port=self.port)
+        cmd.run()
+        result = cmd.wait()
+        self.assertTrue(cmd.done)
+        self.assertEqual(result.status, 0)
+        self.assertEqual(len(result.stdout), 2000000)
+        self.assertEqual(cmd.result.stderr, 'err\n')
+        self.assertGreater(cmd.time, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,297 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from ConfigParser import RawConfigParser
+from StringIO import StringIO
+
+from otto.connections.pool import pool
+from otto.initiators.linux import LinuxSsh
+from otto.lib.fio import Fio, FioGroup, FioMonitor, bins_percentiles, fio_jobfile, merge_bins, put_jobfile
+from otto.lib.otypes import InitiatorError
+from tests.sshstub import SshStub
+
+# stands in for fio: one job per --name, each with a padded jobname
+FAKE_FIO = """#!/bin/sh
+for arg; do
+  [ "$arg" = --fail ] && { echo 'fio: bad option' >&2; exit 1; }
+done
+printf '{"fio version": "fio-fake", "jobs": ['
+sep=''
+for arg; do
+  case $arg in
+    --name=*) printf '%s{"jobname": "%s", "error": 0, "pad": "%0500d"}' "$sep" "${arg#--name=}" 0; sep=', ';;
+  esac
+done
+printf ']}'
+"""
+
+# fio --status-interval: a report per interval, the last one final
+FAKE_FIO_STATUS = """#!/bin/sh
+echo 'fio: this platform does not support process shared mutexes'
+for i in 1 2 3; do
+  cat <<END
+{
+  "fio version" : "fio-3.1",
+  "timestamp_ms" : ${i}000,
+  "jobs" : [
+    {
+      "jobname" : "a",
+      "error" : $ERR,
+      "read" : {"io_bytes" : ${i}00, "bw" : ${i}0, "iops" : ${i}.5, "total_ios" : $i,
+                "clat_ns" : {"percentile" : {"50.000000" : ${i}1, "99.000000" : ${i}9}}},
+      "write" : {"io_bytes" : 0, "bw" : 0, "iops" : 0.0, "total_ios" : 0, "clat_ns" : {}}
+    }
+  ]
+}
+END
+  [ $i = 3 ] || sleep 0.3
+done
+"""
+
+# fio --output-format=json+ jobfile: the job file already holds the report
+FAKE_FIO_GROUP = """#!/bin/sh
+for arg; do jobfile=$arg; done
+date +%s.%N > $jobfile.start
+cat $jobfile
+"""
+
+
+def report(iops, bins, error=0):
+    return json.dumps({'jobs': [{'jobname': 'a', 'error': error,
+                                 'read': {'iops': iops, 'bw': iops * 4, 'io_bytes': 0, 'total_ios': 0,
+                                          'clat_ns': {'bins': bins}}}]})
+
+
+class FakeFio(object):
+    """
+    Mixin starting an SshStub and installing fake_fio as fio in bindir,
+    which self.envvars puts first on the PATH.
+    """
+    fake_fio = FAKE_FIO
+
+    def setUp(self):
+        self.server = SshStub().start()
+        self.bindir = tempfile.mkdtemp()
+        path = os.path.join(self.bindir, 'fio')
+        with open(path, 'w') as f:
+            f.write(self.fake_fio)
+        os.chmod(path, 0o755)
+        self.envvars = 'PATH=%s:$PATH' % self.bindir
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.bindir)
+
+    def initiator(self, user='root', connect=False):
+        init = LinuxSsh(user, '127.0.0.1', 'x')
+        init.port = self.server.port
+        if connect:
+            self.assertTrue(init.connect())
+        return init
+
+
+class TestFio(FakeFio, unittest.TestCase):
+    def setUp(self):
+        super(TestFio, self).setUp()
+        self.init = self.initiator()
+
+    def tearDown(self):
+        pool.close_all()
+        super(TestFio, self).tearDown()
+
+    def test_large_result(self):
+        names = ' '.join('--name=job%d' % i for i in range(2000))  # about 1MB of json
+        job = Fio(self.init, '--runtime=1 %s' % names, envvars=self.envvars)
+        self.assertEqual(job.result.message, 'Not done yet')
+        job.run()
+        result = job.wait()
+        self.assertTrue(result)
+        self.assertEqual(len(result.message['jobs']), 2000)
+        self.assertEqual(result.message['jobs'][-1]['jobname'], 'job1999')
+        self.assertIs(job.dict, result.message)
+        self.assertIs(job.result, result)  # decoded once
+        self.assertGreater(job.time, 0)
+
+    def test_failure(self):
+        job = Fio(self.init, '--name=a --fail', envvars=self.envvars)
+        job.run()
+        result = job.wait()
+        self.assertFalse(result)
+        self.assertEqual(result.message, 'fio: bad option\n')
+
+    def test_concurrent_pooled(self):
+        jobs = [Fio(self.init, '--name=j%d' % i, envvars=self.envvars, pooled=True) for i in range(16)]
+        opened = pool.stats['opened']
+        for job in jobs:
+            job.run()
+        for i, job in enumerate(jobs):
+            self.assertEqual(job.wait().message['jobs'][0]['jobname'], 'j%d' % i)
+        self.assertEqual(pool.stats['opened'] - opened, 1)
+
+
+class TestFioMonitor(FakeFio, unittest.TestCase):
+    fake_fio = FAKE_FIO_STATUS
+
+    def setUp(self):
+        super(TestFioMonitor, self).setUp()
+        self.init = self.initiator(connect=True)
+
+    def tearDown(self):
+        self.init.disconnect()
+        super(TestFioMonitor, self).tearDown()
+
+    def monitor(self, err=0, **kwargs):
+        return FioMonitor(self.init, '--name=a', envvars='ERR=%d %s' % (err, self.envvars), **kwargs)
+
+    def test_series(self):
+        seen = list()
+        m = self.monitor(callback=lambda frame: seen.append(len(m.samples['a'])))
+        m.run()
+        result = m.wait()
+        self.assertTrue(result)
+        self.assertEqual(seen, [1, 2, 3])  # samples were there while fio ran
+        self.assertEqual(m.frames, 3)
+        self.assertEqual(m.series('a', 'read', 'iops'), [(1.0, 1.5), (2.0, 2.5), (3.0, 3.5)])
+        self.assertEqual(m.series('a', 'read', 'clat', 99), [(1.0, 19), (2.0, 29), (3.0, 39)])
+        self.assertEqual(m.series('a', 'write', 'clat', 99), [(1.0, None), (2.0, None), (3.0, None)])
+        self.assertEqual(result.message['timestamp_ms'], 3000)
+        self.assertLess(m.time, 5)
+
+    def test_job_error(self):
+        m = self.monitor(err=5)
+        m.run()
+        self.assertEqual(m.wait().message, 'fio[0] error code: 5')
+
+
+class TestFioGroup(FakeFio, unittest.TestCase):
+    fake_fio = FAKE_FIO_GROUP
+
+    def setUp(self):
+        super(TestFioGroup, self).setUp()
+        self.inits = [self.initiator('user%d' % i, connect=True) for i in range(4)]
+
+    def tearDown(self):
+        for init in self.inits:
+            init.disconnect()
+        super(TestFioGroup, self).tearDown()
+
+    def group(self, reports):
+        return FioGroup(zip(self.inits, reports), remote_dir=self.bindir, envvars=self.envvars)
+
+    def test_percentiles(self):
+        bins = {'10': 50, '20': 45, '1000': 5}
+        self.assertEqual(bins_percentiles(merge_bins(bins), (50, 95, 99)), {50.0: 10, 95.0: 20, 99.0: 1000})
+        self.assertEqual(merge_bins(bins, {'20': 5, '30': 1}), {10: 50, 20: 50, 30: 1, 1000: 5})
+
+    def test_group(self):
+        # three fast hosts and one slow one: averaging the per host p99 would say 2575ns
+        reports = [report(100, {'100': 99, '200': 1})] * 3 + [report(10, {'10000': 100})]
+        g = self.group(reports)
+        g.run()
+        result = g.wait()
+        self.assertTrue(result)
+        self.assertEqual(result.message['read']['iops'], 310)
+        self.assertEqual(result.message['read']['bw'], 1240)
+        self.assertEqual(result.message['read']['clat']['percentile'][50.0], 100)
+        self.assertEqual(result.message['read']['clat']['percentile'][99.0], 10000)
+        self.assertEqual(result.message['read']['clat']['max'], 10000)
+        self.assertEqual([h['summary']['read']['iops'] for h in g.hosts], [100, 100, 100, 10])
+        self.assertEqual(g.hosts[0]['summary']['read']['clat']['percentile'][99.0], 100)
+        starts = [float(open(f).read()) for f in glob.glob(os.path.join(self.bindir, '*.fio.start'))]
+        self.assertEqual(len(starts), 4)
+        self.assertLess(max(starts) - min(starts), 0.5)
+        self.assertLess(g.skew, 0.5)
+        self.assertEqual(glob.glob(os.path.join(self.bindir, '*.fio')), [])
+
+    def test_failed_host(self):
+        g = self.group([report(100, {'100': 1})] * 3 + [report(100, {'100': 1}, error=5)])
+        g.run()
+        result = g.wait()
+        self.assertFalse(result)
+        self.assertIn('fio[0] error code: 5', result.message)
+        self.assertTrue(g.hosts[0]['result'])
+
+    def test_not_started(self):
+        self.inits[2].disconnect()
+        self.inits[2].connected = False
+        g = self.group([report(100, {'100': 1})] * 4)
+        g.run()
+        result = g.wait()
+        self.assertFalse(result)
+        self.assertIn('not started', result.message)
+        self.assertIn('not connected', g.hosts[2]['result'].message)
+        self.assertEqual(glob.glob(os.path.join(self.bindir, '*.start')), [])
+        self.assertEqual(glob.glob(os.path.join(self.bindir, '*.fio')), [])
+
+
+class FakeInitiator(object):
+    def __init__(self, os, stat):
+        self.os = os
+        self.stat = stat
+        self.stats = 0
+
+    @property
+    def aoestat(self):
+        self.stats += 1
+        return self.stat
+
+
+class TestJobFile(unittest.TestCase):
+    def parse(self, text):
+        config = RawConfigParser(allow_no_value=True)
+        config.optionxform = str
+        config.readfp(StringIO(text))
+        return config
+
+    def test_linux(self):
+        init = FakeInitiator('linux', dict(('7.%d' % i, {'path': '/dev/sd%d' % i}) for i in range(1000)))
+        text = fio_jobfile(init, range(1000), 7, tlen=60, overrides={3: {'rw': 'randrw', 'rwmixread': 70},
+                                                                    '7.4': {'rate_iops': 500, 'iodepth': 8}})
+        self.assertEqual(init.stats, 1)
+        config = self.parse(text)
+        self.assertEqual(config.sections()[0], 'global')
+        self.assertEqual(len(config.sections()), 1001)
+        self.assertEqual(dict(config.items('global')),
+                         {'ioengine': 'libaio', 'iodepth': '64', 'bs': '128k', 'rw': 'rw', 'norandommap': None,
+                          'group_reporting': None, 'time_based': None, 'runtime': '60'})
+        self.assertEqual(dict(config.items('e7.0')), {'filename': '/dev/sd0'})
+        self.assertEqual(dict(config.items('e7.3')), {'filename': '/dev/sd3', 'rw': 'randrw', 'rwmixread': '70'})
+        self.assertEqual(dict(config.items('e7.4')), {'filename': '/dev/sd4', 'rate_iops': '500', 'iodepth': '8'})
+
+    def test_solaris(self):
+        init = FakeInitiator('solaris', {'91.1': {'device': 'sd379'}})
+        options = {'group_reporting': None, 'direct': 1}
+        config = self.parse(fio_jobfile(init, [1], 91, size='10G', options=options))
+        self.assertEqual(options, {'group_reporting': None, 'direct': 1})
+        self.assertEqual(config.get('global', 'ioengine'), 'solarisaio')
+        self.assertEqual(config.get('global', 'size'), '10G')
+        self.assertEqual(config.get('global', 'direct'), '1')
+        self.assertFalse(config.has_option('global', 'group_reporting'))
+        self.assertEqual(config.get('e91.1', 'filename'), '/dev/rdsk/sd379p0')
+
+    def test_missing(self):
+        init = FakeInitiator('linux', {'7.0': {'path': '/dev/sda'}})
+        with self.assertRaises(InitiatorError) as e:
+            fio_jobfile(init, range(3), 7)
+        self.assertEqual(str(e.exception), 'fio lun 7.1, 7.2 not found')
+
+    def test_put(self):
+        server = SshStub().start()
+        tmp = tempfile.mkdtemp()
+        init = LinuxSsh('root', '127.0.0.1', 'x')
+        init.port = server.port
+        try:
+            self.assertTrue(init.connect())
+            path = put_jobfile(init, '[global]\nbs=4k\n', os.path.join(tmp, 'job.fio'))
+            self.assertEqual(open(path).read(), '[global]\nbs=4k\n')
+        finally:
+            init.disconnect()
+            server.stop()
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from otto.connections.cec import Cec
+from otto.connections.ssh_pexpect import Ssh
+from otto.lib.pexpect import spawn
+
+PROMPT = 'TEST> '
+
+
+def shell(conn):
+    """
+    Attach a connection to a local shell instead of a remote host.
+    """
+    spawn.__init__(conn, '/bin/sh', [], timeout=10, env=dict(os.environ, PS1=PROMPT))
+    conn.expect_exact(PROMPT)
+    conn.connected = True
+    return conn
+
+
+class TestFramed(unittest.TestCase):
+    def setUp(self):
+        self.ssh = shell(Ssh('user', 'localhost', None, PROMPT))
+
+    def tearDown(self):
+        self.ssh.close(force=True)
+
+    def test_run_framed(self):
+        ret = self.ssh.run_framed('echo hello; echo world')
+        self.assertTrue(ret)
+        self.assertEqual(ret.message, 'hello\r\nworld')
+        self.assertEqual(ret.raw.status, '0')
+
+        ret = self.ssh.run_framed('echo oops; false')
+        self.assertFalse(ret)
+        self.assertEqual(ret.message, 'oops')
+        self.assertEqual(ret.raw.status, '1')
+
+    def test_pipelined(self):
+        long_arg = 'x' * 300
+        rets = self.ssh.run_pipelined(['echo one', '(exit 3)', 'echo %s' % long_arg])
+        self.assertEqual([r.message for r in rets], ['one', '', long_arg])
+        self.assertEqual([r.raw.status for r in rets], ['0', '3', '0'])
+        # the console is left at a prompt for unframed commands
+        self.assertEqual(self.ssh.run('echo after'), 'after')
+
+    def test_framed_run(self):
+        self.ssh.framed = True
+        self.assertEqual(self.ssh.run('echo %s' % ('y' * 100)), 'y' * 100)
+
+    def cec(self):
+        cec = shell(Cec(43, 'eth0', prompt=PROMPT))
+        # the SRX shell is rc; sh keeps the exit status in $? and succeeds with 0
+        cec.status_var = '$?'
+        cec.success = ('0',)
+        return cec
+
+    def test_cec_async(self):
+        cec = self.cec()
+        try:
+            ret = cec.run_framed('echo lun 1; echo recovery complete: 1.0.2; echo lun 2')
+            self.assertTrue(ret)
+            self.assertEqual(ret.raw.status, '0')
+            self.assertEqual(ret.message, 'lun 1\r\nlun 2')
+            # printed by the command, it may be old text: not an event
+            self.assertEqual(list(cec.events), [])
+            self.assertFalse(cec.run_framed('false'))
+
+            # printed while no command runs
+            cec.run_framed('set +m; (sleep 0.2; echo building parity complete: 3.0) & true')
+            time.sleep(1)
+            self.assertEqual(cec.run_framed('echo lun 3').message, 'lun 3')
+            self.assertEqual([e.message for e in cec.events], ['building parity complete: 3.0'])
+        finally:
+            cec.close(force=True)
+
+    def test_cec_async_unframed(self):
+        cec = self.cec()
+        try:
+            self.assertEqual(cec.run('echo recovery complete: 1.0.2'), '')
+            self.assertEqual(list(cec.events), [])
+            cec.run('set +m; (sleep 0.2; echo building parity complete: 3.0) & true')
+            time.sleep(1)
+            self.assertEqual(cec.run('echo lun 3'), 'lun 3')
+            self.assertEqual([e.args for e in cec.events], [('3.0',)])
+        finally:
+            cec.close(force=True)
+
+    def test_cec_framed_run(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'f')
+        cec = self.cec()
+        cec.framed = True
+        try:
+            self.assertEqual(cec.run('echo x >> %s; cat %s' % (path, path)), 'x')
+        finally:
+            cec.close(force=True)
+        self.assertEqual(open(path).read(), 'x\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
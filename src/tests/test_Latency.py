@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from otto.lib import latency
+from otto.lib.latency import Histogram
+
+
+def job(bins, ddir='read'):
+    return {'jobname': 'a', ddir: {'clat_ns': {'bins': dict((str(v), c) for v, c in bins.items())}}}
+
+
+class TestHistogram(unittest.TestCase):
+    numpy = latency.numpy
+
+    def setUp(self):
+        self.saved = latency.numpy
+        latency.numpy = self.numpy
+
+    def tearDown(self):
+        latency.numpy = self.saved
+
+    def test_merge(self):
+        a = Histogram.from_bins({'10': 2, '30': 1, '40': 0})
+        b = Histogram.from_bins({'20': 5, '30': 4})
+        self.assertEqual(a + b, Histogram([10, 20, 30], [2, 5, 5]))
+        self.assertEqual(Histogram.merge([]), Histogram())
+        self.assertEqual(Histogram.merge([Histogram(), a]), a)
+        self.assertEqual(Histogram.from_bins({'10': 2, '30': 1}, {'20': 5, '30': 4}, {}), a + b)
+        self.assertEqual(Histogram.from_bins(), Histogram())
+
+    def test_percentiles(self):
+        h = Histogram.from_report({'jobs': [job({100: 99, 200: 1}), job({100: 99, 200: 1}), job({5000: 5}, 'write')]})
+        self.assertEqual(h.total, 200)
+        self.assertEqual(h.percentiles((50, 99, 99.5, 100)), {50.0: 100, 99.0: 100, 99.5: 200, 100.0: 200})
+        self.assertEqual(h.percentile(99.99), 200)
+        self.assertEqual(h.mean, 101.0)
+        self.assertEqual((h.min, h.max), (100, 200))
+        self.assertEqual(Histogram().percentiles(), dict())
+        self.assertIsNone(Histogram().mean)
+
+    def test_tail(self):
+        h = Histogram([10, 20, 30, 40], [70, 20, 9, 1])
+        values, fractions = h.cdf()
+        self.assertEqual(list(values), [10, 20, 30, 40])
+        self.assertEqual([round(f, 2) for f in fractions], [0.7, 0.9, 0.99, 1.0])
+        self.assertEqual([round(f, 2) for f in h.tail()[1]], [0.3, 0.1, 0.01, 0.0])
+        self.assertAlmostEqual(h.exceeding(20), 0.1)
+        self.assertAlmostEqual(h.exceeding(25), 0.1)
+        self.assertAlmostEqual(h.exceeding(5), 1.0)
+        self.assertEqual(h.exceeding(40), 0.0)
+
+    def test_against_samples(self):
+        rng = random.Random(7)
+        samples = [int(rng.expovariate(1e-5)) // 1000 * 1000 for _ in range(20000)]
+        parts = [dict() for _ in range(10)]
+        for i, s in enumerate(samples):
+            parts[i % 10][s] = parts[i % 10].get(s, 0) + 1
+        h = Histogram.merge(Histogram.from_bins(p) for p in parts)
+        samples.sort()
+        for p in (50, 99, 99.99):
+            rank = int(-(-p * len(samples) // 100))  # fio's: the first sample at or past p percent
+            self.assertEqual(h.percentile(p), samples[rank - 1])
+
+
+class TestHistogramPython(TestHistogram):
+    numpy = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,443 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from logging.handlers import BufferingHandler, WatchedFileHandler
+
+from otto.connections.ssh import Client
+from otto.lib.log import (Log, JsonHandler, MultiPartForm, QueuedHandler, DEBUG, INFO, WARNING, ERROR,
+                          query, render_html, upload)
+from tests.sshstub import SshStub
+from tests.httpstub import HttpStub
+
+
+class Loud(object):
+    """
+    Counts how often it is turned into a string.
+    """
+    formatted = 0
+
+    def __str__(self):
+        Loud.formatted += 1
+        return 'loud'
+
+
+class TestLog(unittest.TestCase):
+    queued = False
+
+    def setUp(self):
+        # records propagate to the root logger; keep the test runner's handlers out of it
+        self.root_handlers = logging.root.handlers
+        logging.root.handlers = list()
+        self.logdir = tempfile.mkdtemp() + '/'
+        self.log = Log(level=INFO, name='test', logdir=self.logdir, stdout=False, queued=self.queued)
+
+    def tearDown(self):
+        self.detach()
+        shutil.rmtree(self.logdir)
+        logging.root.handlers = self.root_handlers
+
+    def detach(self):
+        for handler in list(self.log.logger.handlers):
+            if not isinstance(handler, logging.NullHandler):
+                self.log.logger.removeHandler(handler)
+                handler.close()
+
+    def lines(self):
+        return open(self.log.fullLogFile).read().splitlines()
+
+    def test_caller(self):
+        line = sys._getframe().f_lineno + 1
+        self.log.info("hello %s", 'world')
+        self.log.error('plain %s')
+        self.log.critical('very bad')
+        lines = self.lines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('INFO'))
+        self.assertIn('test_Log.py->test_caller:%d - hello world' % line, lines[0])
+        self.assertTrue(lines[1].endswith('- plain %s'))
+        self.assertTrue(lines[2].endswith('- very bad'))
+
+    def test_disabled(self):
+        Loud.formatted = 0
+        self.log.debug('%s', Loud())
+        self.assertEqual(Loud.formatted, 0)
+        self.assertEqual(self.lines(), [])
+        self.log.comment('%s', Loud())  # COMMENT is below INFO
+        self.assertEqual(Loud.formatted, 0)
+        self.log.warning('%s', Loud())
+        self.assertEqual(Loud.formatted, 1)
+        self.assertFalse(self.log.enabled(logging.DEBUG))
+        self.log.setLevel(logging.DEBUG)
+        self.assertTrue(self.log.enabled(logging.DEBUG))
+        self.log.debug('%s', Loud())
+        self.assertEqual(Loud.formatted, 2)
+
+    def test_propagate(self):
+        caught = BufferingHandler(10)
+        logging.root.addHandler(caught)
+        self.assertTrue(self.log.enabled(logging.DEBUG))
+        self.log.debug('to the root')
+        self.assertEqual(len(caught.buffer), 1)
+        self.assertTrue(caught.buffer[0].getMessage().endswith('- to the root'))
+        self.assertEqual(self.lines(), [])
+        self.log.logger.propagate = False
+        try:
+            self.assertFalse(self.log.enabled(logging.DEBUG))
+        finally:
+            self.log.logger.propagate = True
+
+    def test_write(self):
+        def caller():
+            self.log.write({'status': 'pass', 'value': 'from caller'})
+
+        caller()
+        self.assertIn('test_Log.py->caller:', self.lines()[0])
+
+
+class Gate(logging.Handler):
+    """
+    Holds the writer thread until opened.
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.open = threading.Event()
+        self.records = list()
+
+    def emit(self, record):
+        self.open.wait()
+        self.records.append(record.getMessage())
+
+
+class TestQueuedLog(TestLog):
+    queued = True
+
+    def lines(self):
+        self.log.flush()
+        return TestLog.lines(self)
+
+    def test_files(self):
+        self.detach()
+        self.log = Log(level=INFO, name='multi', logdir=self.logdir, stdout=False, queued=True, multiFile=True)
+        for i in range(500):
+            self.log.info('info %d', i)
+        self.log.error('bad')
+        self.log.logResult('t1', 'pass')
+        self.log.flush()
+        self.assertEqual(len(self.lines()), 502)
+        self.assertIn('- info 499', self.lines()[499])
+        info = open(self.log.fullLogFile.replace('_FULL', '_INFO')).read().splitlines()
+        error = open(self.log.fullLogFile.replace('_FULL', '_ERROR')).read().splitlines()
+        self.assertEqual(len(info), 501)
+        self.assertEqual(error[0][-5:], '- bad')
+        self.assertEqual(error[1], 'TEST COMPLETED - ID: t1 w/ STATUS: pass')
+        self.assertEqual(len(self.log.fileHandlers), 6)
+
+    def test_drop(self):
+        gate = Gate()
+        h = QueuedHandler([gate], maxsize=5, full='drop')
+        logger = logging.getLogger('otto.test.queue')
+        logger.propagate = False
+        logger.addHandler(h)
+        try:
+            for i in range(50):
+                logger.warning('w%d', i)
+            self.assertGreaterEqual(h.dropped, 40)
+            gate.open.set()
+            h.flush()
+            logger.warning('after')
+            h.close()
+        finally:
+            logger.removeHandler(h)
+        self.assertEqual(gate.records[0], 'w0')
+        self.assertEqual(gate.records[-1], 'after')
+        reported = [int(r.split()[0]) for r in gate.records if r.endswith('dropped, the log queue was full')]
+        self.assertEqual(sum(reported), h.dropped)
+        self.assertEqual(len(gate.records), 50 - h.dropped + len(reported) + 1)
+
+    def test_delayed_open(self):
+        path = os.path.join(self.logdir, 'delayed.log')
+        handler = WatchedFileHandler(path, delay=True)
+        h = QueuedHandler([handler])
+        logger = logging.getLogger('otto.test.delayed')
+        logger.propagate = False
+        logger.addHandler(h)
+        try:
+            logger.warning('one')
+            h.flush()
+            stream = handler.stream
+            st = os.stat(path)
+            self.assertEqual((handler.dev, handler.ino), (st.st_dev, st.st_ino))
+            logger.warning('two')
+            h.flush()
+            self.assertIs(handler.stream, stream)  # not reopened for every batch
+        finally:
+            logger.removeHandler(h)
+            h.close()
+            handler.close()
+        self.assertEqual(open(path).read(), 'one\ntwo\n')
+
+    def test_close(self):
+        self.log.warning('last words')
+        self.log.queue.close()
+        self.assertIn('- last words', open(self.log.fullLogFile).read())
+
+
+class TestRenderHtml(unittest.TestCase):
+    LINES = ['INFO    - start <setup>\n',
+             'ERROR   - first & worst\n',
+             'WARNING - careful\n',
+             'TEST COMPLETED - ID: t1 w/ STATUS: fail\n',
+             'INFO    - more\n',
+             'ERROR   - second\n',
+             'INFO    - end']
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.dir, 'run_FULL.log')
+        with open(self.logfile, 'w') as f:
+            f.writelines(self.LINES)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_single(self):
+        html = render_html(self.logfile)
+        self.assertEqual(html, os.path.join(self.dir, 'run_FULL.html'))
+        text = open(html).read()
+        self.assertTrue(text.startswith('<HTML>\n<a name="top"/>Errors: <a href="#err1">1</a>, <a href="#err2">2</a>\n'
+                                        '<p/>\nWarnings: <a href="#wrn1">1</a>\n<p/>\nSteps: <a href="#step1">1</a>\n'
+                                        '<p/>\nINFO    - start &lt;setup&gt;\n<br/><a name=err1 />'
+                                        '<FONT COLOR="#FF0000">ERROR   - first &amp; worst\n</FONT>'))
+        self.assertTrue(text.endswith('<br/>INFO    - end</HTML>\n'))
+
+    def test_precedence(self):
+        with open(self.logfile, 'w') as f:
+            f.writelines(['TEST COMPLETED - ID: t1 w/ STATUS: ERROR\n',
+                          'INFO    - WARNING: disk 3 ERROR count 2\n',
+                          'TEST COMPLETED - ID: t2 w/ STATUS: WARNING\n',
+                          'TEST COMPLETED - ID: t3 w/ STATUS: pass\n'])
+        html = open(render_html(self.logfile)).read()
+        self.assertIn('Errors: <a href="#err1">1</a>, <a href="#err2">2</a>\n', html)
+        self.assertIn('Warnings: <a href="#wrn1">1</a>\n', html)
+        self.assertIn('Steps: <a href="#step1">1</a>\n', html)
+        self.assertIn('<a name=err1 /><FONT COLOR="#FF0000">TEST COMPLETED - ID: t1', html)
+        self.assertIn('<a name=step1 />TEST COMPLETED - ID: t3', html)
+
+    def test_index_offsets(self):
+        render_html(self.logfile)
+        entries = [l.split() for l in open(os.path.join(self.dir, 'run_FULL.idx'))]
+        self.assertEqual([e[:2] for e in entries], [['err', '1'], ['wrn', '1'], ['step', '1'], ['err', '2']])
+        with open(self.logfile) as log:
+            for kind, n, offset, lineno, page in entries:
+                log.seek(int(offset))
+                self.assertEqual(log.readline(), self.LINES[int(lineno) - 1])
+
+    def test_pages(self):
+        html = render_html(self.logfile, page_lines=3)
+        index = open(html).read()
+        self.assertIn('<a href="run_FULL-0002.html#err2">2</a>', index)
+        self.assertIn('Pages: <a href="run_FULL-0001.html">1</a>, <a href="run_FULL-0002.html">2</a>, '
+                      '<a href="run_FULL-0003.html">3</a>', index)
+        pages = [open(os.path.join(self.dir, 'run_FULL-%04d.html' % n)).read() for n in (1, 2, 3)]
+        self.assertIn('<a href="run_FULL-0002.html">next</a>', pages[0])
+        self.assertNotIn('previous', pages[0])
+        self.assertIn('<a href="run_FULL-0002.html">previous</a>', pages[2])
+        self.assertNotIn('next', pages[2])
+        self.assertIn('<a name=err2 />', pages[1])
+        self.assertEqual([p.count('<br/>') for p in pages], [2, 2, 0])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'run_FULL-0004.html')))
+
+
+class TestUpload(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'run_FULL.log')
+        with open(self.path, 'w') as f:
+            for i in range(50000):
+                f.write('INFO    - line %d of the log\n' % i)
+        self.md5 = hashlib.md5(open(self.path).read()).hexdigest()
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def form(self, compress=True):
+        form = MultiPartForm()
+        form.add_path('file', 'run_FULL.log', self.path, compress=compress)
+        return form
+
+    def test_compressed(self):
+        self.server = HttpStub().start()
+        seen = list()
+        r = upload(self.server.url, self.form(), blocksize=4096, progress=lambda *a: seen.append(a))
+        self.assertTrue(r)
+        self.assertEqual(r.message, 'file location: /logs/run_FULL.log.gz\n')
+        self.assertEqual(self.server.chunked, 1)
+        u = self.server.uploads[0]
+        self.assertEqual((u['size'], u['md5']), (os.path.getsize(self.path), self.md5))
+        self.assertEqual(seen[-1], (u['size'], u['size']))
+        self.assertEqual(len(seen), -(-u['size'] // 4096))
+
+    def test_plain(self):
+        self.server = HttpStub().start()
+        form = self.form(compress=False)
+        form.add_field('run', 'r1')
+        self.assertTrue(upload(self.server.url, form))
+        field, u = self.server.uploads
+        self.assertEqual((field['filename'], field['size']), (None, 2))
+        self.assertEqual((u['filename'], u['md5']), ('run_FULL.log', self.md5))
+
+    def test_retry(self):
+        self.server = HttpStub(fail=2).start()
+        r = upload(self.server.url, self.form(), backoff=0)
+        self.assertTrue(r)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.uploads[0]['md5'], self.md5)
+
+    def test_give_up(self):
+        self.server = HttpStub(fail=5).start()
+        r = upload(self.server.url, self.form(), retries=1, backoff=0)
+        self.assertFalse(r)
+        self.assertIn('after 2 attempts', r.message)
+        self.assertEqual(self.server.uploads, [])
+
+    @unittest.skipUnless(os.path.exists('/proc/self/status'), 'needs /proc')
+    def test_bounded_memory(self):
+        # a sparse file far bigger than the uploading process may grow
+        size = 256 << 20
+        with open(self.path, 'w') as f:
+            f.truncate(size)
+        self.server = HttpStub().start()
+        # VmHWM rather than ru_maxrss, which keeps the peak of the forking parent
+        child = ("import re, sys\n"
+                 "from otto.lib.log import MultiPartForm, upload\n"
+                 "form = MultiPartForm()\n"
+                 "form.add_path('file', 'big.log', sys.argv[1], compress=True)\n"
+                 "r = upload(sys.argv[2], form, blocksize=1 << 20)\n"
+                 "print r.status, re.search(r'VmHWM:\\s*(\\d+)', open('/proc/self/status').read()).group(1)\n")
+        here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.check_output([sys.executable, '-c', child, self.path, self.server.url], cwd=here)
+        status, maxrss = out.split()
+        self.assertEqual(status, 'True')
+        self.assertLess(int(maxrss), 64 * 1024)  # KB
+        self.assertEqual(self.server.uploads[0]['size'], size)
+
+
+class TestJsonLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'run_FULL.jsonl')
+        self.logger = logging.getLogger('otto.test.json')
+        self.logger.propagate = False
+        self.logger.setLevel(DEBUG)
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+        shutil.rmtree(self.dir)
+
+    def records(self):
+        return [json.loads(l) for l in open(self.path)]
+
+    def fill(self, n=3000):
+        """
+        n records a second apart from four hosts, every fifth an error
+        """
+        handler = JsonHandler(self.path)
+        self.logger.addHandler(handler)
+        for i in range(n):
+            level = ERROR if i % 5 == 0 else INFO
+            record = self.logger.makeRecord(self.logger.name, level, 'x.py', i, 'step %d', (i,), None,
+                                            extra={'host': 'node%d' % (i % 4)})
+            record.created = 1000.0 + i
+            self.logger.handle(record)
+        return handler
+
+    def test_log(self):
+        log = Log(level=INFO, name='test', logdir=self.dir + '/', stdout=False, jsonl=True)
+        try:
+            log.info('ran %s', 'uname', host='node1', command='uname', duration=0.25)
+            log.debug('not written')
+            log.warning('odd names', name='disk1', module='raid', message='x', level='y', args=3)
+            log.write({'status': 'fail', 'value': 'step 2'})
+            log.logResult('t1', 'pass')
+            log.flush()
+            records = [json.loads(l) for l in open(log.jsonLogFile)]
+        finally:
+            for handler in list(log.logger.handlers):
+                if not isinstance(handler, logging.NullHandler):
+                    log.logger.removeHandler(handler)
+                    handler.close()
+        first = records[0]
+        self.assertEqual((first['level'], first['message'], first['host'], first['command'], first['duration']),
+                         ('INFO', 'ran uname', 'node1', 'uname', 0.25))
+        self.assertTrue(first['caller'].startswith('test_Log.py:'))
+        odd = records[1]
+        self.assertEqual((odd['level'], odd['message'], odd['logger']), ('WARNING', 'odd names', 'otto'))
+        self.assertEqual((odd['name'], odd['module'], odd['args']), ('disk1', 'raid', 3))
+        self.assertEqual((records[2]['level'], records[2]['message'], records[2]['status']), ('ERROR', 'step 2', 'fail'))
+        self.assertEqual(records[2]['caller'], first['caller'][:-3] + str(int(first['caller'][-3:]) + 3))
+        self.assertEqual((records[3]['level'], records[3]['test'], records[3]['status']), ('RESULT', 't1', 'pass'))
+        self.assertEqual(len(records), 4)
+
+    def test_query(self):
+        self.fill()
+        everything = self.records()
+        found = list(query(self.path, 1500, 1999.5, level=ERROR, host='node2'))
+        self.assertEqual(found, [r for r in everything if 1500 <= r['time'] <= 1999.5 and
+                                 r['level'] == 'ERROR' and r['host'] == 'node2'])
+        self.assertEqual(len(found), 25)
+        self.assertEqual(len(list(query(self.path, level='WARNING'))), 600)
+        self.assertEqual(len(list(query(self.path, end=1009))), 10)
+        self.assertEqual(list(query(self.path, host='node9')), [])
+        self.assertEqual(list(query(self.path, start=5000)), [])
+
+    def test_append(self):
+        self.fill(10).close()
+        self.logger.removeHandler(self.logger.handlers[0])
+        handler = JsonHandler(self.path)
+        self.logger.addHandler(handler)
+        self.assertEqual(handler.last, 1009.0)
+        self.logger.warning('late', extra={'host': 'node1'})
+        found = list(query(self.path, 1005, level=WARNING))
+        self.assertEqual([r['message'] for r in found], ['step 5', 'late'])
+
+    def test_command_timing(self):
+        server = SshStub().start()
+        logger = logging.getLogger('otto.connections')
+        handler = JsonHandler(self.path)
+        logger.addHandler(handler)
+        level, logger.level = logger.level, DEBUG
+        try:
+            c = Client('127.0.0.1', 'root', 'x', port=server.port)
+            self.assertTrue(c.connect())
+            self.assertTrue(c.run('echo secret'))
+            c.log_commands = True
+            self.assertTrue(c.run('sleep 0.1; echo hi'))
+            c.disconnect()
+        finally:
+            logger.removeHandler(handler)
+            logger.level = level
+            handler.close()
+            server.stop()
+        quiet, record = [r for r in self.records() if 'duration' in r]
+        self.assertEqual((quiet['host'], quiet['status']), ('127.0.0.1', 0))
+        self.assertNotIn('command', quiet)
+        self.assertNotIn('secret', quiet['message'])
+        self.assertEqual((record['host'], record['command'], record['status']), ('127.0.0.1', 'sleep 0.1; echo hi', 0))
+        self.assertGreater(record['duration'], 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from otto.appliances.srx import Srx
+from otto.lib.otypes import LunTopology, ReturnCode
+
+LUNS_A = '\r\n'.join(['LUN  LABEL               STATUS   TYPE    SIZE      STATE',
+                      '1    data                online   raid5   1000.216  degraded,recovering',
+                      '     500.108  1.0.0  43.0  normal',
+                      '     500.108  1.0.1  43.1  failed',
+                      '     500.108  1.0.2  43.2  normal',
+                      '2    scratch             offline  raid1   500.108   normal',
+                      '     500.108  2.0.0  43.3  normal',
+                      '     500.108  2.0.1  43.4  normal'])
+
+LIST_L = '\r\n'.join(["0 1000.216 online 'data'",
+                      '0.0 1000.216 raid5 normal',
+                      '0.0.0 normal 500.108 43.5',
+                      '0.0.1 normal 500.108 43.6'])
+
+
+class TestLunTopology(unittest.TestCase):
+    def setUp(self):
+        self.sr = Srx(43, 'eth0', version=7)
+        self.luns = self.sr._parse_luns(LUNS_A)
+
+    def test_dict_compatible(self):
+        self.assertIsInstance(self.luns, dict)
+        self.assertEqual(sorted(self.luns), ['1', '2'])
+        self.assertEqual(self.luns['1']['raids'][0]['components'][1]['drive'], '43.1')
+
+    def test_indexes(self):
+        self.assertEqual(self.luns.location('43.4'), ('2', '0', '1'))
+        self.assertIsNone(self.luns.location('43.9'))
+        self.assertEqual(self.luns.drive('1.0.2'), '43.2')
+        self.assertEqual(self.luns.drives('1'), ['43.0', '43.1', '43.2'])
+        self.assertEqual(self.luns.in_state('recovering'), ['1'])
+        self.assertEqual(self.luns.in_state('normal'), ['2'])
+
+    def test_reindex_on_change(self):
+        self.luns.pop('1')
+        self.assertIsNone(self.luns.location('43.0'))
+        self.assertEqual(self.luns.in_state('recovering'), [])
+
+    def test_use_slots(self):
+        self.sr.use_slots = ['3', '4']
+        self.assertEqual(self.sr._parse_luns(LUNS_A).keys(), ['2'])
+        self.sr.use_slots = [0, 1, 2]
+        self.assertEqual(self.sr._parse_luns(LUNS_A).keys(), ['1'])
+
+    def test_list_6(self):
+        sr = Srx(43, 'eth0', version=6)
+        sr.run_and_check = lambda cmd: ReturnCode(True, LIST_L)
+        luns = LunTopology(sr._list_6)
+        self.assertEqual(luns.location('43.6'), ('0', '0', '1'))
+        self.assertEqual(luns.drives('0'), ['43.5', '43.6'])
+
+
+if __name__ == '__main__':
+    unittest.main()
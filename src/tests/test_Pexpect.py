@@ -0,0 +1,65 @@
+import os
+import re
+import tempfile
+import unittest
+
+from otto.lib.pexpect import spawn, searcher_re, searcher_string, EOF, TIMEOUT
+
+
+class TestSearchers(unittest.TestCase):
+    def test_overlap(self):
+        buf = bytearray('abc foo> ' + 'x' * 100)
+        s = searcher_re([re.compile('foo> ')])
+        self.assertEqual(s.search(buf, 10, overlap=10), -1)
+        self.assertEqual(s.search(buf, 10, overlap=200), 0)
+        self.assertEqual((s.start, s.end), (4, 9))
+        self.assertIsInstance(s.match.group(0), str)
+
+    def test_anchor(self):
+        # '^' must not match at the start of the searched window
+        buf = bytearray('xfoo> ')
+        s = searcher_re([re.compile('^foo> '), re.compile('(?m)^x')])
+        self.assertEqual(s.search(buf, 5, overlap=0), -1)
+        self.assertEqual(s.search(buf, 6, overlap=0), 1)
+
+    def test_string(self):
+        buf = bytearray('abcdef')
+        s = searcher_string(['cde', EOF])
+        self.assertEqual(s.search(buf, 2), 0)
+        self.assertEqual((s.start, s.end, s.match), (2, 5, 'cde'))
+        self.assertEqual(s.search(buf, 0), -1)
+
+
+class TestExpect(unittest.TestCase):
+    def setUp(self):
+        fd, self.fname = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('line\n' * 200000 + 'done> tail')
+
+    def tearDown(self):
+        os.remove(self.fname)
+
+    def test_large_output(self):
+        p = spawn('/bin/cat', [self.fname])
+        self.assertEqual(p.expect(['(?m)^done> ', EOF]), 0)
+        self.assertEqual(len(p.before), 200000 * 6)  # the pty turns \n into \r\n
+        self.assertEqual(p.after, 'done> ')
+        self.assertIsInstance(p.before, str)
+        self.assertEqual(p.expect(EOF), 0)
+        self.assertEqual(p.before, 'tail')
+
+    def test_searchwindowsize(self):
+        p = spawn('/bin/cat', [self.fname])
+        self.assertEqual(p.expect_exact(['done> '], searchwindowsize=100), 0)
+        p.close()
+
+    def test_timeout(self):
+        p = spawn('/bin/sh', ['-c', 'echo partial; sleep 5'])
+        self.assertEqual(p.expect(['never', TIMEOUT], timeout=1), 1)
+        self.assertEqual(p.buffer, p.before)
+        self.assertEqual(p.before, 'partial\r\n')
+        p.close(force=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
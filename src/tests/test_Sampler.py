@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from time import sleep
+
+import numpy as np
+
+from otto.lib.compute import percentile
+from otto.lib.sampler import ApplianceSampler, Ring
+
+
+class FakeSrx(object):
+    shelf = 43
+
+    def __init__(self):
+        self.n = 0
+
+    @property
+    def iostats(self):
+        self.n += 1
+        d = {'10': {'id': '10', 'kind': 'lun',
+                    'read': {'MB': str(self.n), 'avg': '2', 'max': '15'},
+                    'write': {'MB': '0.000', 'avg': '0', 'max': '0'}}}
+        if self.n > 2:
+            d['11'] = d['10']
+        return d
+
+    @property
+    def sysstat(self):
+        return {'0': {'cpu': '0', 'idle%': '99', 'int%': '1'}}
+
+
+class TestSampler(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_ring(self):
+        r = Ring(3, 2)
+        for i in range(5):
+            r.append([i, -i])
+        self.assertEqual(r.rows(), [(2, -2), (3, -3), (4, -4)])
+        self.assertEqual(r.column(0), [2, 3, 4])
+
+    def test_percentile(self):
+        vals = [5.0, 1.0, 3.0, 2.0, 4.0, 10.0]
+        for p in (0, 25, 50, 99, 100):
+            self.assertAlmostEqual(percentile(vals, p), np.percentile(vals, p))
+
+    def test_samples(self):
+        s = ApplianceSampler(FakeSrx(), capacity=4)
+        for _ in range(6):
+            s.sample()
+        self.assertEqual(s.values(('iostats', '10'), 'read_MB'), [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(s.values(('iostats', '11'), 'read_MB'), [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(s.rate(('iostats', '10')), 4.5)
+        self.assertEqual(s.percentiles(('sysstat', '0'), 'idle', (50,)), {50: 99.0})
+        self.assertEqual(s.overhead()['samples'], 4)
+
+    def test_memory_cap(self):
+        s = ApplianceSampler(FakeSrx(), capacity=10, max_bytes=10 * 8 * (3 + 6 + 2))
+        for _ in range(4):
+            s.sample()
+        self.assertIn(('iostats', '11'), s.dropped)
+        self.assertLessEqual(s.nbytes, s.max_bytes)
+
+    def test_thread_and_export(self):
+        s = ApplianceSampler(FakeSrx(), interval=0.01)
+        s.start()
+        sleep(0.2)
+        s.stop()
+        self.assertFalse(s.is_alive())
+        self.assertGreater(s.overhead()['samples'], 2)
+        self.assertIn('jitter', s.overhead())
+
+        fname = os.path.join(self.dir, 'samples.csv')
+        s.export_csv(fname)
+        with open(fname) as f:
+            self.assertTrue(f.readline().startswith('time,iostats:10:read_MB'))
+        fname = os.path.join(self.dir, 'samples.npz')
+        s.export_npz(fname)
+        self.assertEqual(len(np.load(fname)['time']), s.overhead()['samples'])
+
+
+if __name__ == '__main__':
+    unittest.main()
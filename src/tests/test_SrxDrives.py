@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+tests for the per-slot and batched Srx drive inventory
+"""
+import re
+import unittest
+
+from otto.appliances.srx import Srx
+from otto.lib.otypes import ReturnCode
+
+DRIVES = '\r\n'.join(['DRIVE  STATE',
+                      '43.0   up',
+                      '43.1   missing',
+                      '43.2   up',
+                      '43.3   up'])
+
+DRIVES_A = {'43.0': ['DRIVE SIZE ROLE MODEL FIRMWARE MODE',
+                     '43.0 500.108 1.0.0 ST9500530NS SN04 sata 3.0Gb/s',
+                     "SN: '9SP2K7M3'",
+                     'geometry: 976773168 512'],
+            '43.2': ['DRIVE SIZE ROLE MODEL FIRMWARE MODE',
+                     '43.2 500.108 spare ST9500530NS SN04 sata 3.0Gb/s',
+                     "SN: '9SP2K7M4'",
+                     'geometry: 976773168 512'],
+            '43.3': ['DRIVE SIZE ROLE MODEL FIRMWARE MODE',
+                     '43.3 2000.399 1.0.1 WD2003FYYS 01.01D02 sata 3.0Gb/s',
+                     "SN: 'WD-WMAY01234567'",
+                     'geometry: 3907029168 512']}
+
+DRIVES_C = {'43.0': ['DRIVE VERSION CONFIG',
+                     '43.0 1 1.0.0 raid5'],
+            '43.2': ['DRIVE VERSION CONFIG',
+                     '43.2'],
+            '43.3': ['DRIVE VERSION CONFIG',
+                     '43.3 1 1.0.1 raid5']}
+
+
+class FakeSrx(Srx):
+    """
+    An Srx that answers from canned output and counts console commands.
+    """
+
+    def __init__(self, **kwargs):
+        super(FakeSrx, self).__init__(43, 'eth0', version=7, **kwargs)
+        self.commands = list()
+        self.lost = set()  # slots whose drives -a output the batched loop leaves out
+        self.c_lines = None  # lines of drives -c output kept
+
+    def run_and_check(self, cmd, expectation=True, force=False, timeout=10):
+        self.commands.append(cmd)
+        if cmd == 'drives':
+            return ReturnCode(True, DRIVES)
+        m = re.match(r'drives -(a|c) (\S+)$', cmd)
+        if m:
+            table = DRIVES_A if m.group(1) == 'a' else DRIVES_C
+            return ReturnCode(True, '\r\n'.join(table[m.group(2)]))
+        m = re.match(r'for\(d in ([^)]+)\)\{echo (\S+ a) \$d; drives -a \$d; echo (\S+ c) \$d; drives -c \$d\}$', cmd)
+        if m:
+            lines = list()
+            for d in m.group(1).split():
+                if d not in self.lost:
+                    lines.append('%s %s' % (m.group(2), d))
+                    lines.extend(DRIVES_A[d])
+                lines.append('%s %s' % (m.group(3), d))
+                lines.extend(DRIVES_C[d][:self.c_lines])
+            return ReturnCode(True, '\r\n'.join(lines))
+        raise AssertionError("unexpected command: %s" % cmd)
+
+    def expert_run(self, cmd, expectation=True, timeout=10):
+        return self.run_and_check(cmd, expectation, timeout=timeout)
+
+
+class TestSrxDrives(unittest.TestCase):
+    def test_batched_matches_per_slot(self):
+        serial = FakeSrx()
+        batched = FakeSrx(batch_inventory=True)
+        self.assertEqual(serial.drives, batched.drives)
+        self.assertEqual(len(serial.commands), 7)
+        self.assertEqual(len(batched.commands), 2)
+        self.assertEqual(batched.drives.keys(), ['0', '2', '3'])
+
+    def test_batched_shape(self):
+        d = FakeSrx(batch_inventory=True).drives
+        self.assertEqual(d['0']['SN'], '9SP2K7M3')
+        self.assertEqual(d['0']['role'], '1.0.0')
+        self.assertEqual(d['0']['version'], '1')
+        self.assertEqual(d['0']['config'], '1.0.0 raid5')
+        self.assertEqual(d['2']['version'], None)
+        self.assertEqual(d['3']['geometry'], '3907029168 512')
+
+    def test_use_slots(self):
+        serial = FakeSrx()
+        batched = FakeSrx(batch_inventory=True)
+        serial.use_slots = batched.use_slots = ['2', '3']
+        self.assertEqual(serial.drives, batched.drives)
+        self.assertEqual(batched.drives.keys(), ['2', '3'])
+
+    def test_batched_missing_sections(self):
+        sr = FakeSrx(batch_inventory=True)
+        sr.lost.add('43.2')
+        sr.c_lines = 1
+        d = sr.drives
+        self.assertEqual(d.keys(), ['0', '3'])
+        self.assertEqual((d['0']['version'], d['0']['config']), (None, None))
+        self.assertEqual(d['3']['SN'], 'WD-WMAY01234567')
+
+
+if __name__ == '__main__':
+    unittest.main()
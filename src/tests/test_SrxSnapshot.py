@@ -0,0 +1,128 @@
+import unittest
+
+from otto.appliances.srx import Srx
+from otto.lib.otypes import ReturnCode
+from otto.lib.srx import is_inited, is_recovering
+
+LUNS = ['LUN  LABEL               STATUS   TYPE    SIZE      STATE',
+        '1    data                online   raid1   500.108   %s',
+        '     500.108  1.0.0  43.0  normal',
+        '     500.108  1.0.1  43.1  %s']
+
+DRIVES = ['DRIVE  STATE', '43.0 up', '43.1 up', '43.2 up', '43.3 up']
+WHEN = ['LUN   PERCENT   RATE   TIME', '1   44.06   83542.02   0:03:15']
+SPARES = ['DRIVE  SIZE', '43.2  500.108']
+FCSTAT = ['DRIVE  SIZE', '43.3  100.030']
+MASK = ['LUN  MASK', '1  00100401']
+
+LIST_6 = ["1  500.108  online  'data'",
+          '1.0  500.108  raid1  %s',
+          '1.0.0  normal  500.108  43.0',
+          '1.0.1  %s  500.108  43.1']
+WHEN_6 = ['1.0  44.06%  83542.02  KBps  0:03:15  left']
+CMLIST_6 = ['LUN   SERIAL', '1     7FED1FC0-01-4FC0355F']
+FCSTAT_6 = ['1: enabled']
+
+
+class FakeSrx(Srx):
+    def __init__(self):
+        super(FakeSrx, self).__init__(43, 'eth0', version=7)
+        self.state = 'initing'
+        self.comp = 'normal'
+        self.spare_lines = SPARES
+        self.calls = 0
+
+    def run_many(self, cmds, expectation=True, timeout=10):
+        self.calls += 1
+        out = {'luns -a': '\r\n'.join(LUNS) % (self.state, self.comp),
+               'drives': '\r\n'.join(DRIVES),
+               'spares': '\r\n'.join(self.spare_lines),
+               'when': '\r\n'.join(WHEN),
+               'fcstat': '\r\n'.join(FCSTAT),
+               'mask': '\r\n'.join(MASK)}
+        return [ReturnCode(True, out[c]) for c in cmds]
+
+
+class FakeSrx6(Srx):
+    def __init__(self):
+        super(FakeSrx6, self).__init__(43, 'eth0', version=6)
+        self.raid = 'degraded'
+        self.comp = 'failed'
+        self.cmds = list()
+
+    def run(self, cmd, timeout=10):
+        self.cmds.append(cmd)
+        out = {'list -l': '\r\n'.join(LIST_6) % (self.raid, self.comp),
+               'drives': '\r\n'.join(DRIVES),
+               'spare': '\r\n'.join(SPARES),
+               'when': '\r\n'.join(WHEN_6),
+               'cmlist': '\r\n'.join(CMLIST_6),
+               'fcstat': '\r\n'.join(FCSTAT_6),
+               'mask': '\r\n'.join(MASK)}
+        return out[cmd]
+
+
+class TestSrxSnapshot(unittest.TestCase):
+    def test_snapshot(self):
+        sr = FakeSrx()
+        snap = sr.snapshot()
+        self.assertEqual(sr.calls, 1)
+        self.assertEqual(snap.luns['1']['state'], 'initing')
+        self.assertEqual(snap.mask, {'1': ['00100401']})
+        self.assertEqual(snap.roles, {'43.0': '1.0.0', '43.1': '1.0.1', '43.2': 'spare', '43.3': 'cache'})
+        self.assertRaises(AttributeError, setattr, snap, 'luns', {})
+        self.assertIsNone(snap.cmlist)
+        self.assertEqual(snap.drives['43.3'], 'up')
+
+    def test_lun_without_status(self):
+        sr = FakeSrx()
+        before = sr.snapshot()
+        after = sr.snapshot()
+        del after.luns['1']['status'], after.luns['1']['online']
+        self.assertEqual(after.diff(before)['lun_status'], {'1': ('online', None)})
+
+    def test_diff(self):
+        sr = FakeSrx()
+        before = sr.snapshot()
+        self.assertEqual(sr.snapshot().diff(before), {})
+        sr.state = 'degraded,recovering'
+        sr.comp = 'failed'
+        sr.spare_lines = SPARES[:1]
+        after = sr.snapshot()
+        diff = after.diff(before)
+        self.assertEqual(diff['lun_state'], {'1': ('initing', 'degraded,recovering')})
+        self.assertEqual(diff['roles'], {'43.2': ('spare', '')})
+        self.assertEqual(diff['spares'].keys(), ['43.2'])
+        self.assertNotIn('mask', diff)
+
+    def test_diff_6(self):
+        sr = FakeSrx6()
+        before = sr.snapshot()
+        self.assertEqual(sorted(sr.cmds), ['cmlist', 'drives', 'fcstat', 'list -l', 'mask', 'spare', 'when'])
+        self.assertEqual(before.cmlist, {'1': '7FED1FC0-01-4FC0355F'})
+        self.assertEqual(before.roles['43.1'], '1.0.1')
+        self.assertEqual(sr.snapshot().diff(before), {})
+        sr.raid = 'recovering'
+        sr.comp = 'replacing'
+        diff = sr.snapshot().diff(before)
+        self.assertEqual(diff, {'raid_state': {'1.0': ('degraded', 'recovering')},
+                                'element_state': {'1.0.1': ('failed', 'replacing')}})
+
+    def test_element_state(self):
+        sr = FakeSrx()
+        sr.state = 'degraded'
+        before = sr.snapshot()
+        sr.comp = 'failed'
+        diff = sr.snapshot().diff(before)
+        self.assertEqual(diff, {'element_state': {'1.0.1': ('normal', 'failed')}})
+
+    def test_lib_uses_snapshot(self):
+        sr = FakeSrx()
+        snap = sr.snapshot()
+        self.assertEqual(is_inited(sr, '1', snap=snap).message, 195)
+        self.assertFalse(is_recovering(sr, '1', snap=snap))
+        self.assertEqual(sr.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import socket
+import threading
+import unittest
+from time import time
+
+from otto.connections.pool import ConnectionPool, pool
+from otto.connections.ssh import Client
+from tests.sshstub import SshStub
+
+
+class TestPool(unittest.TestCase):
+    def setUp(self):
+        self.server = SshStub().start()
+        self.pool = ConnectionPool(idle=60)
+
+    def tearDown(self):
+        self.pool.close_all()
+        pool.close_all()
+        self.server.stop()
+
+    def acquire(self):
+        return self.pool.acquire('127.0.0.1', self.server.port, 'root', 'x')
+
+    def test_shared(self):
+        t1 = self.acquire()
+        t2 = self.acquire()
+        self.assertIs(t1, t2)
+        self.assertEqual(self.pool.stats['opened'], 1)
+        self.assertEqual(self.pool.stats['reused'], 1)
+        self.pool.release(t1)
+        self.assertEqual(self.pool.evict_idle(0), 0)  # still held
+        self.pool.release(t2)
+        self.assertEqual(self.pool.evict_idle(0), 1)
+        self.assertFalse(t1.is_active())
+        self.assertEqual(len(self.pool), 0)
+
+    def test_dead(self):
+        t1 = self.acquire()
+        t1.close()
+        t2 = self.acquire()
+        self.assertIsNot(t1, t2)
+        self.assertTrue(t2.is_active())
+        self.assertEqual(self.pool.stats['opened'], 2)
+
+    def test_threads(self):
+        transports = list()
+
+        def work():
+            transports.append(self.acquire())
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(transports)), 1)
+        self.assertEqual(self.pool.stats['opened'], 1)
+
+    def test_slow_host(self):
+        # a host that takes the TCP connection and never says hello
+        silent = socket.socket()
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(8)
+        errors = list()
+
+        def slow():
+            try:
+                self.pool.acquire('127.0.0.1', silent.getsockname()[1], 'root', 'x', timeout=3)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=slow) for _ in range(2)]
+        for t in threads:
+            t.start()
+        try:
+            start = time()
+            self.acquire()
+            self.assertLess(time() - start, 1.5)
+        finally:
+            silent.close()
+            for t in threads:
+                t.join(30)
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])  # one connect, both waiting on it
+        self.assertEqual(self.pool._pending, {})
+        self.assertEqual(self.pool.stats['opened'], 1)
+
+    def test_clients(self):
+        a = Client('127.0.0.1', 'root', 'x', port=self.server.port, pooled=True)
+        b = Client('127.0.0.1', 'root', 'x', port=self.server.port, pooled=True)
+        self.assertTrue(a.connect())
+        self.assertTrue(b.connect())
+        self.assertIs(a.get_transport(), b.get_transport())
+        transport = a.get_transport()
+        self.assertEqual(a.run('echo a').message, 'a\n')
+        self.assertEqual(b.ls('/'), a.ls('/'))
+        a.disconnect()
+        self.assertIsNone(a.get_transport())
+        self.assertTrue(transport.is_active())
+        self.assertEqual(b.run('echo b').message, 'b\n')
+        b.disconnect()
+        self.assertEqual(pool.evict_idle(0), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
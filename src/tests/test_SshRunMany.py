@@ -0,0 +1,50 @@
+import unittest
+from time import time
+
+from otto.connections.ssh import Client
+from tests.sshstub import SshStub
+
+
+class TestRunMany(unittest.TestCase):
+    def setUp(self):
+        self.server = SshStub(delay=0.05).start()
+        self.client = Client('127.0.0.1', 'root', 'x', port=self.server.port)
+        self.assertTrue(self.client.connect())
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.server.stop()
+
+    def test_ordered(self):
+        cmds = ['echo %d' % i for i in range(20)] + ['echo oops >&2; exit 3']
+        rets = self.client.run_many(cmds, max_parallel=8)
+        self.assertEqual([r.message for r in rets[:20]], ['%d\n' % i for i in range(20)])
+        self.assertFalse(rets[20])
+        self.assertEqual(rets[20].message, 'oops\n')
+        self.assertEqual(rets[20].raw.status, 3)
+
+    def test_parallel(self):
+        start = time()
+        rets = self.client.run_many(['true'] * 16, max_parallel=8)
+        self.assertTrue(all(rets))
+        # two rounds of 0.05s, not sixteen
+        self.assertLess(time() - start, 16 * 0.05)
+
+    def test_large_output(self):
+        rets = self.client.run_many(['head -c 1000000 /dev/zero', 'head -c 300000 /dev/zero >&2'])
+        self.assertEqual(len(rets[0].raw.stdout), 1000000)
+        self.assertEqual(len(rets[1].raw.stderr), 300000)
+
+    def test_timeout(self):
+        rets = self.client.run_many(['sleep 5', 'echo fast'], timeout=1)
+        self.assertFalse(rets[0])
+        self.assertEqual(rets[0].message, 'Timeout')
+        self.assertEqual(rets[1].message, 'fast\n')
+
+    def test_cwd(self):
+        self.client.cwd = '/tmp'
+        self.assertEqual(self.client.run_many(['pwd'])[0].message, '/tmp\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
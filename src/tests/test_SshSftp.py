@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from otto.connections.ssh import Client
+from tests.sshstub import SshStub
+
+
+class TestSftpSession(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = SshStub().start()
+        self.client = Client('127.0.0.1', 'root', 'x', port=self.server.port)
+        self.assertTrue(self.client.connect())
+        self.client.cwd = self.dir + '/'
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def test_reuse(self):
+        self.client.mkdir('d')
+        with self.client.open(os.path.join(self.dir, 'd', 'f'), 'w') as f:
+            f.write('data')
+        self.assertEqual(self.client.ls('d'), ['f'])
+        self.assertEqual(self.client.stat(os.path.join(self.dir, 'd', 'f')).size, 4)
+        self.client.rm('d/f')
+        self.client.rmdir('d')
+        self.assertEqual(self.client.ls(), [])
+        self.assertEqual(self.client.sftp_stats, {'opened': 1, 'reused': 6})
+
+    def test_reconnect(self):
+        self.client.ls()
+        self.assertTrue(self.client.reconnect(after=0))
+        self.client.ls()
+        self.assertEqual(self.client.sftp_stats['opened'], 2)
+
+    def test_disconnect(self):
+        sftp = self.client.sftp
+        self.client.disconnect()
+        self.assertTrue(sftp.get_channel().closed)
+        self.assertIsNone(self.client._sftp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import socket
+import unittest
+
+from otto.connections.ssh import Client
+from tests.sshstub import SshStub
+
+
+class TestRunStream(unittest.TestCase):
+    def setUp(self):
+        self.server = SshStub().start()
+        self.client = Client('127.0.0.1', 'root', 'x', port=self.server.port)
+        self.assertTrue(self.client.connect())
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.server.stop()
+
+    def test_lines(self):
+        stream = self.client.run_stream("printf 'a\\nbb\\n'; echo warn >&2; printf 'c'; exit 2")
+        self.assertEqual(list(stream), ['a\n', 'bb\n', 'c'])
+        self.assertEqual(stream.status, 2)
+        self.assertEqual(stream.stderr, 'warn\n')
+
+    def test_chunks(self):
+        stream = self.client.run_stream('head -c 3000000 /dev/zero', lines=False, chunk=4096)
+        total = 0
+        for data in stream:
+            self.assertLessEqual(len(data), 4096)
+            total += len(data)
+        self.assertEqual(total, 3000000)
+        self.assertEqual(stream.status, 0)
+
+    def test_no_stall(self):
+        # stdout well past the channel window before stderr is closed
+        ret = self.client.run('head -c 5000000 /dev/zero; echo done >&2', timeout=20)
+        self.assertTrue(ret)
+        self.assertEqual(len(ret.message), 5000000)
+        self.assertEqual(ret.raw.stderr, 'done\n')
+
+    def test_run(self):
+        ret = self.client.run('echo out; echo err >&2; exit 1')
+        self.assertFalse(ret)
+        self.assertEqual(ret.message, 'err\n')
+        self.assertEqual(ret.raw, (1, 'out\n', 'err\n'))
+
+    def test_timeout(self):
+        stream = self.client.run_stream('sleep 5', timeout=0.5)
+        self.assertRaises(socket.timeout, list, stream)
+        self.assertEqual(self.client.run('sleep 5', timeout=0.5).message, 'Timeout')
+
+
+if __name__ == '__main__':
+    unittest.main()
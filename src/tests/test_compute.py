@@ -3,7 +3,9 @@ import random
 
 import numpy as np
 
-from otto.lib.compute import average, median, standard_dev, variance
+from otto.lib import compute
+from otto.lib.compute import (P2Quantile, Welford, average, confidence_interval, median, percentile, percentiles,
+                              standard_dev, t_quantile, trimmed_mean, variance)
 
 
 class TestCompute(unittest.TestCase):
@@ -33,5 +35,94 @@ class TestCompute(unittest.TestCase):
         self.assertAlmostEqual(average(self.s), np.average(self.s), 6)
 
 
+class TestComputeExtra(unittest.TestCase):
+    numpy = compute.numpy
+
+    def setUp(self):
+        self.saved = compute.numpy
+        compute.numpy = self.numpy
+        rng = random.Random(3)
+        self.s = [rng.expovariate(0.01) for _ in range(1001)]
+
+    def tearDown(self):
+        compute.numpy = self.saved
+
+    def test_unchanged(self):
+        s = list(self.s)
+        median(s)
+        trimmed_mean(s, 0.2)
+        percentiles(s, (1, 99))
+        self.assertEqual(s, self.s)
+
+    def test_same_as_numpy(self):
+        self.assertAlmostEqual(median(self.s), np.median(self.s), 9)
+        self.assertAlmostEqual(median([3, 1, 2, 4]), 2.5)
+        self.assertIs(type(median([3, 1, 2])), int)
+        self.assertEqual(median([3, 1, 2]), 2)
+        self.assertAlmostEqual(variance(self.s), np.var(self.s), 6)
+        for got, want in zip(percentiles(self.s, (0, 5, 50, 99.9, 100)), np.percentile(self.s, (0, 5, 50, 99.9, 100))):
+            self.assertAlmostEqual(got, want, 9)
+        self.assertRaises(ZeroDivisionError, average, [])
+        self.assertRaises(ValueError, percentiles, [], (50,))
+
+    def test_trimmed_mean(self):
+        s = sorted(self.s)
+        self.assertAlmostEqual(trimmed_mean(self.s, 0.1), np.mean(s[100:-100]), 9)
+        self.assertAlmostEqual(trimmed_mean([1, 2, 3, 1000], 0.25), 2.5)
+        self.assertRaises(ValueError, trimmed_mean, [1, 2], 0.5)
+
+    def test_confidence_interval(self):
+        self.assertAlmostEqual(t_quantile(0.975, 9), 2.2621571628, 8)
+        self.assertAlmostEqual(t_quantile(0.995, 1), 63.6567411629, 6)
+        self.assertAlmostEqual(t_quantile(0.05, 30), -1.6972608866, 8)
+        low, high = confidence_interval([10, 12, 11, 13, 9, 10, 12, 11, 10, 12])
+        self.assertAlmostEqual(low, 10.1078, 4)
+        self.assertAlmostEqual(high, 11.8922, 4)
+
+    def test_welford(self):
+        w = Welford()
+        for x in self.s[:500]:
+            w.add(x)
+        w.update(self.s[500:])
+        self.assertEqual(w.count, len(self.s))
+        self.assertAlmostEqual(w.mean, np.mean(self.s), 9)
+        self.assertAlmostEqual(w.variance, np.var(self.s), 6)
+        self.assertAlmostEqual(w.sample_variance, np.var(self.s, ddof=1), 6)
+        self.assertEqual((w.min, w.max), (min(self.s), max(self.s)))
+        other = Welford()
+        other.update([1e9] * 3)
+        w.merge(other)
+        self.assertAlmostEqual(w.mean, np.mean(self.s + [1e9] * 3), 6)
+
+    def test_iterables(self):
+        w = Welford()
+        w.update(x for x in self.s)
+        self.assertEqual(w.count, len(self.s))
+        self.assertAlmostEqual(w.mean, np.mean(self.s), 9)
+        w.update(iter([]))
+        self.assertEqual(w.count, len(self.s))
+        self.assertEqual(percentiles((x for x in self.s), (5, 50)), percentiles(self.s, (5, 50)))
+        self.assertEqual(percentile(iter(self.s), 90), percentile(self.s, 90))
+        self.assertEqual(trimmed_mean(iter(self.s)), trimmed_mean(self.s))
+        self.assertRaises(ValueError, percentiles, iter([]), (50,))
+
+    def test_p2(self):
+        rng = random.Random(5)
+        s = [rng.expovariate(0.01) for _ in range(100000)]
+        for pct in (50, 99):
+            p2 = P2Quantile(pct)
+            p2.update(s)
+            want = np.percentile(s, pct)
+            self.assertLess(abs(p2.value - want) / want, 0.02)
+        p2 = P2Quantile(50)
+        self.assertIsNone(p2.value)
+        p2.update([5, 1, 3])
+        self.assertEqual(p2.value, 3)
+
+
+class TestComputePython(TestComputeExtra):
+    numpy = None
+
+
 if __name__ == '__main__':
     unittest.main()